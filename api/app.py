@@ -2,7 +2,14 @@ import os
 import sys
 sys.path.insert(0, os.path.dirname(__file__))
 
-from src.main import app
+from src.main import create_app, init_database
+
+app = create_app()
+
+# Plataformas sem etapa de release (ex.: Hostinger) podem inicializar o banco aqui
+# (não nos processos do pool de hash de senhas, que reimportam este módulo como __mp_main__)
+if os.environ.get('INIT_DB_ON_START', '').lower() in ('1', 'true') and __name__ != '__mp_main__':
+    init_database(app)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,73 @@
+"""
+Mede o tempo de partida a frio da API.
+
+Cada rodada é um processo Python novo que importa src.main, cria a
+aplicação com create_app() e atende a primeira requisição. O banco é
+uma cópia temporária já inicializada, para medir apenas a partida.
+
+Uso: python benchmarks/cold_start.py [--runs 10] [--path /api/contracts]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PREPARE = """
+import sys
+from src.main import create_app, init_database
+init_database(create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]}))
+"""
+
+MEASURE = """
+import json, sys, time
+started = time.perf_counter()
+from src.main import create_app
+imported = time.perf_counter()
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+created = time.perf_counter()
+response = app.test_client().get(sys.argv[2])
+finished = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': finished - created,
+    'total': finished - started
+}))
+"""
+
+
+def run(code, *args):
+    result = subprocess.run(
+        [sys.executable, '-c', code, *args],
+        cwd=API_DIR, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/contracts')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uri = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        run(PREPARE, uri)
+
+        samples = [json.loads(run(MEASURE, uri, args.path)) for _ in range(args.runs)]
+
+    print(f'{args.runs} partidas a frio, primeira requisição GET {args.path}')
+    for phase in ('import', 'create_app', 'first_request', 'total'):
+        values = sorted(sample[phase] * 1000 for sample in samples)
+        print(f'  {phase:<14} mediana {statistics.median(values):8.1f} ms   '
+              f'máx {values[-1]:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
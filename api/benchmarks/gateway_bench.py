@@ -0,0 +1,99 @@
+"""
+Mede o cliente HTTP do gateway de pagamento contra o stub local.
+
+Compara a vazão do HttpGateway (sessão compartilhada, conexões
+reaproveitadas) com uma sessão nova por cobrança, e mostra a latência
+com o PSP fora do ar antes e depois de o circuit breaker abrir.
+
+Uso: python benchmarks/gateway_bench.py [--calls 500] [--threads 8] [--latency 0.005]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.services.gateway import CircuitBreaker, GatewayError, HttpGateway  # noqa: E402
+from stub_gateway import start_in_thread  # noqa: E402
+
+
+def charge_pooled(client):
+    def call():
+        return client.charge_pix(29.90, 'pix@contestare.com.br', uuid.uuid4().hex)
+    return call
+
+
+def charge_unpooled(url):
+    def call():
+        with requests.Session() as s:
+            response = s.post(url + '/pix', json={'amount': 29.90},
+                              headers={'Idempotency-Key': uuid.uuid4().hex}, timeout=(3, 10))
+            return response.json()
+    return call
+
+
+def throughput(call, calls, threads):
+    latencies = []
+
+    def timed(_):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(timed, range(calls)))
+    elapsed = time.perf_counter() - started
+    return calls / elapsed, statistics.median(latencies) * 1000
+
+
+def outage(url, server, calls):
+    """Latência por cobrança com o PSP fora: com tentativas e depois com o circuito aberto"""
+    client = HttpGateway(url, max_retries=2, backoff=0.05,
+                         breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+    server.down = True
+    rows = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        try:
+            client.charge_pix(29.90, 'pix@contestare.com.br', uuid.uuid4().hex)
+        except GatewayError:
+            pass
+        rows.append((client.breaker.state, (time.perf_counter() - started) * 1000))
+    server.down = False
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.005)
+    args = parser.parse_args()
+
+    server, url = start_in_thread(latency=args.latency)
+    pooled = HttpGateway(url, pool_size=args.threads)
+
+    print(f'{args.calls} cobranças, {args.threads} threads, latência do stub {args.latency * 1000:.0f} ms')
+    for name, call in (('sessão nova por cobrança', charge_unpooled(url)),
+                       ('HttpGateway (pool)', charge_pooled(pooled))):
+        rate, median = throughput(call, args.calls, args.threads)
+        print(f'  {name:26} {rate:8.1f} req/s   mediana {median:6.1f} ms')
+
+    print('PSP fora do ar (limite 3 falhas):')
+    for i, (state, ms) in enumerate(outage(url, server, 6), start=1):
+        print(f'  cobrança {i}: {ms:7.1f} ms  circuito {state}')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
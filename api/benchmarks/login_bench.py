@@ -0,0 +1,141 @@
+"""
+Mede a latência de /api/auth/login sob carga concorrente.
+
+Vários clientes fazem login ao mesmo tempo enquanto um sonda consulta
+GET /api/pricing, para ver o efeito da rajada nos outros endpoints.
+Roda duas vezes: com o hash no thread da requisição
+(PASSWORD_HASH_WORKERS=0, sem limite de fila) e com o pool de processos
+limitado. Mostra p50/p99 dos logins, quantos foram recusados com 503 e
+p50/p99 da sonda.
+
+Uso: python benchmarks/login_bench.py [--clients 16] [--logins 10] [--workers 2] [--queue 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+from src.main import create_app, init_database  # noqa: E402
+from src.models.user import User, db  # noqa: E402
+from src.services.passwords import passwords  # noqa: E402
+
+USERS = 50
+PASSWORD = 'senha-de-teste'
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] * 1000
+
+
+def seed(method):
+    pwhash = generate_password_hash(PASSWORD, method)
+    now = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'login{i}', 'email': f'login{i}@exemplo.com', 'password_hash': pwhash,
+         'is_active': True, 'is_premium': False, 'created_at': now, 'updated_at': now}
+        for i in range(USERS)
+    ])
+    db.session.commit()
+
+
+def run(database_uri, workers, queue_limit, clients, logins):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'PASSWORD_HASH_WORKERS': workers,
+        'PASSWORD_HASH_QUEUE': queue_limit,
+        'JOBS_WORKERS': 0,
+        'DEADLINE_SCHEDULER': False,
+        'SUBSCRIPTION_SWEEPER': False
+    })
+    # Aquecimento: sobe o pool antes de medir
+    app.test_client().post('/api/auth/login', json={'username': 'login0', 'password': PASSWORD})
+
+    login_times, statuses, probe_times = [], [], []
+    done = threading.Event()
+
+    def client(number):
+        http = app.test_client()
+        for i in range(logins):
+            started = time.perf_counter()
+            response = http.post('/api/auth/login', json={
+                'username': f'login{(number * logins + i) % USERS}', 'password': PASSWORD
+            })
+            login_times.append(time.perf_counter() - started)
+            statuses.append(response.status_code)
+
+    def probe():
+        http = app.test_client()
+        while not done.is_set():
+            started = time.perf_counter()
+            http.get('/api/pricing')
+            probe_times.append(time.perf_counter() - started)
+            time.sleep(0.005)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    prober.join()
+    passwords.shutdown()
+
+    ok = [t for t, s in zip(login_times, statuses) if s == 200]
+    return {
+        'ok': len(ok),
+        'busy': statuses.count(503),
+        'other': len(statuses) - len(ok) - statuses.count(503),
+        'login_p50': percentile(ok, 0.5),
+        'login_p99': percentile(ok, 0.99),
+        'busy_p99': percentile([t for t, s in zip(login_times, statuses) if s == 503], 0.99),
+        'probe_p50': percentile(probe_times, 0.5),
+        'probe_p99': percentile(probe_times, 0.99),
+        'rate': len(ok) / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue', type=int, default=4)
+    parser.add_argument('--method', default='pbkdf2:sha256:600000')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = f"sqlite:///{os.path.join(tmp, 'app.db')}"
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri, 'PASSWORD_HASH_METHOD': args.method})
+        init_database(app)
+        with app.app_context():
+            seed(args.method)
+
+        print(f'{args.clients} clientes x {args.logins} logins, {args.method}, {os.cpu_count()} CPU(s)')
+        for name, workers, queue_limit in (
+            ('no thread da requisição', 0, args.clients * args.logins),
+            (f'pool {args.workers} proc., fila {args.queue}', args.workers, args.queue)
+        ):
+            r = run(database_uri, workers, queue_limit, args.clients, args.logins)
+            print(f'  {name}')
+            print(f"    login 200: {r['ok']:4d}  p50 {r['login_p50']:7.0f} ms  p99 {r['login_p99']:7.0f} ms"
+                  f"  ({r['rate']:.1f}/s)")
+            print(f"    login 503: {r['busy']:4d}  p99 {r['busy_p99']:7.1f} ms   outros: {r['other']}")
+            print(f"    sonda GET /api/pricing  p50 {r['probe_p50']:7.1f} ms  p99 {r['probe_p99']:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Reproduz uma rajada de confirmações PIX no webhook.
+
+Cria um banco temporário com pagamentos PIX pendentes (parte deles de
+plano premium), envia as confirmações em lotes assinados para
+POST /api/payment/pix/webhook e mede o tempo para aceitar a rajada e para
+a fila aplicá-la. Depois reenvia um lote para conferir que repetições
+são ignoradas.
+
+Uso: python benchmarks/pix_webhook_burst.py [--burst 50000] [--batch 500] [--group-size 500]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from src.main import create_app, init_database  # noqa: E402
+from src.models.payment import Payment, Subscription, db  # noqa: E402
+from src.models.user import User  # noqa: E402
+from src.services.pix_webhook import pix_webhook  # noqa: E402
+
+SECRET = 'burst-secret'
+USERS = 1000
+PREMIUM_EVERY = 10
+
+
+def seed(burst):
+    now = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'burst{i}', 'email': f'burst{i}@exemplo.com', 'password_hash': 'x',
+         'is_active': True, 'is_premium': False, 'created_at': now, 'updated_at': now}
+        for i in range(USERS)
+    ])
+    first_user = db.session.query(db.func.min(User.id)).filter(User.username == 'burst0').scalar()
+    db.session.execute(Payment.__table__.insert(), [
+        {'user_id': first_user + i % USERS, 'amount': 69.9 if i % PREMIUM_EVERY == 0 else 29.9,
+         'payment_method': 'pix', 'payment_status': 'pending',
+         'service_type': 'premium_plan' if i % PREMIUM_EVERY == 0 else 'infraction_contest',
+         'transaction_id': f'TXN_BURST_{i:06d}', 'created_at': now}
+        for i in range(burst)
+    ])
+    db.session.commit()
+
+
+def confirmation(i):
+    return {
+        'txid': f'TXN_BURST_{i:06d}',
+        'endToEndId': f'E2E{i:029d}',
+        'valor': '69.90' if i % PREMIUM_EVERY == 0 else '29.90',
+        'horario': datetime.utcnow().isoformat() + 'Z'
+    }
+
+
+def post(client, items):
+    body = json.dumps({'pix': items}).encode('utf-8')
+    signature = 'sha256=' + hmac.new(SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    response = client.post('/api/payment/pix/webhook', data=body, content_type='application/json',
+                           headers={'X-Webhook-Signature': signature})
+    assert response.status_code == 202, (response.status_code, response.get_json())
+    return response.get_json()['accepted']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--burst', type=int, default=50000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--group-size', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'app.db')}",
+            'CONTEST_DOCUMENTS_DIR': os.path.join(tmp, 'documents'),
+            'PIX_WEBHOOK_SECRET': SECRET,
+            'PIX_WEBHOOK_GROUP_SIZE': args.group_size,
+            'PIX_WEBHOOK_QUEUE_SIZE': args.burst * 2,
+            'JOBS_WORKERS': 0,
+            'DEADLINE_SCHEDULER': False,
+            'SUBSCRIPTION_SWEEPER': False
+        })
+        init_database(app)
+        with app.app_context():
+            seed(args.burst)
+        client = app.test_client()
+
+        started = time.perf_counter()
+        accepted = 0
+        for start in range(0, args.burst, args.batch):
+            accepted += post(client, [confirmation(i) for i in range(start, min(start + args.batch, args.burst))])
+        enqueued = time.perf_counter()
+        pix_webhook.join()
+        applied = time.perf_counter()
+
+        post(client, [confirmation(i) for i in range(min(args.batch, args.burst))])
+        pix_webhook.join()
+
+        with app.app_context():
+            approved = Payment.query.filter_by(payment_status='approved').count()
+            subscriptions = Subscription.query.count()
+            premium_users = User.query.filter_by(is_premium=True).count()
+
+        total = applied - started
+        print(f'{args.burst} confirmações em lotes de {args.batch}, grupos de até {args.group_size}')
+        print(f'  aceitas em        {enqueued - started:7.2f} s ({accepted / (enqueued - started):8.0f}/s)')
+        print(f'  aplicadas em      {total:7.2f} s ({args.burst / total:8.0f}/s)')
+        print(f'  aprovados {approved}, assinaturas {subscriptions}, usuários premium {premium_users}')
+        print(f'  estatísticas {dict(pix_webhook.stats)}')
+        assert approved == args.burst
+        assert subscriptions == len(range(0, args.burst, PREMIUM_EVERY))
+
+
+if __name__ == '__main__':
+    main()
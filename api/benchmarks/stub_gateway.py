@@ -0,0 +1,96 @@
+"""
+Gateway de pagamento de mentira, para testes e benchmarks offline.
+
+Atende POST /pix e POST /card com a mesma resposta do SimulatedGateway,
+com latência e taxa de falhas (503) configuráveis. Respostas são
+memorizadas por Idempotency-Key, como num PSP real.
+
+Uso: python benchmarks/stub_gateway.py [--port 8099] [--latency 0.02] [--failure-rate 0]
+Na API: PAYMENT_GATEWAY=http PAYMENT_GATEWAY_URL=http://127.0.0.1:8099
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        key = self.headers.get('Idempotency-Key')
+
+        with server.lock:
+            server.requests += 1
+            cached = server.responses.get(key)
+            unavailable = server.down or random.random() < server.failure_rate
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if cached is None and unavailable:
+            return self._send(503, {'error': 'unavailable'})
+
+        if cached is None:
+            payload = json.loads(body or b'{}')
+            prefix = 'PIX' if self.path == '/pix' else 'CARD'
+            cached = {
+                'status': 'approved',
+                'transaction_id': f'{prefix}_{uuid.uuid4().hex[:12].upper()}',
+                'message': 'Pagamento aprovado com sucesso',
+                'amount': payload.get('amount')
+            }
+            with server.lock:
+                server.responses[key] = cached
+        self._send(200, cached)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port=0, latency=0.0, failure_rate=0.0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubGatewayHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.down = False
+    server.requests = 0
+    server.responses = {}
+    server.lock = threading.Lock()
+    return server
+
+
+def start_in_thread(**options):
+    server = make_server(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency, args.failure_rate)
+    print(f'Gateway stub em http://127.0.0.1:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
-from src.main import app
-with app.app_context():
-    from src.models.user import db
-    db.create_all()
-    print('✅ Banco criado!')
+from src.main import create_app, init_database
+app = create_app()
+init_database(app)
+print('✅ Banco criado!')
@@ -9,33 +9,9 @@ if [ ! -d "/app/src/database" ]; then
     mkdir -p /app/src/database
 fi
 
-# Verificar/criar banco de dados
-if [ ! -f "/app/src/database/contestare.db" ]; then
-    echo "🗄️ Criando banco de dados..."
-    python -c "
-from src.main import app
-with app.app_context():
-    from src.models.user import db
-    db.create_all()
-    print('✅ Banco de dados criado com sucesso!')
-"
-else
-    echo "✅ Banco de dados já existe"
-fi
-
-# Verificar se banco está funcionando
-echo "🔍 Verificando integridade do banco..."
-python -c "
-from src.main import app
-with app.app_context():
-    from src.models.user import db
-    try:
-        db.engine.execute('SELECT 1')
-        print('✅ Banco de dados funcionando!')
-    except Exception as e:
-        print(f'❌ Erro no banco: {e}')
-        exit(1)
-"
+# Criar/atualizar esquema e catálogo (idempotente; não faz nada se já estiver em dia)
+echo "🗄️ Preparando banco de dados..."
+flask --app app.py init-db
 
 echo "🌟 Contestare Doc Express iniciado com sucesso!"
-exec "$@"
\ No newline at end of file
+exec "$@"
@@ -1,85 +1,191 @@
 import os
 import sys
+import time
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from dotenv import load_dotenv
 from src.models.user import db
-from src.models.infraction import Infraction
+from src.models.infraction import Infraction, InfractionSummary
 from src.models.contract import Contract, UserContract
-from src.models.payment import Payment, Subscription
+from src.models.payment import Payment, PaymentDailyRollup, Subscription
+from src.models.app_meta import AppMeta
+from src.models.job import Job
+from src.models.idempotency import IdempotencyRecord
+from src.models.migrations import run_migrations
+from src.services.pagination import InvalidCursor
+from src.services.popularity import popularity
+from src.services.jobs import job_queue
+from src.services.documents import document_store
+from src.services.analysis import engine as analysis_engine
+from src.services.query_plans import check_query_plans
+from src.services.deadlines import deadline_scheduler
+from src.services.gateway import gateway
+from src.services.entitlements import entitlements
+from src.services.pix_webhook import pix_webhook
+from src.services.passwords import passwords
+from src.services.subscriptions import subscription_sweeper
 
 # Importar blueprints
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.infraction import infraction_bp
-from src.routes.contract import contract_bp
+from src.routes.contract import contract_bp, seed_contracts
 from src.routes.payment import payment_bp
+from src.routes.job import job_bp
+from src.routes.deadline import deadline_bp
+from src.routes.vehicle import vehicle_bp
+from src.routes.report import report_bp
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'contestare_doc_express_secret_key_2024'
+DEFAULT_CONFIG = {
+    'SECRET_KEY': 'contestare_doc_express_secret_key_2024',
+    'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}",
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'JOBS_WORKERS': int(os.getenv('JOBS_WORKERS', 2)),
+    # Padrão: pasta documents ao lado do banco
+    'CONTEST_DOCUMENTS_DIR': os.getenv('CONTEST_DOCUMENTS_DIR'),
+    # Análise determinística com memo; ANALYSIS_MEMO_PATH persiste o memo entre reinícios
+    'ANALYSIS_DETERMINISTIC': os.getenv('ANALYSIS_DETERMINISTIC', '1').lower() in ('1', 'true'),
+    'ANALYSIS_MEMO_SIZE': int(os.getenv('ANALYSIS_MEMO_SIZE', 4096)),
+    'ANALYSIS_MEMO_PATH': os.getenv('ANALYSIS_MEMO_PATH'),
+    # Aviso de prazo de contestação: dias de antecedência
+    'DEADLINE_NOTICE_DAYS': int(os.getenv('DEADLINE_NOTICE_DAYS', 3)),
+    # Respostas gravadas por Idempotency-Key (segundos)
+    'IDEMPOTENCY_TTL': int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600)),
+    # Gateway de pagamento: 'simulated' ou 'http' (PAYMENT_GATEWAY_URL)
+    'PAYMENT_GATEWAY': os.getenv('PAYMENT_GATEWAY', 'simulated'),
+    'PAYMENT_GATEWAY_URL': os.getenv('PAYMENT_GATEWAY_URL'),
+    'PAYMENT_GATEWAY_API_KEY': os.getenv('PAYMENT_GATEWAY_API_KEY'),
+    # Varredura de assinaturas vencidas e renovações automáticas (segundos)
+    'SUBSCRIPTION_SWEEP_INTERVAL': int(os.getenv('SUBSCRIPTION_SWEEP_INTERVAL', 300)),
+    # Cache de direitos (premium) por usuário, entre requisições (segundos)
+    'ENTITLEMENT_CACHE_TTL': float(os.getenv('ENTITLEMENT_CACHE_TTL', 30)),
+    # Chave do financeiro para /api/reports (sem ela os relatórios ficam desabilitados)
+    'REPORTS_API_KEY': os.getenv('REPORTS_API_KEY'),
+    # Segredo do HMAC do webhook de confirmação PIX (sem ele o webhook fica desabilitado)
+    'PIX_WEBHOOK_SECRET': os.getenv('PIX_WEBHOOK_SECRET'),
+    # Hash de senhas: esquema/custo do Werkzeug e processos dedicados (0 = no thread da requisição)
+    'PASSWORD_HASH_METHOD': os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+    'PASSWORD_HASH_WORKERS': int(os.getenv('PASSWORD_HASH_WORKERS', min(os.cpu_count() or 1, 4))),
+}
 
-# Habilitar CORS para todas as rotas
-from dotenv import load_dotenv
-load_dotenv()  # ADICIONAR ESTA LINHA!
+def create_app(config=None):
+    """Cria a aplicação Flask
 
-import os
-print("=== DEBUG CORS ===")
-print(f"CORS_ORIGINS raw: {os.getenv('CORS_ORIGINS')}")
-cors_origins = os.getenv('CORS_ORIGINS', '').split(',')
-print(f"CORS Origins list: {cors_origins}")
-print("✅ USANDO CORS ESPECÍFICO COM CREDENTIALS")
-print("==================")
-
-# CORS específico para produção com credentials
-CORS(app, origins=cors_origins, supports_credentials=True)
-
-# Registrar blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(infraction_bp, url_prefix='/api')
-app.register_blueprint(contract_bp, url_prefix='/api')
-app.register_blueprint(payment_bp, url_prefix='/api')
-
-# Configuração do banco de dados
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-
-# Criar tabelas
-with app.app_context():
-    db.create_all()
-    # Inicializar contratos populares
-    from src.routes.contract import init_contracts, init_additional_contracts
-    init_contracts()
-    init_additional_contracts()
-
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Endpoint de verificação de saúde da API"""
-    return {
-        'status': 'healthy',
-        'service': 'Contestare Doc Express API',
-        'version': '1.0.0'
-    }
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+    Não acessa o banco de dados: criação de tabelas, migrações e carga do
+    catálogo ficam no comando `flask init-db` (ver init_database).
+    """
+    load_dotenv()
+
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+
+    # CORS específico para produção com credentials
+    cors_origins = os.getenv('CORS_ORIGINS', '').split(',')
+    CORS(app, origins=cors_origins, supports_credentials=True,
+         expose_headers=['ETag', 'X-Next-Cursor', 'Link', 'Location', 'Idempotent-Replayed'])
+
+    # Registrar blueprints
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(infraction_bp, url_prefix='/api')
+    app.register_blueprint(contract_bp, url_prefix='/api')
+    app.register_blueprint(payment_bp, url_prefix='/api')
+    app.register_blueprint(job_bp, url_prefix='/api')
+    app.register_blueprint(deadline_bp, url_prefix='/api')
+    app.register_blueprint(vehicle_bp, url_prefix='/api')
+    app.register_blueprint(report_bp, url_prefix='/api')
+
+    db.init_app(app)
+    popularity.init_app(app)
+    job_queue.init_app(app)
+    document_store.init_app(app)
+    analysis_engine.init_app(app)
+    deadline_scheduler.init_app(app)
+    gateway.init_app(app)
+    subscription_sweeper.init_app(app)
+    entitlements.init_app(app)
+    pix_webhook.init_app(app)
+    passwords.init_app(app)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Cria/atualiza o esquema do banco e carrega o catálogo de contratos"""
+        init_database(app)
+        print('✅ Banco de dados pronto!')
+
+    @app.cli.command('jobs-worker')
+    def jobs_worker_command():
+        """Processa a fila de tarefas em primeiro plano (para usar com JOBS_WORKERS=0 na web)"""
+        job_queue.workers = max(job_queue.workers, 1)
+        job_queue.ensure_started()
+        print('⚙️  Processando tarefas (Ctrl+C para sair)')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            job_queue.stop()
+
+    @app.cli.command('sweep-subscriptions')
+    def sweep_subscriptions_command():
+        """Expira as assinaturas vencidas e enfileira as renovações (uma passada)"""
+        expired, demoted, renewals = subscription_sweeper.sweep()
+        print(f'✅ {expired} usuário(s) com assinatura expirada, {demoted} sem premium, '
+              f'{renewals} renovação(ões) enfileirada(s)')
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Confere (EXPLAIN QUERY PLAN) que as consultas das rotas usam índices"""
+        failures = 0
+        for name, plan, problems in check_query_plans():
+            print(f"{'❌' if problems else '✅'} {name}: {' / '.join(plan)}")
+            failures += bool(problems)
+        if failures:
+            raise SystemExit(f'{failures} consulta(s) sem índice adequado')
+
+    @app.errorhandler(InvalidCursor)
+    def invalid_cursor(error):
+        return {'error': 'Cursor inválido'}, 400
+
+    @app.route('/api/health', methods=['GET'])
+    def health_check():
+        """Endpoint de verificação de saúde da API"""
+        return {
+            'status': 'healthy',
+            'service': 'Contestare Doc Express API',
+            'version': '1.0.0'
+        }
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+            return "Static folder not configured", 404
+
+        if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
+            return send_from_directory(static_folder_path, path)
         else:
-            return "index.html not found", 404
+            index_path = os.path.join(static_folder_path, 'index.html')
+            if os.path.exists(index_path):
+                return send_from_directory(static_folder_path, 'index.html')
+            else:
+                return "index.html not found", 404
+
+    return app
+
+def init_database(app):
+    """Cria tabelas, aplica migrações e carrega o catálogo (uma vez por deploy)"""
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+        seed_contracts()
 
 if __name__ == '__main__':
+    app = create_app()
+    init_database(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
-
@@ -0,0 +1,11 @@
+from datetime import datetime
+from src.models.user import db
+
+class AppMeta(db.Model):
+    """Marcadores internos da aplicação (chave/valor)"""
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AppMeta {self.key}>'
@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import json
+from sqlalchemy import event, inspect
 from src.models.user import db
 
 class Contract(db.Model):
@@ -15,6 +17,7 @@ class Contract(db.Model):
     price = db.Column(db.Float, default=19.90)
     is_premium = db.Column(db.Boolean, default=False)
     popularity_score = db.Column(db.Integer, default=0)
+    version = db.Column(db.Integer, default=1)  # Incrementada a cada alteração do conteúdo
     
     # Status
     is_active = db.Column(db.Boolean, default=True)
@@ -23,6 +26,12 @@ class Contract(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Índices
+    __table_args__ = (
+        db.Index('ux_contract_title', 'title', unique=True),
+        db.Index('ix_contract_active_category_popularity', 'is_active', 'category', 'popularity_score'),
+    )
+    
     def __repr__(self):
         return f'<Contract {self.title}>'
     
@@ -41,18 +50,61 @@ class Contract(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class ContractVersion(db.Model):
+    """Conteúdo imutável de cada versão de um modelo de contrato"""
+    id = db.Column(db.Integer, primary_key=True)
+    contract_id = db.Column(db.Integer, db.ForeignKey('contract.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('contract_id', 'version', name='uq_contract_version'),
+    )
+    
+    def __repr__(self):
+        return f'<ContractVersion {self.contract_id}v{self.version}>'
+
+@event.listens_for(Contract, 'before_update')
+def _bump_contract_version(mapper, connection, target):
+    if inspect(target).attrs.content.history.has_changes():
+        target.version = (target.version or 1) + 1
+
+@event.listens_for(Contract, 'after_insert')
+@event.listens_for(Contract, 'after_update')
+def _record_contract_version(mapper, connection, target):
+    connection.execute(
+        ContractVersion.__table__.insert().prefix_with('OR IGNORE'),
+        {
+            'contract_id': target.id,
+            'version': target.version or 1,
+            'content': target.content,
+            'created_at': datetime.utcnow()
+        }
+    )
+
 class UserContract(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     contract_id = db.Column(db.Integer, db.ForeignKey('contract.id'), nullable=False)
     
-    # Conteúdo personalizado pelo usuário
-    customized_content = db.Column(db.Text)
+    # Personalização do usuário sobre a versão do modelo adquirida
+    template_version = db.Column(db.Integer)
+    field_values = db.Column(db.Text)  # JSON: {"NOME_LOCADOR": "..."}
+    content_diff = db.Column(db.Text)  # JSON: [[inicio, fim, texto], ...]
+    customized_content = db.Column(db.Text)  # Cópia integral (apenas registros legados)
     
     # Status da compra/uso
     purchase_date = db.Column(db.DateTime, default=datetime.utcnow)
     is_downloaded = db.Column(db.Boolean, default=False)
     download_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Índices
+    __table_args__ = (
+        db.Index('ix_user_contract_user_purchase', 'user_id', 'purchase_date', 'id'),
+        db.Index('ux_user_contract_user_contract', 'user_id', 'contract_id', unique=True),
+    )
     
     def __repr__(self):
         return f'<UserContract {self.user_id}-{self.contract_id}>'
@@ -62,7 +114,8 @@ class UserContract(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'contract_id': self.contract_id,
-            'customized_content': self.customized_content,
+            'template_version': self.template_version,
+            'field_values': json.loads(self.field_values) if self.field_values else {},
             'purchase_date': self.purchase_date.isoformat() if self.purchase_date else None,
             'is_downloaded': self.is_downloaded,
             'download_count': self.download_count
@@ -0,0 +1,30 @@
+from datetime import datetime
+from src.models.user import db
+
+class IdempotencyRecord(db.Model):
+    """Resposta gravada de uma requisição com Idempotency-Key"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    
+    # Impressão digital da requisição (método, rota e corpo)
+    request_hash = db.Column(db.String(64), nullable=False)
+    
+    # Resposta
+    status = db.Column(db.String(20), default='in_progress')  # in_progress, completed
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    # Índices
+    __table_args__ = (
+        db.Index('ux_idempotency_user_key', 'user_id', 'key', unique=True),
+        db.Index('ix_idempotency_expires', 'expires_at'),
+    )
+    
+    def __repr__(self):
+        return f'<IdempotencyRecord {self.user_id}:{self.key}>'
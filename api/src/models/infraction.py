@@ -1,20 +1,45 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
+import re
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from src.models.user import db
 
+# Prazo para defesa prévia/recurso contado da notificação (CTB, art. 282)
+CONTEST_DEADLINE_DAYS = 30
+OPEN_STATUSES = ('pending', 'analyzed')
+
+def contest_deadline_for(date_notification):
+    return date_notification + timedelta(days=CONTEST_DEADLINE_DAYS) if date_notification else None
+
+OLD_PLATE = re.compile(r'^[A-Z]{3}[0-9]{4}$')
+
+def normalize_plate(plate):
+    """Forma canônica da placa: maiúsculas, sem separadores e no padrão Mercosul.
+
+    Placas antigas (ABC1234) viram a equivalente Mercosul (ABC1C34): o
+    segundo dígito é trocado pela letra correspondente (0=A ... 9=J).
+    """
+    text = re.sub(r'[^A-Z0-9]', '', str(plate or '').upper())
+    if OLD_PLATE.match(text):
+        text = text[:4] + 'ABCDEFGHIJ'[int(text[4])] + text[5:]
+    return text or None
+
 class Infraction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # active_history: o valor anterior fica disponível para o resumo (InfractionSummary)
+    user_id = db.column_property(db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False), active_history=True)
     
     # Dados da infração
     notification_number = db.Column(db.String(50), nullable=False)
     infraction_type = db.Column(db.String(100), nullable=False)
-    value = db.Column(db.Float, nullable=False)
+    value = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
     date_infraction = db.Column(db.DateTime, nullable=False)
     date_notification = db.Column(db.DateTime, nullable=False)
     
     # Dados do veículo
     vehicle_plate = db.Column(db.String(10), nullable=False)
+    plate_normalized = db.Column(db.String(10))  # ver normalize_plate
     vehicle_model = db.Column(db.String(100))
     
     # Dados do local
@@ -22,18 +47,32 @@ class Infraction(db.Model):
     issuing_agency = db.Column(db.String(100), nullable=False)
     
     # Status e análise
-    status = db.Column(db.String(50), default='pending')  # pending, analyzed, contested, resolved
-    success_probability = db.Column(db.Float)
+    status = db.column_property(db.Column(db.String(50), default='pending'), active_history=True)  # pending, analyzed, contested, resolved
+    success_probability = db.column_property(db.Column(db.Float), active_history=True)
     legal_arguments = db.Column(db.Text)
     
+    # Prazos
+    contest_deadline = db.Column(db.DateTime)
+    deadline_notified_at = db.Column(db.DateTime)
+    
     # Arquivos
     notification_file = db.Column(db.String(200))
     contest_document = db.Column(db.String(200))
+    contest_document_key = db.Column(db.String(64))  # chave no armazenamento de documentos
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Índices
+    __table_args__ = (
+        db.Index('ix_infraction_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ux_infraction_user_notification', 'user_id', 'notification_number', unique=True),
+        db.Index('ix_infraction_user_deadline', 'user_id', 'contest_deadline'),
+        db.Index('ix_infraction_deadline', 'contest_deadline'),
+        db.Index('ix_infraction_user_plate', 'user_id', 'plate_normalized', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Infraction {self.notification_number}>'
     
@@ -47,6 +86,7 @@ class Infraction(db.Model):
             'date_infraction': self.date_infraction.isoformat() if self.date_infraction else None,
             'date_notification': self.date_notification.isoformat() if self.date_notification else None,
             'vehicle_plate': self.vehicle_plate,
+            'plate_normalized': self.plate_normalized,
             'vehicle_model': self.vehicle_model,
             'location': self.location,
             'issuing_agency': self.issuing_agency,
@@ -55,7 +95,124 @@ class Infraction(db.Model):
             'legal_arguments': self.legal_arguments,
             'notification_file': self.notification_file,
             'contest_document': self.contest_document,
+            'contest_deadline': self.contest_deadline.isoformat() if self.contest_deadline else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+@event.listens_for(Infraction, 'before_insert')
+@event.listens_for(Infraction, 'before_update')
+def _derive_columns(mapper, connection, target):
+    state = inspect(target)
+    if target.contest_deadline is None or state.attrs.date_notification.history.has_changes():
+        deadline = contest_deadline_for(target.date_notification)
+        if deadline != target.contest_deadline:
+            target.contest_deadline = deadline
+            # Prazo novo: o aviso dado para o prazo anterior não vale para ele
+            target.deadline_notified_at = None
+    if target.plate_normalized is None or state.attrs.vehicle_plate.history.has_changes():
+        target.plate_normalized = normalize_plate(target.vehicle_plate)
+
+SUMMARY_STATUSES = ('pending', 'analyzed', 'contested', 'resolved')
+SUMMARY_COLUMNS = ['total_count'] + [f'{status}_count' for status in SUMMARY_STATUSES] + [
+    'total_value', 'probability_sum', 'probability_count'
+]
+
+class InfractionSummary(db.Model):
+    """Totais do painel por usuário, mantidos a cada escrita em infraction"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    
+    total_count = db.Column(db.Integer, default=0, nullable=False)
+    pending_count = db.Column(db.Integer, default=0, nullable=False)
+    analyzed_count = db.Column(db.Integer, default=0, nullable=False)
+    contested_count = db.Column(db.Integer, default=0, nullable=False)
+    resolved_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    total_value = db.Column(db.Float, default=0, nullable=False)
+    probability_sum = db.Column(db.Float, default=0, nullable=False)
+    probability_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<InfractionSummary {self.user_id}>'
+    
+    def to_dict(self):
+        return {
+            'total': self.total_count,
+            'by_status': {status: getattr(self, f'{status}_count') for status in SUMMARY_STATUSES},
+            'contested': self.contested_count,
+            'total_value': round(self.total_value, 2),
+            'average_success_probability': (
+                round(self.probability_sum / self.probability_count, 1)
+                if self.probability_count else None
+            ),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+def summary_delta(status, value, success_probability, sign=1):
+    """Contribuição de uma infração para os totais (sign=-1 para retirar)"""
+    delta = dict.fromkeys(SUMMARY_COLUMNS, 0)
+    delta['total_count'] = sign
+    if status in SUMMARY_STATUSES:
+        delta[f'{status}_count'] = sign
+    delta['total_value'] = sign * (value or 0)
+    if success_probability is not None:
+        delta['probability_sum'] = sign * success_probability
+        delta['probability_count'] = sign
+    return delta
+
+def apply_summary_delta(connection, user_id, delta):
+    """Soma delta aos totais do usuário (upsert), na transação da conexão"""
+    table = InfractionSummary.__table__
+    now = datetime.utcnow()
+    statement = sqlite_insert(table).values(user_id=user_id, updated_at=now, **delta)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            **{column: table.c[column] + statement.excluded[column] for column in SUMMARY_COLUMNS},
+            'updated_at': now
+        }
+    ))
+
+def _previous(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        return None  # valor anterior era NULL
+    return getattr(state.object, name)
+
+@event.listens_for(Infraction, 'after_insert')
+def _summary_on_insert(mapper, connection, target):
+    apply_summary_delta(connection, target.user_id, summary_delta(
+        target.status, target.value, target.success_probability
+    ))
+
+@event.listens_for(Infraction, 'after_update')
+def _summary_on_update(mapper, connection, target):
+    state = inspect(target)
+    tracked = ('user_id', 'status', 'value', 'success_probability')
+    if not any(state.attrs[name].history.has_changes() for name in tracked):
+        return
+    
+    old_user_id = _previous(state, 'user_id')
+    removed = summary_delta(
+        _previous(state, 'status'), _previous(state, 'value'),
+        _previous(state, 'success_probability'), sign=-1
+    )
+    added = summary_delta(target.status, target.value, target.success_probability)
+    
+    if old_user_id == target.user_id:
+        apply_summary_delta(connection, target.user_id, {
+            column: removed[column] + added[column] for column in SUMMARY_COLUMNS
+        })
+    else:
+        apply_summary_delta(connection, old_user_id, removed)
+        apply_summary_delta(connection, target.user_id, added)
+
+@event.listens_for(Infraction, 'after_delete')
+def _summary_on_delete(mapper, connection, target):
+    apply_summary_delta(connection, target.user_id, summary_delta(
+        target.status, target.value, target.success_probability, sign=-1
+    ))
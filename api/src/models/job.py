@@ -0,0 +1,53 @@
+import json
+from datetime import datetime
+from src.models.user import db
+
+class Job(db.Model):
+    """Tarefa em segundo plano (análise, reanálise, geração de documento)"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text)  # JSON
+    
+    # Chave de deduplicação: não enfileira de novo o que já está pendente
+    dedupe_key = db.Column(db.String(200))
+    
+    # Execução
+    status = db.Column(db.String(20), default='queued')  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    
+    # Resultado
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    # Índices
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_job_dedupe_key', 'dedupe_key'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.kind} {self.id}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
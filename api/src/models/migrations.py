@@ -0,0 +1,233 @@
+"""
+Migrações versionadas do banco SQLite.
+
+db.create_all() só cria tabelas novas; alterações em tabelas já
+existentes (colunas, índices) ficam aqui, numeradas e aplicadas uma
+única vez. Cada passo deve ser idempotente, pois num banco novo o
+create_all() já terá criado o esquema completo.
+"""
+import json
+from datetime import datetime
+from src.models.user import db
+from src.models.infraction import CONTEST_DEADLINE_DAYS, normalize_plate
+from src.services.search import create_search_index
+from src.services.overlay import compute_diff
+from src.services.locks import process_lock
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table}")')}
+
+
+def add_column(conn, table, column, ddl):
+    if column not in table_columns(conn, table):
+        conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}')
+
+
+def _0001_updated_at(conn):
+    add_column(conn, 'user', 'updated_at', 'DATETIME')
+    add_column(conn, 'user_contract', 'updated_at', 'DATETIME')
+    conn.exec_driver_sql(
+        'UPDATE "user" SET updated_at = COALESCE(last_login, created_at) WHERE updated_at IS NULL'
+    )
+    conn.exec_driver_sql(
+        'UPDATE user_contract SET updated_at = purchase_date WHERE updated_at IS NULL'
+    )
+
+
+def create_index(conn, name, table, columns, unique=False):
+    # DDL explícito: cada migração cria os índices do seu tempo, não os que o
+    # modelo declara hoje (únicos só depois da checagem de duplicatas)
+    conn.exec_driver_sql(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON "{table}" ({columns})'
+    )
+
+
+def reject_duplicates(conn, table, columns):
+    duplicates = conn.exec_driver_sql(
+        f'SELECT {columns} FROM "{table}" GROUP BY {columns} HAVING COUNT(*) > 1'
+    ).all()
+    if duplicates:
+        raise RuntimeError(f'Registros duplicados em {table} ({columns}): {duplicates[:10]}')
+
+
+def _0002_contract_search(conn):
+    create_search_index(conn)
+
+
+def _0003_keyset_indexes(conn):
+    create_index(conn, 'ix_infraction_user_created', 'infraction', 'user_id, created_at, id')
+    create_index(conn, 'ix_payment_user_created', 'payment', 'user_id, created_at, id')
+    create_index(conn, 'ix_user_contract_user_purchase', 'user_contract', 'user_id, purchase_date, id')
+
+
+def _0004_contract_overlay(conn):
+    add_column(conn, 'contract', 'version', 'INTEGER DEFAULT 1')
+    add_column(conn, 'user_contract', 'template_version', 'INTEGER')
+    add_column(conn, 'user_contract', 'field_values', 'TEXT')
+    add_column(conn, 'user_contract', 'content_diff', 'TEXT')
+    conn.exec_driver_sql('UPDATE contract SET version = 1 WHERE version IS NULL')
+    conn.exec_driver_sql(
+        'INSERT OR IGNORE INTO contract_version (contract_id, version, content, created_at) '
+        'SELECT id, version, content, ? FROM contract',
+        (datetime.utcnow().isoformat(' '),)
+    )
+
+    # Cópias integrais viram diff sobre a versão atual do modelo
+    legacy = conn.exec_driver_sql(
+        'SELECT uc.id, uc.customized_content, c.content, c.version '
+        'FROM user_contract uc JOIN contract c ON c.id = uc.contract_id '
+        'WHERE uc.template_version IS NULL'
+    ).all()
+    for user_contract_id, customized, base, version in legacy:
+        diff = compute_diff(base, customized) if customized is not None else []
+        conn.exec_driver_sql(
+            'UPDATE user_contract SET template_version = ?, content_diff = ?, '
+            'customized_content = NULL WHERE id = ?',
+            (version, json.dumps(diff, ensure_ascii=False) if diff else None, user_contract_id)
+        )
+
+
+def _0005_contract_title_unique(conn):
+    duplicates = conn.exec_driver_sql(
+        'SELECT title FROM contract GROUP BY title HAVING COUNT(*) > 1'
+    ).scalars().all()
+    if duplicates:
+        raise RuntimeError(f'Contratos com título duplicado: {", ".join(duplicates)}')
+    create_index(conn, 'ux_contract_title', 'contract', 'title', unique=True)
+
+
+def _0006_contest_document_key(conn):
+    add_column(conn, 'infraction', 'contest_document_key', 'VARCHAR(64)')
+
+
+def _0007_index_pack(conn):
+    reject_duplicates(conn, 'infraction', 'user_id, notification_number')
+    reject_duplicates(conn, 'user_contract', 'user_id, contract_id')
+    create_index(conn, 'ux_infraction_user_notification', 'infraction', 'user_id, notification_number', unique=True)
+    create_index(conn, 'ux_user_contract_user_contract', 'user_contract', 'user_id, contract_id', unique=True)
+    create_index(conn, 'ix_subscription_user_status', 'subscription', 'user_id, status')
+    create_index(conn, 'ix_contract_active_category_popularity', 'contract', 'is_active, category, popularity_score')
+
+
+def _0008_infraction_summary(conn):
+    # Recalcula os totais a partir de infraction (a tabela já foi criada pelo create_all)
+    conn.exec_driver_sql(
+        'INSERT OR REPLACE INTO infraction_summary (user_id, total_count, pending_count, '
+        'analyzed_count, contested_count, resolved_count, total_value, probability_sum, '
+        'probability_count, updated_at) '
+        'SELECT user_id, COUNT(*), '
+        "SUM(status = 'pending'), SUM(status = 'analyzed'), "
+        "SUM(status = 'contested'), SUM(status = 'resolved'), "
+        'COALESCE(SUM(value), 0), COALESCE(SUM(success_probability), 0), '
+        'COUNT(success_probability), ? '
+        'FROM infraction GROUP BY user_id',
+        (datetime.utcnow().isoformat(' '),)
+    )
+
+
+def _0009_contest_deadline(conn):
+    add_column(conn, 'infraction', 'contest_deadline', 'DATETIME')
+    add_column(conn, 'infraction', 'deadline_notified_at', 'DATETIME')
+    conn.exec_driver_sql(
+        # Mesmo formato de texto que o SQLAlchemy grava (microssegundos com 6 dígitos)
+        "UPDATE infraction SET contest_deadline = "
+        "strftime('%Y-%m-%d %H:%M:%S', date_notification, ?) || '.000000' "
+        'WHERE contest_deadline IS NULL AND date_notification IS NOT NULL',
+        (f'+{CONTEST_DEADLINE_DAYS} days',)
+    )
+    create_index(conn, 'ix_infraction_user_deadline', 'infraction', 'user_id, contest_deadline')
+    create_index(conn, 'ix_infraction_deadline', 'infraction', 'contest_deadline')
+
+
+def _0010_plate_normalized(conn):
+    add_column(conn, 'infraction', 'plate_normalized', 'VARCHAR(10)')
+    rows = conn.exec_driver_sql(
+        'SELECT id, vehicle_plate FROM infraction WHERE plate_normalized IS NULL'
+    ).all()
+    if rows:
+        conn.exec_driver_sql(
+            'UPDATE infraction SET plate_normalized = ? WHERE id = ?',
+            [(normalize_plate(plate), infraction_id) for infraction_id, plate in rows]
+        )
+    create_index(conn, 'ix_infraction_user_plate', 'infraction', 'user_id, plate_normalized, created_at, id')
+
+
+def _0011_subscription_expiry_index(conn):
+    create_index(conn, 'ix_subscription_status_end', 'subscription', 'status, end_date')
+
+
+def _0012_subscription_user_status_end(conn):
+    # Substitui (user_id, status): o fim da assinatura vigente sai só do índice
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_subscription_user_status')
+    create_index(conn, 'ix_subscription_user_status_end', 'subscription', 'user_id, status, end_date')
+
+
+def _0013_payment_rollup(conn):
+    # Recalcula o consolidado a partir de payment (a tabela já foi criada pelo create_all)
+    conn.exec_driver_sql(
+        'INSERT OR REPLACE INTO payment_daily_rollup (day, service_type, payment_method, '
+        'payment_status, payment_count, total_amount, updated_at) '
+        "SELECT date(created_at), service_type, payment_method, COALESCE(payment_status, 'pending'), "
+        'COUNT(*), COALESCE(SUM(amount), 0), ? '
+        'FROM payment GROUP BY 1, 2, 3, 4',
+        (datetime.utcnow().isoformat(' '),)
+    )
+    create_index(conn, 'ix_payment_created', 'payment', 'created_at, id')
+
+
+def _0014_payment_pix_transaction_index(conn):
+    create_index(conn, 'ix_payment_pix_transaction', 'payment', 'pix_transaction_id')
+
+
+
+def _0015_payment_updated_at(conn):
+    add_column(conn, 'payment', 'updated_at', 'DATETIME')
+    conn.exec_driver_sql(
+        'UPDATE payment SET updated_at = COALESCE(paid_at, created_at) WHERE updated_at IS NULL'
+    )
+
+
+MIGRATIONS = [
+    (1, 'Coluna updated_at em user e user_contract', _0001_updated_at),
+    (2, 'Índice FTS5 de busca em contract', _0002_contract_search),
+    (3, 'Índices de paginação por keyset', _0003_keyset_indexes),
+    (4, 'Contratos adquiridos como camada sobre o modelo versionado', _0004_contract_overlay),
+    (5, 'Título único em contract (upsert da carga inicial)', _0005_contract_title_unique),
+    (6, 'Chave do documento de contestação armazenado', _0006_contest_document_key),
+    (7, 'Índices compostos e únicos das consultas das rotas', _0007_index_pack),
+    (8, 'Resumo de infrações por usuário (painel)', _0008_infraction_summary),
+    (9, 'Prazo de contestação derivado e indexado', _0009_contest_deadline),
+    (10, 'Placa normalizada e indexada por usuário', _0010_plate_normalized),
+    (11, 'Índice (status, end_date) da varredura de assinaturas', _0011_subscription_expiry_index),
+    (12, 'Índice (user_id, status, end_date) dos direitos do usuário', _0012_subscription_user_status_end),
+    (13, 'Consolidado diário de pagamentos (relatórios)', _0013_payment_rollup),
+    (14, 'Índice de pix_transaction_id (webhook de confirmação PIX)', _0014_payment_pix_transaction_index),
+    (15, 'Coluna updated_at em payment (versão do ETag)', _0015_payment_updated_at),
+]
+
+
+def run_migrations():
+    """Aplica as migrações pendentes, em ordem"""
+    with process_lock('migrate'):
+        _run_pending()
+
+
+def _run_pending():
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE IF NOT EXISTS schema_migration ('
+            'version INTEGER PRIMARY KEY, description TEXT, applied_at DATETIME)'
+        )
+        applied = {row[0] for row in conn.exec_driver_sql('SELECT version FROM schema_migration')}
+
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        with db.engine.begin() as conn:
+            migrate(conn)
+            conn.exec_driver_sql(
+                'INSERT OR IGNORE INTO schema_migration (version, description, applied_at) '
+                'VALUES (?, ?, ?)',
+                (version, description, datetime.utcnow().isoformat(' '))
+            )
@@ -1,15 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from src.models.user import db
 
+# Status de assinatura que ainda dão direito ao premium até end_date
+CURRENT_SUBSCRIPTION_STATUSES = ('active', 'cancelled')
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     # Dados do pagamento
-    amount = db.Column(db.Float, nullable=False)
+    # active_history: o valor anterior fica disponível para o consolidado (PaymentDailyRollup)
+    amount = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
     payment_method = db.Column(db.String(50), nullable=False)  # pix, credit_card, debit_card
-    payment_status = db.Column(db.String(50), default='pending')  # pending, approved, rejected, refunded
+    payment_status = db.column_property(db.Column(db.String(50), default='pending'), active_history=True)  # pending, approved, rejected, refunded
     
     # Dados específicos do PIX
     pix_key = db.Column(db.String(100))  # 057.195.456-11
@@ -30,6 +36,15 @@ class Payment(db.Model):
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     paid_at = db.Column(db.DateTime)
+    # Muda a cada alteração (status inclusive): versão do ETag de GET /payments
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Índices
+    __table_args__ = (
+        db.Index('ix_payment_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_payment_created', 'created_at', 'id'),
+        db.Index('ix_payment_pix_transaction', 'pix_transaction_id'),
+    )
     
     def __repr__(self):
         return f'<Payment {self.transaction_id}>'
@@ -68,6 +83,12 @@ class Subscription(db.Model):
     monthly_amount = db.Column(db.Float, nullable=False)
     auto_renew = db.Column(db.Boolean, default=True)
     
+    # Índices
+    __table_args__ = (
+        db.Index('ix_subscription_user_status_end', 'user_id', 'status', 'end_date'),
+        db.Index('ix_subscription_status_end', 'status', 'end_date'),
+    )
+    
     def __repr__(self):
         return f'<Subscription {self.user_id}-{self.plan_type}>'
     
@@ -83,3 +104,76 @@ class Subscription(db.Model):
             'auto_renew': self.auto_renew
         }
 
+class PaymentDailyRollup(db.Model):
+    """Pagamentos por dia (UTC, de created_at), tipo de serviço, meio e status,
+    mantidos a cada escrita em payment"""
+    day = db.Column(db.Date, primary_key=True)
+    service_type = db.Column(db.String(50), primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    payment_status = db.Column(db.String(50), primary_key=True)
+    
+    payment_count = db.Column(db.Integer, default=0, nullable=False)
+    total_amount = db.Column(db.Float, default=0, nullable=False)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PaymentDailyRollup {self.day} {self.service_type}/{self.payment_method}/{self.payment_status}>'
+
+def _rollup_upsert():
+    table = PaymentDailyRollup.__table__
+    statement = sqlite_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.service_type, table.c.payment_method, table.c.payment_status],
+        set_={
+            'payment_count': table.c.payment_count + statement.excluded.payment_count,
+            'total_amount': table.c.total_amount + statement.excluded.total_amount,
+            'updated_at': statement.excluded.updated_at
+        }
+    )
+
+_ROLLUP_UPSERT = None
+
+def apply_rollup_delta(connection, payment, status, amount, sign):
+    """Soma (ou retira, sign=-1) um pagamento do consolidado, na transação da conexão"""
+    global _ROLLUP_UPSERT
+    # Montado uma vez: construir o upsert a cada linha custava mais que executá-lo
+    if _ROLLUP_UPSERT is None:
+        _ROLLUP_UPSERT = _rollup_upsert()
+    
+    now = datetime.utcnow()
+    connection.execute(_ROLLUP_UPSERT, {
+        'day': (payment.created_at or now).date(),
+        'service_type': payment.service_type,
+        'payment_method': payment.payment_method,
+        'payment_status': status or 'pending',
+        'payment_count': sign,
+        'total_amount': sign * (amount or 0),
+        'updated_at': now
+    })
+
+def _previous(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        return None  # valor anterior era NULL
+    return getattr(state.object, name)
+
+@event.listens_for(Payment, 'after_insert')
+def _rollup_on_insert(mapper, connection, target):
+    apply_rollup_delta(connection, target, target.payment_status, target.amount, 1)
+
+@event.listens_for(Payment, 'after_update')
+def _rollup_on_update(mapper, connection, target):
+    # Dia, serviço e meio não mudam depois de criado; status e valor sim
+    state = inspect(target)
+    if not (state.attrs.payment_status.history.has_changes() or state.attrs.amount.history.has_changes()):
+        return
+    
+    apply_rollup_delta(connection, target, _previous(state, 'payment_status'), _previous(state, 'amount'), -1)
+    apply_rollup_delta(connection, target, target.payment_status, target.amount, 1)
+
+@event.listens_for(Payment, 'after_delete')
+def _rollup_on_delete(mapper, connection, target):
+    apply_rollup_delta(connection, target, target.payment_status, target.amount, -1)
@@ -1,5 +1,8 @@
 from flask import Blueprint, jsonify, request, session
 from src.models.user import User, db
+from src.services.conditional import conditional
+from src.services.entitlements import current_user
+from src.services.passwords import HasherBusy, passwords
 from datetime import datetime
 import re
 
@@ -14,6 +17,17 @@ def validate_cpf(cpf):
     cpf = re.sub(r'[^0-9]', '', cpf)
     return len(cpf) == 11
 
+def busy_response(error):
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def current_user_version():
+    if 'user_id' not in session:
+        return None
+    
+    return db.session.query(User.updated_at).filter_by(id=session['user_id']).first()
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -61,6 +75,9 @@ def register():
             'user': user.to_dict()
         }), 201
         
+    except HasherBusy as e:
+        db.session.rollback()
+        return busy_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -85,6 +102,13 @@ def login():
         if not user.is_active:
             return jsonify({'error': 'Conta desativada'}), 401
         
+        # Hash gravado com método/custo antigo: refaz com a senha que acabou de ser conferida
+        try:
+            if passwords.needs_rehash(user.password_hash):
+                user.set_password(data['password'])
+        except HasherBusy:
+            pass  # fica para o próximo login
+        
         # Atualizar último login
         user.last_login = datetime.utcnow()
         db.session.commit()
@@ -98,6 +122,8 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except HasherBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -107,11 +133,12 @@ def logout():
     return jsonify({'message': 'Logout realizado com sucesso'}), 200
 
 @auth_bp.route('/me', methods=['GET'])
+@conditional(current_user_version)
 def get_current_user():
     if 'user_id' not in session:
         return jsonify({'error': 'Não autenticado'}), 401
     
-    user = User.query.get(session['user_id'])
+    user = current_user()
     if not user:
         session.clear()
         return jsonify({'error': 'Usuário não encontrado'}), 404
@@ -124,7 +151,7 @@ def update_profile():
         return jsonify({'error': 'Não autenticado'}), 401
     
     try:
-        user = User.query.get(session['user_id'])
+        user = current_user()
         if not user:
             return jsonify({'error': 'Usuário não encontrado'}), 404
         
@@ -1,10 +1,28 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, jsonify, request, session, current_app
 from src.models.contract import Contract, UserContract, db
-from src.models.user import User
+from src.models.app_meta import AppMeta
+from src.services.catalog import catalog
+from src.services.conditional import conditional
+from src.services.entitlements import current_entitlement
+from src.services.search import search_contracts
+from src.services.popularity import popularity
+from src.services.overlay import load_overlay, render_user_contract, set_overlay, user_template
+from src.services.templates import compile_template
+from src.services.pagination import (
+    InvalidCursor, decode_cursor, encode_cursor, keyset_page, page_args, paginated_response
+)
+from src.services.locks import process_lock
+from sqlalchemy import case, or_, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import func
 from datetime import datetime
+import hashlib
+import json
 
 contract_bp = Blueprint('contract', __name__)
 
+MAX_RENDER_BATCH = 500
+
 # Dados de contratos populares para popular o sistema
 POPULAR_CONTRACTS = [
     {
@@ -98,46 +116,104 @@ O capital social é de R$ [CAPITAL_SOCIAL].'''
     }
 ]
 
-def init_contracts():
-    """Inicializa contratos populares no banco de dados"""
-    for contract_data in POPULAR_CONTRACTS:
-        existing = Contract.query.filter_by(title=contract_data['title']).first()
-        if not existing:
-            contract = Contract(**contract_data)
-            db.session.add(contract)
+def catalog_version(*args, **kwargs):
+    return (catalog.get().digest,)
+
+def user_contracts_version():
+    if 'user_id' not in session:
+        return None
     
-    try:
-        db.session.commit()
-    except:
-        db.session.rollback()
+    row = db.session.query(
+        func.count(UserContract.id),
+        func.max(UserContract.id),
+        func.max(UserContract.updated_at)
+    ).filter(UserContract.user_id == session['user_id']).one()
+    
+    return (catalog.get().digest, *row)
+
+def user_contract_version(user_contract_id):
+    if 'user_id' not in session:
+        return None
+    
+    row = db.session.query(UserContract.updated_at).filter_by(
+        id=user_contract_id,
+        user_id=session['user_id']
+    ).first()
+    
+    if not row:
+        return None
+    
+    return (catalog.get().digest, *row)
 
 @contract_bp.route('/contracts', methods=['GET'])
+@conditional(catalog_version)
 def get_contracts():
     """Lista todos os contratos disponíveis"""
-    category = request.args.get('category')
+    category = request.args.get('category') or None
     is_premium = request.args.get('is_premium')
     
-    query = Contract.query.filter_by(is_active=True)
+    if is_premium is not None:
+        is_premium = is_premium.lower() == 'true'
+    
+    snapshot = catalog.get()
+    page = page_args()
     
-    if category:
-        query = query.filter_by(category=category)
+    if page is None:
+        body = snapshot.listing(category, is_premium)
+        return current_app.response_class(body, mimetype='application/json')
     
-    if is_premium is not None:
-        query = query.filter_by(is_premium=is_premium.lower() == 'true')
+    limit, after = page
+    if after:
+        after = decode_cursor(after)
+        if len(after) != 2 or not all(isinstance(value, int) for value in after):
+            raise InvalidCursor(page[1])
     
-    contracts = query.order_by(Contract.popularity_score.desc()).all()
+    body, next_key = snapshot.page(category, is_premium, limit, after)
+    response = current_app.response_class(body, mimetype='application/json')
+    return paginated_response(response, encode_cursor(next_key) if next_key else None)
+
+@contract_bp.route('/contracts/search', methods=['GET'])
+@conditional(catalog_version)
+def search_contract_library():
+    """Busca contratos por título, descrição e conteúdo"""
+    category = request.args.get('category') or None
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
     
-    return jsonify([contract.to_dict() for contract in contracts])
+    result = search_contracts(request.args.get('q'), category=category, limit=limit)
+    if result is None:
+        return jsonify({'error': 'Parâmetro q é obrigatório'}), 400
+    
+    return jsonify(result)
 
 @contract_bp.route('/contracts/<int:contract_id>', methods=['GET'])
+@conditional(catalog_version)
 def get_contract(contract_id):
     """Obtém detalhes de um contrato específico"""
-    contract = Contract.query.get_or_404(contract_id)
+    # Do snapshot, como a listagem: o ETag é o do catálogo
+    contract_data = catalog.get().contracts.get(contract_id)
     
-    if not contract.is_active:
+    if not contract_data:
+        Contract.query.get_or_404(contract_id)
         return jsonify({'error': 'Contrato não disponível'}), 404
     
-    return jsonify(contract.to_dict())
+    return jsonify(contract_data)
+
+@contract_bp.route('/contracts/<int:contract_id>/fields', methods=['GET'])
+@conditional(catalog_version)
+def get_contract_fields(contract_id):
+    """Lista os campos ([NOME_CAMPO]) a preencher em um contrato"""
+    contract_data = catalog.get().contracts.get(contract_id)
+    
+    if not contract_data:
+        return jsonify({'error': 'Contrato não disponível'}), 404
+    
+    template = compile_template(contract_data['content'])
+    
+    return jsonify({
+        'contract_id': contract_id,
+        'fields': template.fields,
+        'occurrences': template.occurrences()
+    })
 
 @contract_bp.route('/contracts/<int:contract_id>/purchase', methods=['POST'])
 def purchase_contract(contract_id):
@@ -147,13 +223,15 @@ def purchase_contract(contract_id):
     
     try:
         contract = Contract.query.get_or_404(contract_id)
-        user = User.query.get(session['user_id'])
         
         if not contract.is_active:
             return jsonify({'error': 'Contrato não disponível'}), 404
         
-        # Verificar se é premium e usuário tem acesso
-        if contract.is_premium and not user.is_premium:
+        # Verificar se é premium e usuário tem acesso (sem carregar o User)
+        entitlement = current_entitlement()
+        if entitlement is None:
+            return jsonify({'error': 'Usuário não encontrado'}), 404
+        if contract.is_premium and not entitlement.is_premium:
             return jsonify({'error': 'Contrato premium requer assinatura premium'}), 403
         
         # Verificar se já comprou
@@ -169,15 +247,15 @@ def purchase_contract(contract_id):
         user_contract = UserContract(
             user_id=session['user_id'],
             contract_id=contract_id,
-            customized_content=contract.content  # Cópia inicial
+            template_version=contract.version
         )
         
-        # Aumentar popularidade
-        contract.popularity_score += 1
-        
         db.session.add(user_contract)
         db.session.commit()
         
+        # Aumentar popularidade (gravado em lote, fora da transação da compra)
+        popularity.increment(contract_id)
+        
         return jsonify({
             'message': 'Contrato adquirido com sucesso',
             'user_contract': user_contract.to_dict(),
@@ -189,14 +267,22 @@ def purchase_contract(contract_id):
         return jsonify({'error': str(e)}), 500
 
 @contract_bp.route('/my-contracts', methods=['GET'])
+@conditional(user_contracts_version)
 def get_user_contracts():
     """Lista contratos do usuário"""
     if 'user_id' not in session:
         return jsonify({'error': 'Não autenticado'}), 401
     
-    user_contracts = db.session.query(UserContract, Contract).join(
+    query = db.session.query(UserContract, Contract).join(
         Contract, UserContract.contract_id == Contract.id
-    ).filter(UserContract.user_id == session['user_id']).all()
+    ).filter(UserContract.user_id == session['user_id'])
+    
+    user_contracts, next_cursor = keyset_page(
+        query,
+        [UserContract.purchase_date, UserContract.id],
+        page_args(),
+        lambda row: (row[0].purchase_date, row[0].id)
+    )
     
     result = []
     for user_contract, contract in user_contracts:
@@ -204,9 +290,10 @@ def get_user_contracts():
         contract_data['user_contract'] = user_contract.to_dict()
         result.append(contract_data)
     
-    return jsonify(result)
+    return paginated_response(result, next_cursor)
 
 @contract_bp.route('/my-contracts/<int:user_contract_id>', methods=['GET'])
+@conditional(user_contract_version)
 def get_user_contract(user_contract_id):
     """Obtém contrato específico do usuário"""
     if 'user_id' not in session:
@@ -222,8 +309,11 @@ def get_user_contract(user_contract_id):
     
     contract = Contract.query.get(user_contract.contract_id)
     
+    user_contract_data = user_contract.to_dict()
+    user_contract_data['customized_content'] = render_user_contract(user_contract)
+    
     return jsonify({
-        'user_contract': user_contract.to_dict(),
+        'user_contract': user_contract_data,
         'contract': contract.to_dict()
     })
 
@@ -244,20 +334,74 @@ def customize_contract(user_contract_id):
         
         data = request.json
         
-        if 'customized_content' in data:
-            user_contract.customized_content = data['customized_content']
+        field_values = data.get('field_values')
+        if field_values is not None and not isinstance(field_values, dict):
+            return jsonify({'error': 'field_values deve ser um objeto'}), 400
+        
+        contract = Contract.query.get(user_contract.contract_id)
+        set_overlay(
+            user_contract,
+            contract,
+            field_values=field_values,
+            customized_content=data.get('customized_content')
+        )
         
         db.session.commit()
         
+        user_contract_data = user_contract.to_dict()
+        user_contract_data['customized_content'] = render_user_contract(user_contract)
+        
         return jsonify({
             'message': 'Contrato personalizado com sucesso',
-            'user_contract': user_contract.to_dict()
+            'user_contract': user_contract_data
         }), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@contract_bp.route('/my-contracts/<int:user_contract_id>/render', methods=['POST'])
+def render_contract(user_contract_id):
+    """Preenche o contrato com um ou vários conjuntos de valores"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    user_contract = UserContract.query.filter_by(
+        id=user_contract_id,
+        user_id=session['user_id']
+    ).first()
+    
+    if not user_contract:
+        return jsonify({'error': 'Contrato não encontrado'}), 404
+    
+    data = request.json or {}
+    value_maps = data.get('values', [{}])
+    if isinstance(value_maps, dict):
+        value_maps = [value_maps]
+    
+    if not isinstance(value_maps, list) or not all(isinstance(v, dict) for v in value_maps):
+        return jsonify({'error': 'values deve ser um objeto ou uma lista de objetos'}), 400
+    
+    if len(value_maps) > MAX_RENDER_BATCH:
+        return jsonify({'error': f'Máximo de {MAX_RENDER_BATCH} documentos por chamada'}), 400
+    
+    template = user_template(user_contract)
+    stored_values, _ = load_overlay(user_contract)
+    
+    documents = []
+    for value_map in value_maps:
+        values = {**stored_values, **value_map}
+        documents.append({
+            'content': template.render(values),
+            'missing_fields': template.missing_fields(values)
+        })
+    
+    return jsonify({
+        'user_contract_id': user_contract.id,
+        'fields': template.fields,
+        'documents': documents
+    })
+
 @contract_bp.route('/my-contracts/<int:user_contract_id>/download', methods=['POST'])
 def download_contract(user_contract_id):
     """Marca contrato como baixado e incrementa contador"""
@@ -280,7 +424,7 @@ def download_contract(user_contract_id):
         
         return jsonify({
             'message': 'Download registrado com sucesso',
-            'content': user_contract.customized_content,
+            'content': render_user_contract(user_contract),
             'download_count': user_contract.download_count
         }), 200
         
@@ -289,23 +433,28 @@ def download_contract(user_contract_id):
         return jsonify({'error': str(e)}), 500
 
 @contract_bp.route('/categories', methods=['GET'])
+@conditional(catalog_version)
 def get_categories():
     """Lista categorias de contratos disponíveis"""
-    categories = db.session.query(Contract.category).distinct().all()
-    return jsonify([cat[0] for cat in categories])
+    body = catalog.get().categories
+    return current_app.response_class(body, mimetype='application/json')
+
+def popular_version():
+    return (catalog.get().digest, *popularity.top())
 
 @contract_bp.route('/popular', methods=['GET'])
+@conditional(popular_version)
 def get_popular_contracts():
     """Lista contratos mais populares"""
-    contracts = Contract.query.filter_by(is_active=True).order_by(
-        Contract.popularity_score.desc()
-    ).limit(10).all()
+    snapshot = catalog.get()
     
-    return jsonify([contract.to_dict() for contract in contracts])
-
-# Inicializar contratos ao importar o módulo
-# init_contracts()  # Comentado para evitar erro de contexto
-
+    result = []
+    for contract_id, score in popularity.top():
+        contract_data = snapshot.contracts.get(contract_id)
+        if contract_data:
+            result.append(dict(contract_data, popularity_score=score))
+    
+    return jsonify(result)
 
 # Contratos adicionais para expandir a biblioteca
 
@@ -518,16 +667,91 @@ O conteúdo criado pertence ao CONTRATANTE.'''
     }
 ]
 
-def init_additional_contracts():
-    """Inicializa contratos adicionais no banco de dados"""
-    for contract_data in ADDITIONAL_CONTRACTS:
-        existing = Contract.query.filter_by(title=contract_data['title']).first()
-        if not existing:
-            contract = Contract(**contract_data)
-            db.session.add(contract)
+SEED_MARKER_KEY = 'contract_seed_hash'
+
+def contract_seed_hash():
+    seeds = POPULAR_CONTRACTS + ADDITIONAL_CONTRACTS
+    payload = json.dumps(seeds, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def seed_contracts():
+    """Sincroniza POPULAR_CONTRACTS e ADDITIONAL_CONTRACTS com o banco de dados
     
-    try:
-        db.session.commit()
-    except:
-        db.session.rollback()
+    Não faz nada se o hash do conjunto de modelos for igual ao gravado na
+    última carga. Caso contrário insere os modelos novos e atualiza os
+    alterados (casando pelo título) em um único upsert.
+    """
+    seed_hash = contract_seed_hash()
+    marker = db.session.get(AppMeta, SEED_MARKER_KEY)
+    if marker and marker.value == seed_hash:
+        return False
+    db.session.rollback()
+    
+    with process_lock('seed'):
+        # Outro processo pode ter concluído a carga enquanto esperávamos
+        marker = db.session.get(AppMeta, SEED_MARKER_KEY)
+        if marker and marker.value == seed_hash:
+            return False
+        
+        now = datetime.utcnow()
+        table = Contract.__table__
+        rows = [
+            {
+                'title': data['title'],
+                'category': data['category'],
+                'description': data['description'],
+                'content': data['content'],
+                'price': data.get('price', 19.90),
+                'is_premium': data.get('is_premium', False),
+                'popularity_score': 0,
+                'version': 1,
+                'is_active': True,
+                'created_at': now,
+                'updated_at': now
+            }
+            for data in POPULAR_CONTRACTS + ADDITIONAL_CONTRACTS
+        ]
+        
+        statement = sqlite_insert(table).values(rows)
+        incoming = statement.excluded
+        changed = or_(*(
+            table.c[column].is_distinct_from(incoming[column])
+            for column in ('category', 'description', 'content', 'price', 'is_premium')
+        ))
+        statement = statement.on_conflict_do_update(
+            index_elements=['title'],
+            set_={
+                'category': incoming.category,
+                'description': incoming.description,
+                'content': incoming.content,
+                'price': incoming.price,
+                'is_premium': incoming.is_premium,
+                'version': case(
+                    (table.c.content != incoming.content, table.c.version + 1),
+                    else_=table.c.version
+                ),
+                'updated_at': incoming.updated_at
+            },
+            where=changed
+        )
+        
+        try:
+            db.session.execute(statement)
+            db.session.execute(text(
+                'INSERT OR IGNORE INTO contract_version (contract_id, version, content, created_at) '
+                'SELECT id, version, content, :now FROM contract'
+            ), {'now': now})
+            
+            if marker is None:
+                marker = AppMeta(key=SEED_MARKER_KEY)
+                db.session.add(marker)
+            marker.value = seed_hash
+            
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    
+    catalog.invalidate()
+    return True
 
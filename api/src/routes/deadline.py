@@ -0,0 +1,46 @@
+from flask import Blueprint, jsonify, request, session
+from src.models.infraction import OPEN_STATUSES, Infraction
+from datetime import datetime, timedelta
+import re
+
+deadline_bp = Blueprint('deadline', __name__)
+
+WITHIN_PATTERN = re.compile(r'^(\d+)([dh])$')
+MAX_WITHIN = timedelta(days=365)
+
+def parse_within(value):
+    """'7d' ou '48h' -> timedelta (None se inválido)"""
+    match = WITHIN_PATTERN.match(value.strip().lower())
+    if not match:
+        return None
+    amount, unit = int(match.group(1)), match.group(2)
+    return timedelta(days=amount) if unit == 'd' else timedelta(hours=amount)
+
+@deadline_bp.route('/deadlines', methods=['GET'])
+def get_deadlines():
+    """Prazos de contestação em aberto que vencem dentro da janela (ex.: ?within=7d)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    within = parse_within(request.args.get('within', '7d'))
+    if within is None or within > MAX_WITHIN:
+        return jsonify({'error': 'Parâmetro within inválido (ex.: 7d, 48h; máximo 365d)'}), 400
+    
+    now = datetime.utcnow()
+    
+    # Busca por intervalo no índice (user_id, contest_deadline)
+    infractions = Infraction.query.filter(
+        Infraction.user_id == session['user_id'],
+        Infraction.contest_deadline >= now,
+        Infraction.contest_deadline <= now + within,
+        Infraction.status.in_(OPEN_STATUSES)
+    ).order_by(Infraction.contest_deadline).all()
+    
+    return jsonify([{
+        'infraction_id': infraction.id,
+        'notification_number': infraction.notification_number,
+        'vehicle_plate': infraction.vehicle_plate,
+        'status': infraction.status,
+        'contest_deadline': infraction.contest_deadline.isoformat(),
+        'days_left': (infraction.contest_deadline - now).days
+    } for infraction in infractions])
@@ -1,10 +1,17 @@
 from flask import Blueprint, jsonify, request, session
-from src.models.infraction import Infraction, db
+from src.models.infraction import Infraction, InfractionSummary, db
 from src.models.user import User
+from src.services.conditional import conditional
+from src.services.documents import document_key, document_store
+from src.services.analysis import engine as analysis_engine
+from src.services.infraction_import import (
+    DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE, import_infractions, infraction_fields, missing_field, read_rows
+)
+from src.services.jobs import JobError, accepted_response, job_queue, prefers_async
+from src.services.pagination import keyset_page, page_args, paginated_response
+from sqlalchemy import func
 from datetime import datetime, timedelta
 import os
-import uuid
-import random
 
 infraction_bp = Blueprint('infraction', __name__)
 
@@ -12,74 +19,54 @@ def analyze_infraction(infraction_data):
     """
     Simula análise jurídica baseada no CTB, CDC e Código Civil
     """
-    arguments = []
-    success_probability = 0
-    
-    # Análise baseada no tipo de infração
-    infraction_type = infraction_data.get('infraction_type', '').lower()
-    
-    if 'velocidade' in infraction_type:
-        arguments.append("Possível erro na calibração do equipamento de medição")
-        arguments.append("Verificação da sinalização adequada no local")
-        arguments.append("Análise da margem de erro do radar")
-        success_probability += 25
-    
-    if 'estacionamento' in infraction_type:
-        arguments.append("Verificação da sinalização de proibição")
-        arguments.append("Análise do horário de funcionamento da restrição")
-        arguments.append("Competência do agente autuador")
-        success_probability += 30
-    
-    if 'semaforo' in infraction_type or 'sinal' in infraction_type:
-        arguments.append("Verificação do funcionamento do semáforo")
-        arguments.append("Análise da visibilidade da sinalização")
-        arguments.append("Tempo de amarelo adequado conforme CTB")
-        success_probability += 20
-    
-    # Análise de prazos (CDC)
-    date_infraction = datetime.fromisoformat(infraction_data.get('date_infraction'))
-    date_notification = datetime.fromisoformat(infraction_data.get('date_notification'))
-    
-    days_diff = (date_notification - date_infraction).days
-    
-    if days_diff > 30:
-        arguments.append("Notificação fora do prazo legal de 30 dias (Art. 280 CTB)")
-        success_probability += 40
-    
-    if days_diff > 60:
-        arguments.append("Violação grave do prazo de notificação")
-        success_probability += 20
-    
-    # Análise do órgão autuador
-    issuing_agency = infraction_data.get('issuing_agency', '').lower()
-    
-    if 'municipal' in issuing_agency and 'rodovia' in infraction_data.get('location', '').lower():
-        arguments.append("Possível incompetência do órgão municipal em rodovia estadual/federal")
-        success_probability += 35
-    
-    # Análise de valor (CDC - Direito do Consumidor)
-    value = float(infraction_data.get('value', 0))
+    return analysis_engine.analyze(infraction_data)
+
+def analyze_infractions(infractions):
+    """Analisa várias infrações em uma única chamada"""
+    return analysis_engine.analyze_many(infractions)
+
+def apply_analysis(infraction):
+    """Analisa a infração a partir das colunas gravadas e atualiza o registro"""
+    analysis = analyze_infraction({
+        'infraction_type': infraction.infraction_type,
+        'date_infraction': infraction.date_infraction,
+        'date_notification': infraction.date_notification,
+        'issuing_agency': infraction.issuing_agency,
+        'location': infraction.location,
+        'value': infraction.value
+    })
     
-    if value > 1000:
-        arguments.append("Valor desproporcional - análise sob ótica do CDC")
-        success_probability += 15
+    infraction.success_probability = analysis['success_probability']
+    infraction.legal_arguments = analysis['legal_arguments']
+    infraction.status = 'analyzed'
+    infraction.updated_at = datetime.utcnow()
+    return analysis
+
+def store_contest_document(infraction):
+    """Grava o documento de contestação, se ainda não estiver armazenado, e devolve (chave, texto)"""
+    key = document_key(infraction)
+    if document_store.exists(key):
+        return key, document_store.read(key)
     
-    # Argumentos gerais sempre aplicáveis
-    arguments.extend([
-        "Verificação da regularidade do processo administrativo",
-        "Análise da presunção de legitimidade do ato administrativo",
-        "Direito ao contraditório e ampla defesa (CF/88)",
-        "Verificação da tipicidade da conduta"
-    ])
+    analysis = {
+        'legal_arguments': infraction.legal_arguments,
+        'success_probability': infraction.success_probability
+    }
     
-    # Limitar probabilidade entre 15% e 95%
-    success_probability = min(95, max(15, success_probability + random.randint(-10, 15)))
+    contest_document = generate_contest_document(infraction, analysis)
+    document_store.put(key, contest_document)
+    return key, contest_document
+
+def apply_contest(infraction):
+    """Gera o documento de contestação e marca a infração como contestada"""
+    key, contest_document = store_contest_document(infraction)
     
-    return {
-        'success_probability': success_probability,
-        'legal_arguments': '; '.join(arguments),
-        'main_arguments': arguments[:3]  # Top 3 argumentos
-    }
+    # O nome deriva da chave: gerar de novo as mesmas entradas dá o mesmo arquivo
+    filename = f"contestacao_{infraction.notification_number}_{key[:8]}.txt"
+    infraction.contest_document = filename
+    infraction.contest_document_key = key
+    infraction.status = 'contested'
+    return contest_document, filename
 
 def generate_contest_document(infraction, analysis):
     """
@@ -149,6 +136,32 @@ DOCUMENTOS ANEXOS:
     
     return template
 
+def infractions_version():
+    if 'user_id' not in session:
+        return None
+    
+    return db.session.query(
+        func.count(Infraction.id),
+        func.max(Infraction.id),
+        func.max(Infraction.updated_at)
+    ).filter(Infraction.user_id == session['user_id']).one()
+
+def summary_version():
+    if 'user_id' not in session:
+        return None
+    
+    row = db.session.query(InfractionSummary.updated_at).filter_by(user_id=session['user_id']).first()
+    return row or (None,)
+
+def infraction_version(infraction_id):
+    if 'user_id' not in session:
+        return None
+    
+    return db.session.query(Infraction.updated_at).filter_by(
+        id=infraction_id,
+        user_id=session['user_id']
+    ).first()
+
 @infraction_bp.route('/infractions', methods=['POST'])
 def create_infraction():
     if 'user_id' not in session:
@@ -158,13 +171,9 @@ def create_infraction():
         data = request.json
         
         # Validações
-        required_fields = ['notification_number', 'infraction_type', 'value', 
-                          'date_infraction', 'date_notification', 'vehicle_plate', 
-                          'location', 'issuing_agency']
-        
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({'error': f'Campo {field} é obrigatório'}), 400
+        field = missing_field(data)
+        if field:
+            return jsonify({'error': f'Campo {field} é obrigatório'}), 400
         
         # Verificar se já existe
         existing = Infraction.query.filter_by(
@@ -176,23 +185,17 @@ def create_infraction():
             return jsonify({'error': 'Infração já cadastrada'}), 400
         
         # Criar infração
-        infraction = Infraction(
-            user_id=session['user_id'],
-            notification_number=data['notification_number'],
-            infraction_type=data['infraction_type'],
-            value=float(data['value']),
-            date_infraction=datetime.fromisoformat(data['date_infraction']),
-            date_notification=datetime.fromisoformat(data['date_notification']),
-            vehicle_plate=data['vehicle_plate'],
-            vehicle_model=data.get('vehicle_model'),
-            location=data['location'],
-            issuing_agency=data['issuing_agency'],
-            notification_file=data.get('notification_file')
-        )
+        infraction = Infraction(**infraction_fields(data, session['user_id']))
         
         db.session.add(infraction)
         db.session.flush()  # Para obter o ID
         
+        if prefers_async():
+            job = enqueue_analysis(infraction)
+            db.session.commit()
+            return accepted_response(job, 'Infração cadastrada; análise em andamento',
+                                     infraction=infraction.to_dict())
+        
         # Realizar análise jurídica
         analysis = analyze_infraction(data)
         
@@ -212,15 +215,67 @@ def create_infraction():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@infraction_bp.route('/infractions/import', methods=['POST'])
+def import_infractions_file():
+    """Importa infrações em lote a partir de CSV ou NDJSON"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    chunk_size = request.args.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+    chunk_size = min(max(chunk_size, 1), MAX_CHUNK_SIZE)
+    
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'Arquivo não enviado'}), 400
+        stream, content_type = upload.stream, upload.mimetype or upload.filename or ''
+    else:
+        stream, content_type = request.stream, request.mimetype
+    
+    if not any(kind in content_type for kind in ('csv', 'ndjson', 'jsonl', 'json-seq')):
+        return jsonify({'error': 'Formato não suportado (use CSV ou NDJSON)'}), 415
+    
+    try:
+        report = import_infractions(session['user_id'], read_rows(stream, content_type), chunk_size)
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Arquivo deve estar em UTF-8'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify(report), 200
+
 @infraction_bp.route('/infractions', methods=['GET'])
+@conditional(infractions_version)
 def get_infractions():
     if 'user_id' not in session:
         return jsonify({'error': 'Não autenticado'}), 401
     
-    infractions = Infraction.query.filter_by(user_id=session['user_id']).all()
-    return jsonify([infraction.to_dict() for infraction in infractions])
+    infractions, next_cursor = keyset_page(
+        Infraction.query.filter_by(user_id=session['user_id']),
+        [Infraction.created_at, Infraction.id],
+        page_args(),
+        lambda infraction: (infraction.created_at, infraction.id)
+    )
+    
+    return paginated_response([infraction.to_dict() for infraction in infractions], next_cursor)
+
+@infraction_bp.route('/infractions/summary', methods=['GET'])
+@conditional(summary_version)
+def get_infractions_summary():
+    """Totais do painel, lidos de uma única linha por usuário"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    summary = db.session.get(InfractionSummary, session['user_id'])
+    if not summary:
+        summary = InfractionSummary(user_id=session['user_id'], total_count=0, pending_count=0,
+                                    analyzed_count=0, contested_count=0, resolved_count=0,
+                                    total_value=0, probability_sum=0, probability_count=0)
+    
+    return jsonify(summary.to_dict())
 
 @infraction_bp.route('/infractions/<int:infraction_id>', methods=['GET'])
+@conditional(infraction_version)
 def get_infraction(infraction_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Não autenticado'}), 401
@@ -252,18 +307,18 @@ def generate_contest(infraction_id):
         if infraction.status != 'analyzed':
             return jsonify({'error': 'Infração deve estar analisada'}), 400
         
-        # Gerar documento de contestação
-        analysis = {
-            'legal_arguments': infraction.legal_arguments,
-            'success_probability': infraction.success_probability
-        }
-        
-        contest_document = generate_contest_document(infraction, analysis)
+        if prefers_async():
+            job = job_queue.enqueue(
+                'infraction.contest',
+                {'infraction_id': infraction.id},
+                user_id=session['user_id'],
+                dedupe_key=f'infraction.contest:{infraction.id}'
+            )
+            db.session.commit()
+            return accepted_response(job, 'Geração do documento em andamento')
         
-        # Salvar documento (simulado)
-        filename = f"contestacao_{infraction.notification_number}_{uuid.uuid4().hex[:8]}.txt"
-        infraction.contest_document = filename
-        infraction.status = 'contested'
+        # Gerar documento de contestação
+        contest_document, filename = apply_contest(infraction)
         
         db.session.commit()
         
@@ -271,6 +326,7 @@ def generate_contest(infraction_id):
             'message': 'Documento de contestação gerado com sucesso',
             'document': contest_document,
             'filename': filename,
+            'document_url': f'/api/infractions/{infraction.id}/contest/document',
             'infraction': infraction.to_dict()
         }), 200
         
@@ -278,6 +334,36 @@ def generate_contest(infraction_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@infraction_bp.route('/infractions/<int:infraction_id>/contest/document', methods=['GET'])
+def download_contest_document(infraction_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    infraction = Infraction.query.filter_by(
+        id=infraction_id, 
+        user_id=session['user_id']
+    ).first()
+    
+    if not infraction:
+        return jsonify({'error': 'Infração não encontrada'}), 404
+    
+    if not infraction.contest_document:
+        return jsonify({'error': 'Documento de contestação não gerado'}), 404
+    
+    key = infraction.contest_document_key
+    if not key or not document_store.exists(key):
+        # Registro anterior ao armazenamento ou volume perdido: grava uma vez
+        try:
+            key, _ = store_contest_document(infraction)
+            if key != infraction.contest_document_key:
+                infraction.contest_document_key = key
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+    
+    return document_store.send(key, infraction.contest_document)
+
 @infraction_bp.route('/infractions/<int:infraction_id>/analyze', methods=['POST'])
 def reanalyze_infraction(infraction_id):
     if 'user_id' not in session:
@@ -292,22 +378,13 @@ def reanalyze_infraction(infraction_id):
         if not infraction:
             return jsonify({'error': 'Infração não encontrada'}), 404
         
-        # Realizar nova análise
-        infraction_data = {
-            'infraction_type': infraction.infraction_type,
-            'date_infraction': infraction.date_infraction.isoformat(),
-            'date_notification': infraction.date_notification.isoformat(),
-            'issuing_agency': infraction.issuing_agency,
-            'location': infraction.location,
-            'value': infraction.value
-        }
-        
-        analysis = analyze_infraction(infraction_data)
+        if prefers_async():
+            job = enqueue_analysis(infraction)
+            db.session.commit()
+            return accepted_response(job, 'Reanálise em andamento')
         
-        infraction.success_probability = analysis['success_probability']
-        infraction.legal_arguments = analysis['legal_arguments']
-        infraction.status = 'analyzed'
-        infraction.updated_at = datetime.utcnow()
+        # Realizar nova análise
+        analysis = apply_analysis(infraction)
         
         db.session.commit()
         
@@ -321,3 +398,31 @@ def reanalyze_infraction(infraction_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def enqueue_analysis(infraction):
+    return job_queue.enqueue(
+        'infraction.analyze',
+        {'infraction_id': infraction.id},
+        user_id=infraction.user_id,
+        dedupe_key=f'infraction.analyze:{infraction.id}'
+    )
+
+@job_queue.handler('infraction.analyze')
+def analyze_infraction_job(payload, job):
+    infraction = db.session.get(Infraction, payload['infraction_id'])
+    if not infraction:
+        raise JobError('Infração não encontrada')
+    
+    analysis = apply_analysis(infraction)
+    return {'infraction_id': infraction.id, 'analysis': analysis}
+
+@job_queue.handler('infraction.contest')
+def generate_contest_job(payload, job):
+    infraction = db.session.get(Infraction, payload['infraction_id'])
+    if not infraction:
+        raise JobError('Infração não encontrada')
+    
+    if infraction.status != 'analyzed':
+        raise JobError('Infração deve estar analisada')
+    
+    contest_document, filename = apply_contest(infraction)
+    return {'infraction_id': infraction.id, 'document': contest_document, 'filename': filename}
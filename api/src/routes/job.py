@@ -0,0 +1,27 @@
+from flask import Blueprint, jsonify, session
+from src.models.job import Job, db
+from src.services.conditional import conditional
+
+job_bp = Blueprint('job', __name__)
+
+def job_version(job_id):
+    if 'user_id' not in session:
+        return None
+    
+    return db.session.query(Job.status, Job.attempts, Job.updated_at).filter_by(
+        id=job_id,
+        user_id=session['user_id']
+    ).first()
+
+@job_bp.route('/jobs/<job_id>', methods=['GET'])
+@conditional(job_version)
+def get_job(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    job = Job.query.filter_by(id=job_id, user_id=session['user_id']).first()
+    
+    if not job:
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+    
+    return jsonify(job.to_dict())
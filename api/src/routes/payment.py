@@ -1,9 +1,19 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, current_app, jsonify, request, session
 from src.models.payment import Payment, Subscription, db
 from src.models.user import User
-from datetime import datetime, timedelta
+from src.services.conditional import conditional
+from src.services.entitlements import current_user
+from src.services.gateway import GatewayError, GatewayUnavailable, gateway
+from src.services.idempotency import HEADER as IDEMPOTENCY_HEADER, idempotent
+from src.services.jobs import JobError, job_queue
+from src.services.payments import approve_payment, reject_payment, renewal_transaction_id
+from src.services.pix_webhook import InvalidConfirmation, parse_confirmation, pix_webhook
+from src.services.pagination import keyset_page, page_args, paginated_response
+from sqlalchemy import func
+from datetime import datetime
+import hashlib
+import hmac
 import uuid
-import random
 
 payment_bp = Blueprint('payment', __name__)
 
@@ -13,34 +23,119 @@ def generate_transaction_id():
     """Gera ID único para transação"""
     return f"TXN_{datetime.now().strftime('%Y%m%d')}_{uuid.uuid4().hex[:8].upper()}"
 
-def simulate_pix_payment(amount, pix_key):
-    """Simula processamento de pagamento PIX"""
-    # Simula aprovação automática para demonstração
-    return {
-        'status': 'approved',
-        'transaction_id': f"PIX_{uuid.uuid4().hex[:12].upper()}",
-        'message': 'Pagamento PIX aprovado com sucesso'
-    }
+def request_transaction_id():
+    """transaction_id do pagamento, enviado ao PSP como chave de idempotência.
+
+    Com Idempotency-Key, deriva da chave do cliente: uma nova tentativa
+    (depois de um 5xx ou de um timeout no gateway) reusa o pagamento gravado
+    e a mesma chave no PSP, sem cobrar duas vezes.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return generate_transaction_id()
+    digest = hashlib.sha256(f"{session['user_id']}:{key}".encode('utf-8')).hexdigest()
+    return f"TXN_IDEM_{digest[:24].upper()}"
+
+def find_request_payment(transaction_id, **fields):
+    """Pagamento já gravado por uma tentativa anterior da mesma requisição.
+
+    Devolve (pagamento ou None, erro). Erro se a chave foi usada com outro
+    pagamento.
+    """
+    payment = Payment.query.filter_by(transaction_id=transaction_id, user_id=session['user_id']).first()
+    if payment is None:
+        return None, None
+    if any(getattr(payment, name) != value for name, value in fields.items()):
+        return None, (jsonify({'error': f'{IDEMPOTENCY_HEADER} já usada com outro pagamento'}), 422)
+    return payment, None
+
+def awaiting_gateway(payment):
+    """Pendente sem resposta do PSP (a chamada falhou ou não terminou)"""
+    return payment.payment_status == 'pending' and not payment.pix_transaction_id
 
-def simulate_card_payment(amount, card_data):
-    """Simula processamento de pagamento com cartão"""
-    # Simula aprovação com 90% de chance
-    success = random.random() > 0.1
+def processed_payment_response(payment):
+    """Resposta para uma nova tentativa de um pagamento que o PSP já respondeu"""
+    status_codes = {'approved': 200, 'pending': 202}
+    return jsonify({
+        'message': 'Pagamento já processado',
+        'payment': payment.to_dict(),
+        'status': payment.payment_status
+    }), status_codes.get(payment.payment_status, 400)
+
+def charge_outside_transaction(payment, charge):
+    """Grava o pagamento pendente e só então chama o gateway.
+
+    O commit antes da chamada libera a trava de escrita do SQLite durante a
+    requisição HTTP e deixa o pagamento registrado, com o transaction_id
+    usado no PSP, mesmo se o gateway não responder. Em GatewayError o erro
+    é anotado no pagamento, que continua pendente para nova tentativa ou
+    conciliação. Devolve o pagamento recarregado e o resultado do gateway.
+    """
+    db.session.add(payment)
+    db.session.flush()
+    payment_id = payment.id
+    db.session.commit()
     
-    if success:
-        return {
-            'status': 'approved',
-            'transaction_id': f"CARD_{uuid.uuid4().hex[:12].upper()}",
-            'message': 'Pagamento aprovado com sucesso'
-        }
-    else:
-        return {
-            'status': 'rejected',
-            'transaction_id': None,
-            'message': 'Pagamento rejeitado - verifique os dados do cartão'
-        }
+    try:
+        result = charge()
+    except GatewayError as e:
+        payment = db.session.get(Payment, payment_id)
+        payment.gateway_response = f'{e.__class__.__name__}: {e}'
+        db.session.commit()
+        raise
+    
+    return db.session.get(Payment, payment_id), result
+
+def gateway_error_response(error, transaction_id):
+    """503/502 com a referência do pagamento pendente, para conciliação"""
+    db.session.rollback()
+    payment = Payment.query.filter_by(transaction_id=transaction_id).first()
+    return jsonify({
+        'error': str(error),
+        'payment': payment.to_dict() if payment else None
+    }), 503 if isinstance(error, GatewayUnavailable) else 502
+
+def payments_version():
+    if 'user_id' not in session:
+        return None
+    
+    return db.session.query(
+        func.count(Payment.id),
+        func.max(Payment.id),
+        func.max(Payment.updated_at)
+    ).filter(Payment.user_id == session['user_id']).one()
+
+def payment_version(payment_id):
+    if 'user_id' not in session:
+        return None
+    
+    return db.session.query(Payment.updated_at).filter_by(
+        id=payment_id,
+        user_id=session['user_id']
+    ).first()
+
+def subscription_version():
+    if 'user_id' not in session:
+        return None
+    
+    row = db.session.query(
+        Subscription.id, Subscription.end_date, Subscription.auto_renew
+    ).filter_by(
+        user_id=session['user_id'],
+        status='active'
+    ).first()
+    
+    # Vencida e ainda não varrida: a resposta muda com o tempo, sem mudar a linha
+    if not row or row.end_date < datetime.utcnow():
+        return None
+    
+    return row
+
+def pricing_version():
+    return (PIX_KEY,)
 
 @payment_bp.route('/payment/pix', methods=['POST'])
+@idempotent
 def process_pix_payment():
     """Processa pagamento via PIX"""
     if 'user_id' not in session:
@@ -59,41 +154,36 @@ def process_pix_payment():
         if amount <= 0:
             return jsonify({'error': 'Valor deve ser maior que zero'}), 400
         
-        # Criar registro de pagamento
-        payment = Payment(
-            user_id=session['user_id'],
-            amount=amount,
-            payment_method='pix',
-            service_type=data['service_type'],
-            reference_id=data.get('reference_id'),
-            transaction_id=generate_transaction_id(),
-            pix_key=PIX_KEY
-        )
+        transaction_id = request_transaction_id()
+        payment, error = find_request_payment(transaction_id, amount=amount, payment_method='pix',
+                                              service_type=data['service_type'])
+        if error:
+            return error
+        if payment is not None and not awaiting_gateway(payment):
+            return processed_payment_response(payment)
         
-        db.session.add(payment)
-        db.session.flush()
+        # Criar registro de pagamento
+        if payment is None:
+            payment = Payment(
+                user_id=session['user_id'],
+                amount=amount,
+                payment_method='pix',
+                service_type=data['service_type'],
+                reference_id=data.get('reference_id'),
+                transaction_id=transaction_id,
+                pix_key=PIX_KEY
+            )
         
-        # Simular processamento PIX
-        pix_result = simulate_pix_payment(amount, PIX_KEY)
+        # Processar no gateway (transaction_id como chave de idempotência no PSP)
+        payment, pix_result = charge_outside_transaction(
+            payment, lambda: gateway.charge_pix(amount, PIX_KEY, transaction_id)
+        )
         
         if pix_result['status'] == 'approved':
-            payment.payment_status = 'approved'
-            payment.paid_at = datetime.utcnow()
-            payment.pix_transaction_id = pix_result['transaction_id']
-            
-            # Atualizar status do usuário se for plano premium
-            if data['service_type'] == 'premium_plan':
-                user = User.query.get(session['user_id'])
-                user.is_premium = True
-                
-                # Criar assinatura
-                subscription = Subscription(
-                    user_id=session['user_id'],
-                    plan_type='premium',
-                    monthly_amount=amount,
-                    end_date=datetime.utcnow() + timedelta(days=30)
-                )
-                db.session.add(subscription)
+            approve_payment(payment, current_user(), pix_result['transaction_id'])
+        elif pix_result['status'] == 'pending':
+            # Liquidação assíncrona: aprovado depois por POST /payment/pix/webhook
+            payment.pix_transaction_id = pix_result.get('transaction_id')
         else:
             payment.payment_status = 'rejected'
         
@@ -101,17 +191,67 @@ def process_pix_payment():
         
         db.session.commit()
         
+        status_codes = {'approved': 200, 'pending': 202}
         return jsonify({
             'message': pix_result['message'],
             'payment': payment.to_dict(),
             'status': pix_result['status']
-        }), 200 if pix_result['status'] == 'approved' else 400
+        }), status_codes.get(pix_result['status'], 400)
         
+    except GatewayError as e:
+        return gateway_error_response(e, transaction_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def webhook_auth_error():
+    """Confere X-Webhook-Signature: sha256=<HMAC do corpo com PIX_WEBHOOK_SECRET>"""
+    secret = current_app.config.get('PIX_WEBHOOK_SECRET')
+    if not secret:
+        return jsonify({'error': 'Webhook PIX desabilitado (PIX_WEBHOOK_SECRET não configurado)'}), 403
+    
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), request.get_data(), hashlib.sha256).hexdigest()
+    provided = request.headers.get('X-Webhook-Signature', '')
+    if not hmac.compare_digest(provided.encode('utf-8'), expected.encode('utf-8')):
+        return jsonify({'error': 'Assinatura do webhook inválida'}), 401
+    return None
+
+@payment_bp.route('/payment/pix/webhook', methods=['POST'])
+def pix_settlement_webhook():
+    """Recebe confirmações de liquidação PIX do PSP (uma ou várias) e as enfileira"""
+    error = webhook_auth_error()
+    if error:
+        return error
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'pix' in data:
+        items = data['pix']
+    else:
+        items = data if isinstance(data, list) else [data]
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Nenhuma confirmação enviada'}), 400
+    
+    confirmations, invalid = [], []
+    for index, item in enumerate(items):
+        try:
+            confirmations.append(parse_confirmation(item))
+        except InvalidConfirmation as e:
+            invalid.append({'index': index, 'error': str(e)})
+    
+    accepted = pix_webhook.put_many(confirmations)
+    if accepted < len(confirmations):
+        # Fila cheia: o PSP reenvia; as já aceitas serão ignoradas como repetidas
+        response = jsonify({
+            'error': 'Fila de confirmações cheia, tente novamente',
+            'accepted': accepted
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
+    return jsonify({'accepted': accepted, 'invalid': invalid}), 202
+
 @payment_bp.route('/payment/card', methods=['POST'])
+@idempotent
 def process_card_payment():
     """Processa pagamento via cartão"""
     if 'user_id' not in session:
@@ -144,41 +284,41 @@ def process_card_payment():
         elif card_number.startswith('3'):
             card_brand = 'amex'
         
-        # Criar registro de pagamento
-        payment = Payment(
-            user_id=session['user_id'],
-            amount=amount,
-            payment_method='credit_card',
-            service_type=data['service_type'],
-            reference_id=data.get('reference_id'),
-            transaction_id=generate_transaction_id(),
-            card_last_digits=card_number[-4:],
-            card_brand=card_brand
-        )
+        transaction_id = request_transaction_id()
+        payment, error = find_request_payment(transaction_id, amount=amount, payment_method='credit_card',
+                                              service_type=data['service_type'],
+                                              card_last_digits=card_number[-4:])
+        if error:
+            return error
+        if payment is not None and not awaiting_gateway(payment):
+            return processed_payment_response(payment)
         
-        db.session.add(payment)
-        db.session.flush()
+        # Criar registro de pagamento
+        if payment is None:
+            payment = Payment(
+                user_id=session['user_id'],
+                amount=amount,
+                payment_method='credit_card',
+                service_type=data['service_type'],
+                reference_id=data.get('reference_id'),
+                transaction_id=transaction_id,
+                card_last_digits=card_number[-4:],
+                card_brand=card_brand
+            )
         
-        # Simular processamento do cartão
-        card_result = simulate_card_payment(amount, data)
+        card = {
+            'number': card_number,
+            'holder': data['card_holder'],
+            'expiry_date': data['expiry_date'],
+            'cvv': data['cvv']
+        }
+        # Processar no gateway (transaction_id como chave de idempotência no PSP)
+        payment, card_result = charge_outside_transaction(
+            payment, lambda: gateway.charge_card(amount, card, transaction_id)
+        )
         
         if card_result['status'] == 'approved':
-            payment.payment_status = 'approved'
-            payment.paid_at = datetime.utcnow()
-            
-            # Atualizar status do usuário se for plano premium
-            if data['service_type'] == 'premium_plan':
-                user = User.query.get(session['user_id'])
-                user.is_premium = True
-                
-                # Criar assinatura
-                subscription = Subscription(
-                    user_id=session['user_id'],
-                    plan_type='premium',
-                    monthly_amount=amount,
-                    end_date=datetime.utcnow() + timedelta(days=30)
-                )
-                db.session.add(subscription)
+            approve_payment(payment, current_user())
         else:
             payment.payment_status = 'rejected'
         
@@ -192,23 +332,30 @@ def process_card_payment():
             'status': card_result['status']
         }), 200 if card_result['status'] == 'approved' else 400
         
+    except GatewayError as e:
+        return gateway_error_response(e, transaction_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @payment_bp.route('/payments', methods=['GET'])
+@conditional(payments_version)
 def get_user_payments():
     """Lista pagamentos do usuário"""
     if 'user_id' not in session:
         return jsonify({'error': 'Não autenticado'}), 401
     
-    payments = Payment.query.filter_by(user_id=session['user_id']).order_by(
-        Payment.created_at.desc()
-    ).all()
+    payments, next_cursor = keyset_page(
+        Payment.query.filter_by(user_id=session['user_id']),
+        [Payment.created_at, Payment.id],
+        page_args(),
+        lambda payment: (payment.created_at, payment.id)
+    )
     
-    return jsonify([payment.to_dict() for payment in payments])
+    return paginated_response([payment.to_dict() for payment in payments], next_cursor)
 
 @payment_bp.route('/payments/<int:payment_id>', methods=['GET'])
+@conditional(payment_version)
 def get_payment(payment_id):
     """Obtém detalhes de um pagamento específico"""
     if 'user_id' not in session:
@@ -225,6 +372,7 @@ def get_payment(payment_id):
     return jsonify(payment.to_dict())
 
 @payment_bp.route('/subscription', methods=['GET'])
+@conditional(subscription_version)
 def get_user_subscription():
     """Obtém assinatura ativa do usuário"""
     if 'user_id' not in session:
@@ -238,12 +386,8 @@ def get_user_subscription():
     if not subscription:
         return jsonify({'message': 'Nenhuma assinatura ativa'}), 404
     
-    # Verificar se expirou
+    # Vencida: o status e o premium são atualizados pelo varredor de assinaturas
     if subscription.end_date < datetime.utcnow():
-        subscription.status = 'expired'
-        user = User.query.get(session['user_id'])
-        user.is_premium = False
-        db.session.commit()
         return jsonify({'message': 'Assinatura expirada'}), 404
     
     return jsonify(subscription.to_dict())
@@ -282,6 +426,7 @@ def cancel_subscription():
         return jsonify({'error': str(e)}), 500
 
 @payment_bp.route('/pricing', methods=['GET'])
+@conditional(pricing_version)
 def get_pricing():
     """Retorna informações de preços"""
     return jsonify({
@@ -313,6 +458,7 @@ def get_pricing():
     })
 
 @payment_bp.route('/payment/simulate', methods=['POST'])
+@idempotent
 def simulate_payment():
     """Endpoint para simular pagamentos em desenvolvimento"""
     if 'user_id' not in session:
@@ -326,28 +472,14 @@ def simulate_payment():
             user_id=session['user_id'],
             amount=float(data.get('amount', 19.90)),
             payment_method='pix',
-            payment_status='approved',
             service_type=data.get('service_type', 'infraction_contest'),
             reference_id=data.get('reference_id'),
             transaction_id=generate_transaction_id(),
-            pix_key=PIX_KEY,
-            paid_at=datetime.utcnow()
+            pix_key=PIX_KEY
         )
         
         db.session.add(payment)
-        
-        # Se for premium, ativar
-        if data.get('service_type') == 'premium_plan':
-            user = User.query.get(session['user_id'])
-            user.is_premium = True
-            
-            subscription = Subscription(
-                user_id=session['user_id'],
-                plan_type='premium',
-                monthly_amount=payment.amount,
-                end_date=datetime.utcnow() + timedelta(days=30)
-            )
-            db.session.add(subscription)
+        approve_payment(payment, current_user())
         
         db.session.commit()
         
@@ -360,3 +492,57 @@ def simulate_payment():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@job_queue.handler('subscription.renew')
+def renew_subscription_job(payload, job):
+    """Cobra a renovação automática enfileirada pelo varredor de assinaturas"""
+    subscription = db.session.get(Subscription, payload['subscription_id'])
+    if not subscription:
+        raise JobError('Assinatura não encontrada')
+    
+    # Cancelada, expirada ou já renovada desde que a tarefa foi enfileirada
+    if (subscription.status != 'active' or not subscription.auto_renew
+            or subscription.end_date.isoformat() != payload['end_date']):
+        return {'subscription_id': subscription.id, 'renewed': False}
+    
+    subscription_id, user_id = subscription.id, subscription.user_id
+    transaction_id = renewal_transaction_id(subscription)
+    payment = Payment.query.filter_by(transaction_id=transaction_id).first()
+    if payment is not None and not awaiting_gateway(payment):
+        # Cobrança do período já respondida (PIX pendente): o webhook conclui a renovação
+        return {'subscription_id': subscription_id, 'renewed': False, 'payment_id': payment.id,
+                'status': payment.payment_status}
+    
+    amount = subscription.monthly_amount
+    if payment is None:
+        payment = Payment(
+            user_id=user_id,
+            amount=amount,
+            payment_method='pix',
+            service_type='premium_plan',
+            reference_id=subscription_id,
+            transaction_id=transaction_id,
+            pix_key=PIX_KEY
+        )
+    
+    # GatewayError propaga: a fila tenta de novo, com o mesmo pagamento pendente
+    payment, result = charge_outside_transaction(
+        payment, lambda: gateway.charge_pix(amount, PIX_KEY, transaction_id)
+    )
+    payment.gateway_response = str(result)
+    subscription = db.session.get(Subscription, subscription_id)
+    
+    if result['status'] == 'approved':
+        approve_payment(payment, db.session.get(User, user_id), result['transaction_id'])
+    elif result['status'] == 'pending':
+        # Liquidação assíncrona: o webhook PIX aprova (e estende a assinatura) ou recusa
+        payment.pix_transaction_id = result.get('transaction_id')
+    else:
+        reject_payment(payment)
+    
+    return {
+        'subscription_id': subscription.id,
+        'renewed': result['status'] == 'approved',
+        'status': payment.payment_status,
+        'payment_id': payment.id,
+        'end_date': subscription.end_date.isoformat()
+    }
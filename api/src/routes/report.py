@@ -0,0 +1,131 @@
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from src.models.payment import Payment, PaymentDailyRollup, db
+from sqlalchemy import func, tuple_
+from datetime import date, datetime, timedelta
+import csv
+import hmac
+import io
+
+report_bp = Blueprint('report', __name__)
+
+REPORT_DIMENSIONS = ('day', 'service_type', 'payment_method', 'payment_status')
+EXPORT_COLUMNS = ('id', 'user_id', 'amount', 'payment_method', 'payment_status', 'service_type',
+                  'reference_id', 'transaction_id', 'card_brand', 'created_at', 'paid_at')
+EXPORT_CHUNK = 5000
+EXPORT_YIELD_PER = 500
+
+def reports_auth_error():
+    """Relatórios são do financeiro: exigem X-Reports-Key = REPORTS_API_KEY"""
+    expected = current_app.config.get('REPORTS_API_KEY')
+    if not expected:
+        return jsonify({'error': 'Relatórios desabilitados (REPORTS_API_KEY não configurada)'}), 403
+    
+    provided = request.headers.get('X-Reports-Key', '')
+    if not hmac.compare_digest(provided.encode('utf-8'), expected.encode('utf-8')):
+        return jsonify({'error': 'Chave de relatórios inválida'}), 401
+    return None
+
+def date_range_args():
+    """(início, fim) inclusivos de ?from=AAAA-MM-DD&to=AAAA-MM-DD; padrão: últimos 30 dias"""
+    today = datetime.utcnow().date()
+    start = date.fromisoformat(request.args['from']) if request.args.get('from') else today - timedelta(days=29)
+    end = date.fromisoformat(request.args['to']) if request.args.get('to') else today
+    return start, end
+
+@report_bp.route('/reports/payments', methods=['GET'])
+def get_payments_report():
+    """Totais de pagamentos por período, lidos só do consolidado diário"""
+    error = reports_auth_error()
+    if error:
+        return error
+    
+    try:
+        start, end = date_range_args()
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD'}), 400
+    
+    group_by = [name for name in request.args.get('group_by', 'day').split(',') if name]
+    invalid = [name for name in group_by if name not in REPORT_DIMENSIONS]
+    if invalid:
+        return jsonify({'error': f"Dimensões inválidas: {', '.join(invalid)}"}), 400
+    
+    columns = [getattr(PaymentDailyRollup, name) for name in group_by]
+    rows = db.session.query(
+        *columns,
+        func.sum(PaymentDailyRollup.payment_count),
+        func.sum(PaymentDailyRollup.total_amount)
+    ).filter(
+        PaymentDailyRollup.day >= start,
+        PaymentDailyRollup.day <= end,
+        PaymentDailyRollup.payment_count != 0
+    ).group_by(*columns).order_by(*columns).all()
+    
+    result = []
+    for row in rows:
+        item = {name: value.isoformat() if isinstance(value, date) else value
+                for name, value in zip(group_by, row)}
+        item['payments'] = row[-2]
+        item['amount'] = round(row[-1] or 0, 2)
+        result.append(item)
+    
+    return jsonify({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'group_by': group_by,
+        'rows': result
+    })
+
+@report_bp.route('/reports/payments/export.csv', methods=['GET'])
+def export_payments():
+    """Exporta os pagamentos do período em CSV, transmitido aos poucos"""
+    error = reports_auth_error()
+    if error:
+        return error
+    
+    try:
+        start, end = date_range_args()
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD'}), 400
+    
+    lower = datetime.combine(start, datetime.min.time())
+    upper = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    columns = [getattr(Payment, name) for name in EXPORT_COLUMNS]
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        
+        # Blocos por keyset sobre (created_at, id): cada bloco é uma leitura curta,
+        # encerrada antes de enviar os dados, então um download lento não segura
+        # a trava de leitura do SQLite (que bloquearia os escritores)
+        after = None
+        while True:
+            query = db.session.query(*columns).filter(
+                Payment.created_at >= lower,
+                Payment.created_at < upper
+            )
+            if after is not None:
+                query = query.filter(tuple_(Payment.created_at, Payment.id) > after)
+            query = query.order_by(Payment.created_at, Payment.id).limit(EXPORT_CHUNK)
+            
+            count = 0
+            for row in query.execution_options(yield_per=EXPORT_YIELD_PER):
+                writer.writerow(row)
+                after = (row.created_at, row.id)
+                count += 1
+            db.session.commit()
+            
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            
+            if count < EXPORT_CHUNK:
+                break
+    
+    filename = f'pagamentos_{start.isoformat()}_{end.isoformat()}.csv'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
@@ -1,12 +1,19 @@
 from flask import Blueprint, jsonify, request
 from src.models.user import User, db
+from src.services.pagination import keyset_page, page_args, paginated_response
 
 user_bp = Blueprint('user', __name__)
 
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    users, next_cursor = keyset_page(
+        User.query,
+        [User.id],
+        page_args(),
+        lambda user: (user.id,),
+        descending=False
+    )
+    return paginated_response([user.to_dict() for user in users], next_cursor)
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
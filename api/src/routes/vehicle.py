@@ -0,0 +1,77 @@
+from flask import Blueprint, jsonify, session
+from src.models.infraction import OPEN_STATUSES, Infraction, db, normalize_plate
+from src.services.conditional import conditional
+from src.services.pagination import keyset_page, page_args, paginated_response
+from sqlalchemy import case, func
+
+vehicle_bp = Blueprint('vehicle', __name__)
+
+def vehicles_version(plate=None):
+    if 'user_id' not in session:
+        return None
+    
+    query = db.session.query(
+        func.count(Infraction.id),
+        func.max(Infraction.id),
+        func.max(Infraction.updated_at)
+    ).filter(Infraction.user_id == session['user_id'])
+    if plate is not None:
+        query = query.filter(Infraction.plate_normalized == normalize_plate(plate))
+    return query.one()
+
+@vehicle_bp.route('/vehicles', methods=['GET'])
+@conditional(vehicles_version)
+def get_vehicles():
+    """Veículos do usuário com totais de multas (agrupados pela placa normalizada)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    # GROUP BY sobre o prefixo do índice (user_id, plate_normalized, ...)
+    query = db.session.query(
+        Infraction.plate_normalized.label('plate'),
+        func.count(Infraction.id).label('infractions'),
+        func.sum(Infraction.value).label('total_value'),
+        func.sum(case((Infraction.status.in_(OPEN_STATUSES), 1), else_=0)).label('open'),
+        func.sum(case((Infraction.status == 'contested', 1), else_=0)).label('contested'),
+        func.max(Infraction.date_infraction).label('last_infraction'),
+        func.min(Infraction.vehicle_plate).label('vehicle_plate')
+    ).filter(
+        Infraction.user_id == session['user_id']
+    ).group_by(Infraction.plate_normalized)
+    
+    vehicles, next_cursor = keyset_page(
+        query,
+        [Infraction.plate_normalized],
+        page_args(),
+        lambda row: (row.plate,),
+        descending=False
+    )
+    
+    return paginated_response([{
+        'plate': row.plate,
+        'vehicle_plate': row.vehicle_plate,
+        'infractions': row.infractions,
+        'total_value': round(row.total_value or 0, 2),
+        'open': row.open,
+        'contested': row.contested,
+        'last_infraction': row.last_infraction.isoformat() if row.last_infraction else None
+    } for row in vehicles], next_cursor)
+
+@vehicle_bp.route('/vehicles/<plate>/infractions', methods=['GET'])
+@conditional(vehicles_version)
+def get_vehicle_infractions(plate):
+    """Multas de um veículo, aceitando a placa em qualquer grafia (ABC-1234, abc1c34...)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Não autenticado'}), 401
+    
+    infractions, next_cursor = keyset_page(
+        Infraction.query.filter_by(
+            user_id=session['user_id'],
+            plate_normalized=normalize_plate(plate)
+        ),
+        [Infraction.created_at, Infraction.id],
+        page_args(),
+        lambda infraction: (infraction.created_at, infraction.id)
+    )
+    
+    return paginated_response([infraction.to_dict() for infraction in infractions], next_cursor)
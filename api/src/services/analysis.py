@@ -0,0 +1,367 @@
+"""
+Motor de regras da análise jurídica de infrações.
+
+As regras são declaradas em RULES (palavras-chave por campo, limites de
+prazo e de valor, argumentos e peso) e compiladas uma única vez:
+
+- para cada campo de texto, todas as palavras-chave de todas as regras
+  viram uma única regex, percorrida uma vez por infração;
+- regras só de limite (prazo, valor) ficam ordenadas pelo limite e são
+  selecionadas por busca binária.
+
+Assim o custo de analisar uma infração depende das regras que disparam,
+não do tamanho da tabela.
+
+No modo determinístico (padrão) a variação aleatória da probabilidade é
+semeada pela chave das entradas normalizadas: palavras-chave encontradas
+por campo e a faixa do prazo e do valor em relação aos limites das
+regras. Duas multas com a mesma chave têm exatamente o mesmo resultado,
+que fica guardado em um memo LRU (opcionalmente persistido em arquivo).
+"""
+import atexit
+import bisect
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+RULESET_VERSION = 1
+
+# Condições de uma regra (todas precisam valer):
+#   'keywords':       {campo: [palavras]} - basta uma palavra por campo
+#   'days_gap_above': dias entre infração e notificação maior que o limite
+#   'value_above':    valor da multa maior que o limite
+RULES = [
+    {
+        'id': 'velocidade',
+        'keywords': {'infraction_type': ['velocidade']},
+        'arguments': [
+            "Possível erro na calibração do equipamento de medição",
+            "Verificação da sinalização adequada no local",
+            "Análise da margem de erro do radar"
+        ],
+        'weight': 25
+    },
+    {
+        'id': 'estacionamento',
+        'keywords': {'infraction_type': ['estacionamento']},
+        'arguments': [
+            "Verificação da sinalização de proibição",
+            "Análise do horário de funcionamento da restrição",
+            "Competência do agente autuador"
+        ],
+        'weight': 30
+    },
+    {
+        'id': 'semaforo',
+        'keywords': {'infraction_type': ['semaforo', 'sinal']},
+        'arguments': [
+            "Verificação do funcionamento do semáforo",
+            "Análise da visibilidade da sinalização",
+            "Tempo de amarelo adequado conforme CTB"
+        ],
+        'weight': 20
+    },
+    {
+        'id': 'prazo_notificacao',
+        'days_gap_above': 30,
+        'arguments': ["Notificação fora do prazo legal de 30 dias (Art. 280 CTB)"],
+        'weight': 40
+    },
+    {
+        'id': 'prazo_notificacao_grave',
+        'days_gap_above': 60,
+        'arguments': ["Violação grave do prazo de notificação"],
+        'weight': 20
+    },
+    {
+        'id': 'orgao_municipal_rodovia',
+        'keywords': {'issuing_agency': ['municipal'], 'location': ['rodovia']},
+        'arguments': ["Possível incompetência do órgão municipal em rodovia estadual/federal"],
+        'weight': 35
+    },
+    {
+        'id': 'valor_desproporcional',
+        'value_above': 1000,
+        'arguments': ["Valor desproporcional - análise sob ótica do CDC"],
+        'weight': 15
+    },
+]
+
+# Argumentos gerais sempre aplicáveis
+GENERAL_ARGUMENTS = [
+    "Verificação da regularidade do processo administrativo",
+    "Análise da presunção de legitimidade do ato administrativo",
+    "Direito ao contraditório e ampla defesa (CF/88)",
+    "Verificação da tipicidade da conduta"
+]
+
+MIN_PROBABILITY = 15
+MAX_PROBABILITY = 95
+
+JITTER_RANGE = (-10, 15)
+
+
+def normalize_text(value):
+    """Minúsculas e sem acentos, para casar 'Semáforo' com 'semaforo'"""
+    text = unicodedata.normalize('NFKD', str(value or '').lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+class KeywordMatcher:
+    """Encontra, em uma única passada, todas as palavras-chave contidas no texto"""
+
+    def __init__(self, keywords):
+        ordered = sorted(set(keywords), key=len, reverse=True)
+        # Lookahead: casa em todas as posições, inclusive ocorrências sobrepostas.
+        # Em cada posição a alternativa mais longa vence; as mais curtas que
+        # começam no mesmo ponto são prefixos dela e entram via self.prefixes.
+        self.pattern = re.compile('(?=(' + '|'.join(map(re.escape, ordered)) + '))')
+        self.prefixes = {
+            keyword: frozenset(other for other in ordered if keyword.startswith(other))
+            for keyword in ordered
+        }
+
+    def find(self, text):
+        found = set()
+        for match in self.pattern.finditer(text):
+            found |= self.prefixes[match.group(1)]
+        return found
+
+
+class AnalysisMemo:
+    """Memo LRU limitado de resultados por chave de entradas, com persistência opcional"""
+
+    def __init__(self, max_size=4096, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, version):
+        """Carrega o arquivo do memo, descartando entradas de outra versão das regras"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as handle:
+                saved = json.load(handle)
+        except (OSError, ValueError):
+            logger.warning('Memo de análise ilegível, ignorando: %s', self.path)
+            return
+        if saved.get('version') != version:
+            return
+        with self._lock:
+            for key, result in saved.get('entries', [])[-self.max_size:]:
+                self._entries[key] = result
+
+    def save(self, version):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            entries = list(self._entries.items())
+            self._dirty = False
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as output:
+                json.dump({'version': version, 'entries': entries}, output, ensure_ascii=False)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+class RuleEngine:
+    def __init__(self, rules, general_arguments=(), version=RULESET_VERSION,
+                 deterministic=True, memo=None):
+        self.version = version
+        self.rules = rules
+        self.general_arguments = list(general_arguments)
+        self.deterministic = deterministic
+        self.memo = memo if memo is not None else AnalysisMemo()
+
+        keywords_by_field = {}
+        self._keyword_rules = {}  # (campo, palavra) -> [índices das regras]
+        self._gap_rules = []      # [(limite, índice)] de regras só de prazo
+        self._value_rules = []    # [(limite, índice)] de regras só de valor
+        self._conditions = []
+
+        for index, rule in enumerate(rules):
+            keywords = {field: [normalize_text(k) for k in words]
+                        for field, words in rule.get('keywords', {}).items()}
+            for field, words in keywords.items():
+                keywords_by_field.setdefault(field, set()).update(words)
+                for word in words:
+                    self._keyword_rules.setdefault((field, word), []).append(index)
+
+            self._conditions.append((
+                {field: frozenset(words) for field, words in keywords.items()},
+                rule.get('days_gap_above'),
+                rule.get('value_above')
+            ))
+
+            if not keywords:
+                if rule.get('days_gap_above') is not None:
+                    self._gap_rules.append((rule['days_gap_above'], index))
+                elif rule.get('value_above') is not None:
+                    self._value_rules.append((rule['value_above'], index))
+
+        self._gap_rules.sort()
+        self._value_rules.sort()
+        self._gap_limits = [limit for limit, _ in self._gap_rules]
+        self._value_limits = [limit for limit, _ in self._value_rules]
+        self.matchers = {field: KeywordMatcher(words) for field, words in keywords_by_field.items()}
+
+        # Faixas da chave: todos os limites usados por alguma regra
+        self._gap_buckets = sorted({c[1] for c in self._conditions if c[1] is not None})
+        self._value_buckets = sorted({c[2] for c in self._conditions if c[2] is not None})
+
+    def init_app(self, app):
+        self.deterministic = app.config.get('ANALYSIS_DETERMINISTIC', self.deterministic)
+        self.memo.max_size = app.config.get('ANALYSIS_MEMO_SIZE', self.memo.max_size)
+        self.memo.path = app.config.get('ANALYSIS_MEMO_PATH', self.memo.path)
+        app.extensions['analysis'] = self
+        if self.memo.path:
+            self.memo.load(self.version)
+            atexit.register(self.memo.save, self.version)
+
+    def cache_key(self, features):
+        """Chave das entradas normalizadas: duas infrações com a mesma chave
+        disparam as mesmas regras"""
+        # Limites estritos: a faixa é quantos limites o valor ultrapassa
+        return json.dumps([
+            self.version,
+            {field: sorted(words) for field, words in sorted(features['keywords'].items())},
+            bisect.bisect_left(self._gap_buckets, features['days_gap']),
+            bisect.bisect_left(self._value_buckets, features['value'])
+        ], ensure_ascii=False, separators=(',', ':'))
+
+    def jitter(self, key):
+        if not self.deterministic:
+            return random.randint(*JITTER_RANGE)
+        seed = int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big')
+        return random.Random(seed).randint(*JITTER_RANGE)
+
+    def features(self, infraction_data):
+        """Extrai e normaliza as entradas usadas pelas regras"""
+        date_infraction = _as_datetime(infraction_data.get('date_infraction'))
+        date_notification = _as_datetime(infraction_data.get('date_notification'))
+
+        return {
+            'keywords': {
+                field: matcher.find(normalize_text(infraction_data.get(field)))
+                for field, matcher in self.matchers.items()
+            },
+            'days_gap': (date_notification - date_infraction).days,
+            'value': float(infraction_data.get('value', 0))
+        }
+
+    def matching_rules(self, features):
+        """Índices (em ordem da tabela) das regras satisfeitas"""
+        candidates = set()
+        for field, words in features['keywords'].items():
+            for word in words:
+                candidates.update(self._keyword_rules.get((field, word), ()))
+
+        # Limites estritos: dispara quando o valor é maior que o limite
+        gap_end = bisect.bisect_left(self._gap_limits, features['days_gap'])
+        candidates.update(index for _, index in self._gap_rules[:gap_end])
+        value_end = bisect.bisect_left(self._value_limits, features['value'])
+        candidates.update(index for _, index in self._value_rules[:value_end])
+
+        matched = []
+        for index in sorted(candidates):
+            keywords, days_gap_above, value_above = self._conditions[index]
+            if any(not (features['keywords'][field] & words) for field, words in keywords.items()):
+                continue
+            if days_gap_above is not None and not features['days_gap'] > days_gap_above:
+                continue
+            if value_above is not None and not features['value'] > value_above:
+                continue
+            matched.append(index)
+        return matched
+
+    def analyze(self, infraction_data):
+        return self.analyze_many([infraction_data])[0]
+
+    def analyze_many(self, infractions):
+        """Analisa uma lista de infrações (dicts com os campos do formulário)"""
+        results = []
+        for infraction_data in infractions:
+            features = self.features(infraction_data)
+            key = self.cache_key(features)
+
+            result = self.memo.get(key) if self.deterministic else None
+            if result is None:
+                result = self._evaluate(features, key)
+                if self.deterministic:
+                    self.memo.put(key, result)
+
+            results.append(dict(result, main_arguments=list(result['main_arguments'])))
+        return results
+
+    def _evaluate(self, features, key):
+        arguments = []
+        success_probability = 0
+        for index in self.matching_rules(features):
+            arguments.extend(self.rules[index]['arguments'])
+            success_probability += self.rules[index]['weight']
+        arguments.extend(self.general_arguments)
+
+        # Limitar probabilidade entre 15% e 95%
+        success_probability = min(MAX_PROBABILITY, max(
+            MIN_PROBABILITY, success_probability + self.jitter(key)
+        ))
+
+        return {
+            'success_probability': success_probability,
+            'legal_arguments': '; '.join(arguments),
+            'main_arguments': arguments[:3]  # Top 3 argumentos
+        }
+
+
+engine = RuleEngine(RULES, GENERAL_ARGUMENTS)
@@ -0,0 +1,167 @@
+"""
+Snapshot em memória do catálogo de contratos.
+
+O catálogo muda raramente, então as listagens públicas (/contracts,
+/categories) são servidas a partir de bytes JSON já serializados. O
+snapshot é reconstruído por inteiro quando algum Contract é inserido,
+alterado ou removido, e trocado atomicamente.
+
+Os fragmentos servidos trazem o popularity_score de quando o snapshot
+foi montado, mas o ETag é calculado sem ele (UNLISTED_FIELDS): as
+pontuações mudam a cada compra, e /popular soma as atuais. Os
+contadores de popularidade só invalidam o snapshot quando a ordem das
+listagens muda (ver services/popularity.py).
+"""
+import bisect
+import hashlib
+import json
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.models.contract import Contract
+
+EMPTY_LIST = b'[]\n'
+UNLISTED_FIELDS = ('popularity_score',)
+
+
+def _dumps(obj):
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def _as_body(fragments):
+    return b'[' + b','.join(fragments) + b']\n'
+
+
+class CatalogSnapshot:
+    """Visão imutável do catálogo com respostas pré-serializadas"""
+
+    def __init__(self, version, listings, categories, entries=None, contracts=None, scores=None,
+                 listed=None):
+        self.version = version
+        self.listings = listings  # (category, is_premium) -> bytes
+        self.entries = entries or {}  # (category, is_premium) -> ([chaves], [fragmentos])
+        self.contracts = contracts or {}  # id -> to_dict() dos contratos ativos
+        self.scores = scores or {}  # id -> popularity_score gravado quando o snapshot foi montado
+        self.categories = categories
+
+        # Identifica o conteúdo (e não a versão local do processo), para
+        # servir de validador de cache entre workers e reinícios. listed são
+        # os fragmentos sem UNLISTED_FIELDS, na ordem das listagens
+        digest = hashlib.sha1(categories)
+        if listed is None:
+            listed = [listings[key] for key in sorted(listings, key=repr)]
+        for fragment in listed:
+            digest.update(fragment)
+        self.digest = digest.hexdigest()
+
+    def listing(self, category=None, is_premium=None):
+        return self.listings.get((category, is_premium), EMPTY_LIST)
+
+    def page(self, category, is_premium, limit, after=None):
+        """Fatia da listagem após o cursor (popularity_score, id).
+
+        Retorna (bytes, valores do cursor seguinte ou None).
+        """
+        keys, fragments = self.entries.get((category, is_premium), ((), ()))
+        start = 0
+        if after is not None:
+            popularity_score, contract_id = after
+            start = bisect.bisect_right(keys, (-popularity_score, contract_id))
+
+        end = start + limit
+        if end >= len(keys):
+            return _as_body(fragments[start:]), None
+
+        negated_score, contract_id = keys[end - 1]
+        return _as_body(fragments[start:end]), (-negated_score, contract_id)
+
+
+class ContractCatalog:
+    """Mantém o snapshot atual e o reconstrói quando invalidado"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != self._version:
+                snapshot = self._build(self._version)
+                self._snapshot = snapshot
+            return snapshot
+
+    def _build(self, version):
+        contracts = Contract.query.order_by(Contract.id).all()
+
+        categories = []
+        for contract in contracts:
+            if contract.category not in categories:
+                categories.append(contract.category)
+
+        active = [c for c in contracts if c.is_active]
+        active.sort(key=lambda c: (-(c.popularity_score or 0), c.id))
+
+        entries = {}
+        contracts_by_id = {}
+        scores = {}
+        listed = []
+        for contract in active:
+            sort_key = (-(contract.popularity_score or 0), contract.id)
+            scores[contract.id] = contract.popularity_score or 0
+            data = contracts_by_id[contract.id] = contract.to_dict()
+            fragment = _dumps(data)
+            listed.append(_dumps({key: value for key, value in data.items() if key not in UNLISTED_FIELDS}))
+            premium = bool(contract.is_premium)
+            for key in ((None, None), (contract.category, None),
+                        (None, premium), (contract.category, premium)):
+                keys, fragments = entries.setdefault(key, ([], []))
+                keys.append(sort_key)
+                fragments.append(fragment)
+
+        listings = {key: _as_body(fragments) for key, (_, fragments) in entries.items()}
+
+        return CatalogSnapshot(
+            version=version,
+            listings=listings,
+            categories=_dumps(categories) + b'\n',
+            entries=entries,
+            contracts=contracts_by_id,
+            scores=scores,
+            listed=listed
+        )
+
+
+catalog = ContractCatalog()
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_contract_changes(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Contract):
+            session.info['catalog_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('catalog_changed', False):
+        catalog.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,45 @@
+"""
+GET condicional (ETag / If-None-Match) para os endpoints de leitura.
+
+Cada rota informa um validador barato: uma função que devolve as
+"versões" dos dados (updated_at, maior id, contagem...) sem montar a
+resposta. Se o ETag derivado delas já estiver com o cliente, devolvemos
+304 antes de qualquer to_dict().
+"""
+import hashlib
+from functools import wraps
+from flask import current_app, make_response, request, session
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def conditional(validator):
+    """Decora uma view GET com validação por ETag.
+
+    O validador recebe os mesmos argumentos da view e devolve uma tupla
+    com as versões dos dados, ou None para executar a view normalmente
+    (não autenticado, registro inexistente etc.).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = validator(*args, **kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag = make_etag(request.full_path, session.get('user_id'), tuple(version))
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
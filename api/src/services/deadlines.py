@@ -0,0 +1,190 @@
+"""
+Agendador dos avisos de prazo de contestação.
+
+Os prazos ficam em infraction.contest_deadline (indexado). O agendador
+mantém em memória um heap com os prazos da janela próxima, carregado por
+uma consulta de intervalo sobre o índice, nunca por varredura da tabela.
+Um thread dorme até o próximo aviso (prazo menos DEADLINE_NOTICE_DAYS) e
+dispara os handlers registrados com @deadline_scheduler.on_due.
+
+O aviso é reivindicado com um UPDATE condicional em deadline_notified_at,
+então cada prazo é avisado uma única vez, mesmo com vários processos ou
+após um reinício.
+"""
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from src.models.infraction import OPEN_STATUSES, Infraction, db
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineScheduler:
+    def __init__(self, notice_days=3, refresh_interval=3600, enabled=True):
+        self.notice = timedelta(days=notice_days)
+        self.refresh_interval = refresh_interval
+        self.enabled = enabled
+        self.handlers = []
+        self._app = None
+        self._heap = []        # [(momento do aviso, infraction_id, prazo)]
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._horizon = None
+
+    def init_app(self, app):
+        self._app = app
+        self.notice = timedelta(days=app.config.get('DEADLINE_NOTICE_DAYS', self.notice.days))
+        self.refresh_interval = app.config.get('DEADLINE_REFRESH_INTERVAL', self.refresh_interval)
+        self.enabled = app.config.get('DEADLINE_SCHEDULER', self.enabled)
+        app.extensions['deadlines'] = self
+        app.before_request(self.ensure_started)
+
+    def on_due(self, fn):
+        """Registra um handler chamado com a infração cujo prazo se aproxima"""
+        self.handlers.append(fn)
+        return fn
+
+    def ensure_started(self):
+        if self._thread is not None or not self.enabled or self._app is None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='deadline-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def track(self, infraction_id, deadline):
+        """Agenda um prazo novo ou alterado, se cair na janela carregada"""
+        if deadline is None or self._horizon is None or deadline > self._horizon:
+            return
+        if deadline < datetime.utcnow():
+            return
+        with self._lock:
+            self._push(infraction_id, deadline)
+        self._wakeup.set()
+
+    def _push(self, infraction_id, deadline):
+        if (infraction_id, deadline) in self._scheduled:
+            return
+        self._scheduled.add((infraction_id, deadline))
+        heapq.heappush(self._heap, (deadline - self.notice, infraction_id, deadline))
+
+    def refresh(self, now=None):
+        """Carrega os prazos abertos até o fim da próxima janela (consulta por intervalo)"""
+        now = now or datetime.utcnow()
+        horizon = now + self.notice + timedelta(seconds=self.refresh_interval)
+        rows = db.session.query(Infraction.id, Infraction.contest_deadline).filter(
+            Infraction.contest_deadline >= now,
+            Infraction.contest_deadline <= horizon,
+            Infraction.status.in_(OPEN_STATUSES),
+            Infraction.deadline_notified_at.is_(None)
+        ).all()
+        db.session.commit()
+
+        with self._lock:
+            for infraction_id, deadline in rows:
+                self._push(infraction_id, deadline)
+            self._horizon = horizon
+        return len(rows)
+
+    def next_wakeup(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def fire_due(self, now=None):
+        """Dispara os avisos vencidos; devolve quantos foram disparados"""
+        now = now or datetime.utcnow()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, infraction_id, deadline = heapq.heappop(self._heap)
+                self._scheduled.discard((infraction_id, deadline))
+                due.append((infraction_id, deadline))
+
+        fired = 0
+        for infraction_id, deadline in due:
+            if self._claim(infraction_id, deadline, now):
+                fired += 1
+                infraction = db.session.get(Infraction, infraction_id)
+                for handler in self.handlers:
+                    try:
+                        handler(infraction)
+                    except Exception:
+                        logger.exception('Falha no aviso de prazo da infração %s', infraction_id)
+        return fired
+
+    def _claim(self, infraction_id, deadline, now):
+        # Prazo alterado, infração já contestada ou aviso dado por outro processo: ignora
+        table = Infraction.__table__
+        result = db.session.execute(
+            table.update().where(
+                table.c.id == infraction_id,
+                table.c.contest_deadline == deadline,
+                table.c.status.in_(OPEN_STATUSES),
+                table.c.deadline_notified_at.is_(None)
+            ).values(deadline_notified_at=now)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _run(self):
+        next_refresh = datetime.utcnow()
+        while not self._stop.is_set():
+            with self._app.app_context():
+                try:
+                    if datetime.utcnow() >= next_refresh:
+                        self.refresh()
+                        next_refresh = datetime.utcnow() + timedelta(seconds=self.refresh_interval)
+                    self.fire_due()
+                except Exception:
+                    logger.exception('Falha no agendador de prazos')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+            wake_at = min(filter(None, [self.next_wakeup(), next_refresh]))
+            timeout = max((wake_at - datetime.utcnow()).total_seconds(), 0.1)
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+
+deadline_scheduler = DeadlineScheduler()
+
+
+@deadline_scheduler.on_due
+def _log_due_deadline(infraction):
+    logger.info('Prazo de contestação se aproximando: infração %s (usuário %s) vence em %s',
+                infraction.id, infraction.user_id, infraction.contest_deadline.isoformat())
+
+
+@event.listens_for(Infraction, 'after_insert')
+@event.listens_for(Infraction, 'after_update')
+def _track_deadline_changes(mapper, connection, target):
+    session = object_session(target)
+    if session is not None and target.status in OPEN_STATUSES:
+        session.info.setdefault('deadlines_changed', []).append((target.id, target.contest_deadline))
+
+
+@event.listens_for(Session, 'after_commit')
+def _schedule_on_commit(session):
+    for infraction_id, deadline in session.info.pop('deadlines_changed', ()):
+        deadline_scheduler.track(infraction_id, deadline)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('deadlines_changed', None)
@@ -0,0 +1,110 @@
+"""
+Armazenamento endereçado por conteúdo dos documentos de contestação.
+
+A chave de um documento é o hash das entradas que o produzem (dados da
+infração, argumentos e versão do modelo). O texto é gravado uma única
+vez em CONTEST_DOCUMENTS_DIR, junto com uma variante gzip, e depois só é
+servido: nenhum download gera o documento de novo. Como a chave muda
+sempre que uma entrada muda, não existe invalidação a fazer.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from flask import request, send_file
+from src.models.user import db
+
+# Incrementar quando o texto de generate_contest_document mudar
+TEMPLATE_VERSION = 1
+
+
+def document_key(infraction):
+    """Hash das entradas do documento de contestação da infração"""
+    inputs = [
+        TEMPLATE_VERSION,
+        infraction.issuing_agency,
+        infraction.notification_number,
+        infraction.vehicle_plate,
+        infraction.date_infraction.isoformat() if infraction.date_infraction else None,
+        infraction.infraction_type,
+        infraction.value,
+        infraction.legal_arguments
+    ]
+    payload = json.dumps(inputs, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DocumentStore:
+    def __init__(self, root=None):
+        self._root = root
+
+    def init_app(self, app):
+        self._root = app.config.get('CONTEST_DOCUMENTS_DIR') or self._root
+        app.extensions['documents'] = self
+
+    @property
+    def root(self):
+        if self._root:
+            return self._root
+        # Padrão: ao lado do banco, no mesmo volume persistente
+        database = db.engine.url.database
+        return os.path.join(os.path.dirname(database) if database else '.', 'documents')
+
+    def path(self, key, compressed=False):
+        return os.path.join(self.root, key[:2], f'{key}.txt' + ('.gz' if compressed else ''))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key)) and os.path.exists(self.path(key, compressed=True))
+
+    def put(self, key, text):
+        """Grava o documento (texto e gzip) se ainda não existir"""
+        if self.exists(key):
+            return False
+
+        data = text.encode('utf-8')
+        # mtime=0: o gzip do mesmo conteúdo é sempre idêntico
+        self._write(self.path(key), data)
+        self._write(self.path(key, compressed=True), gzip.compress(data, mtime=0))
+        return True
+
+    def read(self, key):
+        with open(self.path(key), encoding='utf-8') as handle:
+            return handle.read()
+
+    def send(self, key, download_name):
+        """Resposta com ETag, Range e a variante gzip quando o cliente aceita"""
+        compressed = 'gzip' in request.accept_encodings
+        response = send_file(
+            self.path(key, compressed=compressed),
+            mimetype='text/plain',
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=f'{key}-gz' if compressed else key,
+            max_age=0
+        )
+        if compressed:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        response.vary.add('Accept-Encoding')
+        # O conteúdo de uma chave nunca muda
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+    @staticmethod
+    def _write(path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Escrita atômica: quem lê nunca vê um arquivo pela metade
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                output.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+document_store = DocumentStore()
@@ -0,0 +1,126 @@
+"""
+Usuário atual e direitos de acesso (premium) com cache.
+
+- current_user(): carrega o User da sessão uma única vez por requisição
+  (guardado em flask.g), para as rotas que precisam do objeto;
+- current_entitlement(): o que as verificações de acesso precisam
+  (ativo, premium, fim da assinatura vigente), servido por um cache em
+  memória compartilhado entre requisições, com validade de
+  ENTITLEMENT_CACHE_TTL segundos.
+
+O cache é invalidado no commit de qualquer alteração em User, Payment ou
+Subscription feita pelo ORM, e explicitamente por quem altera essas
+tabelas com UPDATE em lote (varredor de assinaturas). Entre processos, a
+defasagem máxima é o TTL.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import g, has_request_context, session
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, object_session
+from src.models.payment import CURRENT_SUBSCRIPTION_STATUSES, Payment, Subscription
+from src.models.user import User, db
+
+Entitlement = namedtuple('Entitlement', 'user_id is_active is_premium subscription_end')
+
+
+class EntitlementCache:
+    def __init__(self, ttl=30.0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user_id -> (expira em, Entitlement)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('ENTITLEMENT_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('ENTITLEMENT_CACHE_SIZE', self.max_size)
+        app.extensions['entitlements'] = self
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        entitlement = self.load(user_id)
+        if entitlement is not None and self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, entitlement)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return entitlement
+
+    def load(self, user_id):
+        subscription_end = select(func.max(Subscription.end_date)).where(
+            Subscription.user_id == user_id,
+            Subscription.status.in_(CURRENT_SUBSCRIPTION_STATUSES)
+        ).scalar_subquery()
+        row = db.session.execute(
+            select(User.is_active, User.is_premium, subscription_end).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        return Entitlement(user_id, bool(row[0]), bool(row[1]), row[2])
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+entitlements = EntitlementCache()
+
+
+def current_user():
+    """User da sessão, carregado no máximo uma vez por requisição (None se não houver)"""
+    if 'user_id' not in session:
+        return None
+    if '_current_user' not in g:
+        g._current_user = db.session.get(User, session['user_id'])
+    return g._current_user
+
+
+def current_entitlement():
+    """Direitos do usuário da sessão, pelo cache (None se não houver)"""
+    if 'user_id' not in session:
+        return None
+    if '_current_entitlement' not in g:
+        g._current_entitlement = entitlements.get(session['user_id'])
+    return g._current_entitlement
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+@event.listens_for(Payment, 'after_insert')
+@event.listens_for(Payment, 'after_update')
+@event.listens_for(Subscription, 'after_insert')
+@event.listens_for(Subscription, 'after_update')
+@event.listens_for(Subscription, 'after_delete')
+def _track_entitlement_changes(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        user_id = target.id if isinstance(target, User) else target.user_id
+        session.info.setdefault('entitlements_changed', set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    changed = session.info.pop('entitlements_changed', ())
+    if changed:
+        entitlements.invalidate(*changed)
+        if has_request_context():
+            g.pop('_current_entitlement', None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('entitlements_changed', None)
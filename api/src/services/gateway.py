@@ -0,0 +1,211 @@
+"""
+Cliente do gateway de pagamento (PSP).
+
+As rotas de pagamento falam com `gateway`, que delega a um adaptador
+escolhido por PAYMENT_GATEWAY:
+
+- 'simulated' (padrão): aprovação local, como os stubs de antes;
+- 'http': PSP via HTTP, com requests.Session compartilhada (pool de
+  conexões com keep-alive), timeout de conexão e de leitura por chamada,
+  novas tentativas limitadas com espera exponencial e jitter, e um
+  circuit breaker que falha na hora enquanto o PSP está fora.
+
+As novas tentativas reenviam a mesma Idempotency-Key (o transaction_id
+do pagamento), então o PSP não cobra duas vezes.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """Falha ao falar com o gateway de pagamento"""
+
+
+class GatewayUnavailable(GatewayError):
+    """Gateway fora do ar ou circuito aberto: tentar mais tarde"""
+
+
+class CircuitBreaker:
+    """Abre após failure_threshold falhas seguidas; após reset_timeout deixa
+    passar uma chamada de teste (meio aberto) antes de fechar de novo"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                return True
+            # Aberto, ou meio aberto com a chamada de teste já em andamento
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning('Circuito do gateway aberto após %s falhas', self._failures)
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class SimulatedGateway:
+    """Aprovação local, para desenvolvimento e demonstração"""
+
+    def charge_pix(self, amount, pix_key, reference):
+        # Simula aprovação automática para demonstração
+        return {
+            'status': 'approved',
+            'transaction_id': f"PIX_{uuid.uuid4().hex[:12].upper()}",
+            'message': 'Pagamento PIX aprovado com sucesso'
+        }
+
+    def charge_card(self, amount, card, reference):
+        # Simula aprovação com 90% de chance
+        if random.random() > 0.1:
+            return {
+                'status': 'approved',
+                'transaction_id': f"CARD_{uuid.uuid4().hex[:12].upper()}",
+                'message': 'Pagamento aprovado com sucesso'
+            }
+        return {
+            'status': 'rejected',
+            'transaction_id': None,
+            'message': 'Pagamento rejeitado - verifique os dados do cartão'
+        }
+
+
+class HttpGateway:
+    RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(self, base_url, api_key=None, connect_timeout=3.0, read_timeout=10.0,
+                 max_retries=2, backoff=0.2, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        # Tentativas ficam por nossa conta (com jitter e circuit breaker)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+    def charge_pix(self, amount, pix_key, reference):
+        return self._post('/pix', {'amount': amount, 'pix_key': pix_key}, reference)
+
+    def charge_card(self, amount, card, reference):
+        return self._post('/card', {'amount': amount, 'card': card}, reference)
+
+    def _post(self, path, payload, reference):
+        if not self.breaker.allow():
+            raise GatewayUnavailable('Gateway de pagamento indisponível (circuito aberto)')
+
+        # Toda saída registra sucesso ou falha: a chamada de teste do circuito
+        # meio aberto sempre é resolvida
+        succeeded = False
+        try:
+            response = self._send(path, payload, reference)
+            # 402: pagamento recusado, com o resultado no corpo
+            if response.status_code >= 400 and response.status_code != 402:
+                succeeded = True
+                raise GatewayError(f'Gateway recusou a requisição ({response.status_code})')
+            try:
+                result = response.json()
+            except ValueError as e:
+                raise GatewayError('Resposta inválida do gateway de pagamento') from e
+            succeeded = True
+            return result
+        finally:
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def _send(self, path, payload, reference):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    self.base_url + path,
+                    json=payload,
+                    headers={'Idempotency-Key': reference},
+                    timeout=self.timeout
+                )
+                error = None
+                if response.status_code in self.RETRY_STATUSES or response.status_code >= 500:
+                    error = GatewayError(f'Gateway respondeu {response.status_code}')
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except requests.RequestException as e:
+                raise GatewayError(f'Falha na requisição ao gateway de pagamento: {e}') from e
+
+            if error is None:
+                return response
+
+            if attempt >= self.max_retries:
+                raise GatewayUnavailable(f'Gateway de pagamento indisponível: {error}') from error
+
+            # Espera exponencial com jitter completo
+            attempt += 1
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+
+class PaymentGateway:
+    """Ponto de acesso das rotas ao adaptador configurado"""
+
+    def __init__(self, adapter=None):
+        self.adapter = adapter or SimulatedGateway()
+
+    def init_app(self, app):
+        kind = app.config.get('PAYMENT_GATEWAY', 'simulated')
+        if kind == 'http':
+            self.adapter = HttpGateway(
+                app.config['PAYMENT_GATEWAY_URL'],
+                api_key=app.config.get('PAYMENT_GATEWAY_API_KEY'),
+                connect_timeout=app.config.get('PAYMENT_GATEWAY_CONNECT_TIMEOUT', 3.0),
+                read_timeout=app.config.get('PAYMENT_GATEWAY_READ_TIMEOUT', 10.0),
+                max_retries=app.config.get('PAYMENT_GATEWAY_RETRIES', 2),
+                pool_size=app.config.get('PAYMENT_GATEWAY_POOL_SIZE', 10),
+                breaker=CircuitBreaker(
+                    failure_threshold=app.config.get('PAYMENT_GATEWAY_BREAKER_THRESHOLD', 5),
+                    reset_timeout=app.config.get('PAYMENT_GATEWAY_BREAKER_RESET', 30.0)
+                )
+            )
+        elif kind == 'simulated':
+            self.adapter = SimulatedGateway()
+        else:
+            raise ValueError(f'PAYMENT_GATEWAY desconhecido: {kind}')
+        app.extensions['payment_gateway'] = self
+
+    def charge_pix(self, amount, pix_key, reference):
+        return self.adapter.charge_pix(amount, pix_key, reference)
+
+    def charge_card(self, amount, card, reference):
+        return self.adapter.charge_card(amount, card, reference)
+
+
+gateway = PaymentGateway()
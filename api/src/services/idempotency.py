@@ -0,0 +1,191 @@
+"""
+Idempotency-Key para os endpoints de pagamento.
+
+A primeira requisição com uma chave reserva a linha (user_id, key) em
+idempotency_record, executa a view e grava a resposta. Repetições:
+
+- com a resposta já gravada: recebem a mesma resposta, sem chamar o
+  gateway nem ativar o plano de novo (Idempotent-Replayed: true);
+- enquanto a primeira ainda executa: esperam por ela (evento em memória
+  no mesmo processo, consulta periódica ao banco entre processos);
+- com a mesma chave e outro corpo: 422.
+
+Três transações curtas: a reserva é gravada antes da view, a view grava
+os próprios efeitos com o commit dela, e a resposta é gravada depois,
+numa transação à parte, pelo id da reserva. A reserva vale por
+IDEMPOTENCY_LEASE segundos; uma reserva mais antiga que isso, ainda sem
+resposta, é de um worker que morreu e pode ser assumida por uma nova
+tentativa (a dona original, se terminar depois, não grava a resposta).
+
+Como a view pode rodar de novo depois de ter gravado seus efeitos (queda
+antes de gravar a resposta, ou resposta 5xx, que não é gravada), as
+views de pagamento derivam da chave o transaction_id enviado ao PSP e
+reaproveitam o pagamento já gravado (ver routes/payment.py). Os
+registros expiram após IDEMPOTENCY_TTL segundos.
+"""
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, jsonify, make_response, request, session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.idempotency import IdempotencyRecord, db
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL = 24 * 3600
+DEFAULT_LEASE = 120
+DEFAULT_WAIT_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+PURGE_INTERVAL = 300
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def request_fingerprint():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _reserve(user_id, key, fingerprint, ttl, lease):
+    """Tenta reservar a chave; devolve o id da reserva se esta requisição é a dona"""
+    table = IdempotencyRecord.__table__
+    now = datetime.utcnow()
+    # Chave expirada pode ser reutilizada; reserva sem resposta além do prazo
+    # é de um worker que morreu
+    db.session.execute(table.delete().where(
+        table.c.user_id == user_id,
+        table.c.key == key,
+        (table.c.expires_at < now) | (
+            (table.c.status == 'in_progress') & (table.c.created_at < now - timedelta(seconds=lease))
+        )
+    ))
+    result = db.session.execute(sqlite_insert(table).values(
+        user_id=user_id,
+        key=key,
+        request_hash=fingerprint,
+        status='in_progress',
+        created_at=now,
+        expires_at=now + timedelta(seconds=ttl)
+    ).on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.key]))
+    db.session.commit()
+    return result.inserted_primary_key[0] if result.rowcount == 1 else None
+
+
+def _load(user_id, key):
+    record = IdempotencyRecord.query.filter_by(user_id=user_id, key=key).first()
+    db.session.commit()  # encerra a transação de leitura para ver o próximo commit
+    return record
+
+
+def _replay(record):
+    response = current_app.response_class(
+        record.response_body,
+        status=record.response_status,
+        mimetype=record.response_mimetype
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _purge_expired():
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    table = IdempotencyRecord.__table__
+    db.session.execute(table.delete().where(table.c.expires_at < datetime.utcnow()))
+    db.session.commit()
+
+
+def idempotent(view):
+    """Decora uma view POST para honrar o cabeçalho Idempotency-Key"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or 'user_id' not in session:
+            return view(*args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} deve ter no máximo {MAX_KEY_LENGTH} caracteres'}), 400
+
+        user_id = session['user_id']
+        fingerprint = request_fingerprint()
+        ttl = current_app.config.get('IDEMPOTENCY_TTL', DEFAULT_TTL)
+        lease = current_app.config.get('IDEMPOTENCY_LEASE', DEFAULT_LEASE)
+        deadline = time.monotonic() + current_app.config.get('IDEMPOTENCY_WAIT_TIMEOUT', DEFAULT_WAIT_TIMEOUT)
+        _purge_expired()
+
+        while True:
+            record_id = _reserve(user_id, key, fingerprint, ttl, lease)
+            if record_id is not None:
+                return _execute(view, args, kwargs, user_id, key, record_id)
+
+            record = _load(user_id, key)
+            if record is None:
+                continue  # a dona falhou e liberou a chave: tenta reservar de novo
+            if record.request_hash != fingerprint:
+                return jsonify({'error': f'{HEADER} já usada com outra requisição'}), 422
+            if record.status == 'completed':
+                return _replay(record)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return jsonify({'error': 'Requisição com esta chave ainda em processamento'}), 409
+
+            with _inflight_lock:
+                event = _inflight.get((user_id, key))
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(POLL_INTERVAL, remaining))
+
+    return wrapper
+
+
+def _execute(view, args, kwargs, user_id, key, record_id):
+    event = threading.Event()
+    with _inflight_lock:
+        _inflight[(user_id, key)] = event
+
+    table = IdempotencyRecord.__table__
+    # Pelo id: se a reserva foi assumida por outra tentativa, não é mais nossa
+    owned = table.c.id == record_id
+    try:
+        response = make_response(view(*args, **kwargs))
+        # O que a view não gravou não faz parte da resposta
+        db.session.rollback()
+
+        if response.status_code >= 500:
+            db.session.execute(table.delete().where(owned))
+            db.session.commit()
+            return response
+
+        result = db.session.execute(table.update().where(owned, table.c.status == 'in_progress').values(
+            status='completed',
+            response_status=response.status_code,
+            response_body=response.get_data(as_text=True),
+            response_mimetype=response.mimetype
+        ))
+        db.session.commit()
+        if result.rowcount != 1:
+            # Reserva assumida após o prazo: a outra tentativa grava a resposta dela
+            logger.warning('Reserva de %s assumida por outra tentativa; resposta não gravada', HEADER)
+        return response
+    except BaseException:
+        db.session.rollback()
+        db.session.execute(table.delete().where(owned))
+        db.session.commit()
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop((user_id, key), None)
+        event.set()
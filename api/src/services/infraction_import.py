@@ -0,0 +1,197 @@
+"""
+Importação em lote de infrações (CSV ou NDJSON).
+
+O arquivo é lido linha a linha, sem carregar o corpo inteiro em memória,
+e processado em blocos: cada bloco é validado, tem as duplicatas
+descartadas com uma única consulta, é analisado pelo motor de regras e
+inserido em uma única transação. Uma duplicata gravada por outra
+requisição depois da consulta é descartada pelo próprio INSERT (ON
+CONFLICT DO NOTHING) e também sai no relatório como duplicata.
+"""
+import csv
+import io
+import itertools
+import json
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.infraction import (
+    SUMMARY_COLUMNS, Infraction, apply_summary_delta, contest_deadline_for, db, normalize_plate,
+    summary_delta
+)
+from src.services.analysis import engine as analysis_engine
+from src.services.deadlines import deadline_scheduler
+
+REQUIRED_FIELDS = ['notification_number', 'infraction_type', 'value',
+                   'date_infraction', 'date_notification', 'vehicle_plate',
+                   'location', 'issuing_agency']
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_CHUNK_SIZE = 2000
+
+
+def missing_field(data):
+    for field in REQUIRED_FIELDS:
+        if not data.get(field):
+            return field
+    return None
+
+
+def infraction_fields(data, user_id):
+    """Valores das colunas de uma nova infração a partir dos dados recebidos"""
+    date_notification = datetime.fromisoformat(data['date_notification'])
+    return {
+        'user_id': user_id,
+        'notification_number': str(data['notification_number']),
+        'infraction_type': data['infraction_type'],
+        'value': float(data['value']),
+        'date_infraction': datetime.fromisoformat(data['date_infraction']),
+        'date_notification': date_notification,
+        'contest_deadline': contest_deadline_for(date_notification),
+        'vehicle_plate': data['vehicle_plate'],
+        'plate_normalized': normalize_plate(data['vehicle_plate']),
+        'vehicle_model': data.get('vehicle_model') or None,
+        'location': data['location'],
+        'issuing_agency': data['issuing_agency'],
+        'notification_file': data.get('notification_file') or None
+    }
+
+
+def read_csv(text):
+    header = text.readline()
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    reader = csv.DictReader(itertools.chain([header], text), delimiter=delimiter)
+    for row_number, row in enumerate(reader, start=1):
+        yield row_number, {key.strip(): (value or '').strip() for key, value in row.items() if key}
+
+
+def read_ndjson(text):
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield row_number, None
+            continue
+        yield row_number, data if isinstance(data, dict) else None
+
+
+def read_rows(stream, content_type):
+    """Itera (número da linha, dict) a partir de um stream binário"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if 'csv' in content_type:
+        return read_csv(text)
+    return read_ndjson(text)
+
+
+def import_chunk(user_id, chunk, report):
+    """Valida, remove duplicatas, analisa e insere um bloco em uma transação"""
+    accepted = []
+    for row_number, data in chunk:
+        if data is None:
+            report.append({'row': row_number, 'status': 'error', 'error': 'Linha inválida'})
+            continue
+
+        field = missing_field(data)
+        if field:
+            report.append({'row': row_number, 'status': 'error',
+                           'error': f'Campo {field} é obrigatório'})
+            continue
+
+        try:
+            fields = infraction_fields(data, user_id)
+        except (TypeError, ValueError) as e:
+            report.append({'row': row_number, 'status': 'error', 'error': str(e)})
+            continue
+
+        accepted.append((row_number, fields))
+
+    numbers = {fields['notification_number'] for _, fields in accepted}
+    existing = set(db.session.scalars(
+        db.select(Infraction.notification_number).where(
+            Infraction.user_id == user_id,
+            Infraction.notification_number.in_(numbers)
+        )
+    )) if numbers else set()
+
+    new_rows = []
+    for row_number, fields in accepted:
+        number = fields['notification_number']
+        if number in existing:
+            report.append({'row': row_number, 'status': 'duplicate', 'notification_number': number})
+            continue
+        existing.add(number)
+        new_rows.append((row_number, fields))
+
+    if not new_rows:
+        return 0
+
+    analyses = analysis_engine.analyze_many([fields for _, fields in new_rows])
+
+    values = []
+    for (_, fields), analysis in zip(new_rows, analyses):
+        values.append(dict(
+            fields,
+            success_probability=analysis['success_probability'],
+            legal_arguments=analysis['legal_arguments'],
+            status='analyzed'
+        ))
+
+    table = Infraction.__table__
+    inserted = dict(db.session.execute(
+        sqlite_insert(table).on_conflict_do_nothing(
+            index_elements=[table.c.user_id, table.c.notification_number]
+        ).returning(table.c.notification_number, table.c.id),
+        values
+    ).all())
+
+    # O INSERT em lote não passa pelos eventos do ORM: atualiza o resumo aqui
+    delta = dict.fromkeys(SUMMARY_COLUMNS, 0)
+    for row in values:
+        if row['notification_number'] not in inserted:
+            continue
+        for column, amount in summary_delta(row['status'], row['value'], row['success_probability']).items():
+            delta[column] += amount
+    apply_summary_delta(db.session.connection(), user_id, delta)
+    db.session.commit()
+
+    for (row_number, fields), analysis in zip(new_rows, analyses):
+        number = fields['notification_number']
+        infraction_id = inserted.get(number)
+        if infraction_id is None:
+            # Gravada por outra requisição entre a consulta e o INSERT
+            report.append({'row': row_number, 'status': 'duplicate', 'notification_number': number})
+            continue
+        deadline_scheduler.track(infraction_id, fields['contest_deadline'])
+        report.append({
+            'row': row_number,
+            'status': 'created',
+            'id': infraction_id,
+            'notification_number': number,
+            'success_probability': analysis['success_probability']
+        })
+    return len(inserted)
+
+
+def import_infractions(user_id, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Importa as linhas em blocos de chunk_size e devolve o relatório por linha"""
+    report = []
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            break
+        try:
+            import_chunk(user_id, chunk, report)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    report.sort(key=lambda entry: entry['row'])
+    return {
+        'total': len(report),
+        'created': sum(1 for entry in report if entry['status'] == 'created'),
+        'duplicates': sum(1 for entry in report if entry['status'] == 'duplicate'),
+        'errors': sum(1 for entry in report if entry['status'] == 'error'),
+        'rows': report
+    }
@@ -0,0 +1,271 @@
+"""
+Fila de tarefas em segundo plano, persistida na tabela job.
+
+As rotas enfileiram o trabalho pesado (análise, reanálise, geração do
+documento de contestação) na mesma transação em que gravam os dados e
+respondem 202 na hora. Threads de trabalho reivindicam as tarefas com um
+UPDATE ... RETURNING atômico, o que também funciona com vários processos
+apontando para o mesmo banco.
+
+Garantias:
+
+- a tarefa sobrevive a reinícios: uma tarefa 'running' cujo processo
+  morreu volta para a fila quando a trava expira (JOBS_LOCK_TIMEOUT);
+- o efeito do handler e a conclusão da tarefa são gravados no mesmo
+  commit, então uma nova tentativa nunca vê um trabalho pela metade;
+- falhas são repetidas com espera exponencial até max_attempts;
+  JobError encerra a tarefa sem novas tentativas.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import jsonify, request
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from src.models.job import Job, db
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobError(Exception):
+    """Falha definitiva: a tarefa não será repetida"""
+
+
+def prefers_async():
+    """O cliente pediu processamento assíncrono (Prefer: respond-async)?"""
+    return 'respond-async' in request.headers.get('Prefer', '').lower()
+
+
+def accepted_response(job, message, **extra):
+    """Resposta 202 apontando para o endpoint de acompanhamento da tarefa"""
+    response = jsonify({'message': message, 'job': job.to_dict(), **extra})
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    response.headers['Preference-Applied'] = 'respond-async'
+    return response
+
+
+class JobQueue:
+    def __init__(self, workers=2, poll_interval=1.0, lock_timeout=300, max_attempts=3):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self._app = None
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._identity = f'{socket.gethostname()}:{os.getpid()}'
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = app.config.get('JOBS_WORKERS', self.workers)
+        self.poll_interval = app.config.get('JOBS_POLL_INTERVAL', self.poll_interval)
+        self.lock_timeout = app.config.get('JOBS_LOCK_TIMEOUT', self.lock_timeout)
+        self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', self.max_attempts)
+        app.extensions['jobs'] = self
+        # As threads só sobem quando a aplicação atende requisições,
+        # não em comandos como `flask init-db`
+        app.before_request(self.ensure_started)
+
+    def handler(self, kind):
+        """Registra a função que executa as tarefas do tipo kind"""
+        def decorator(fn):
+            self.handlers[kind] = fn
+            return fn
+        return decorator
+
+    def enqueue(self, kind, payload, user_id=None, dedupe_key=None):
+        """Adiciona a tarefa à sessão atual; ela é gravada no commit do chamador.
+
+        Com dedupe_key, uma tarefa igual ainda pendente é reaproveitada.
+        """
+        if dedupe_key:
+            existing = Job.query.filter(
+                Job.dedupe_key == dedupe_key,
+                Job.status.in_(ACTIVE_STATUSES)
+            ).first()
+            if existing:
+                return existing
+
+        job = Job(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            kind=kind,
+            payload=json.dumps(payload),
+            dedupe_key=dedupe_key,
+            status='queued',
+            attempts=0,
+            max_attempts=self.max_attempts,
+            run_after=datetime.utcnow()
+        )
+        db.session.add(job)
+        db.session.info['jobs_enqueued'] = True
+        return job
+
+    def notify(self):
+        self.ensure_started()
+        self._wakeup.set()
+
+    def ensure_started(self):
+        if self._threads or self.workers <= 0 or self._app is None:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def requeue_stale(self):
+        """Devolve à fila tarefas 'running' de processos que morreram"""
+        table = Job.__table__
+        deadline = datetime.utcnow() - timedelta(seconds=self.lock_timeout)
+        result = db.session.execute(
+            table.update().where(
+                table.c.status == 'running',
+                table.c.locked_at < deadline
+            ).values(status='queued', locked_by=None, locked_at=None, updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def claim(self):
+        """Reivindica a próxima tarefa vencida; devolve o id ou None"""
+        table = Job.__table__
+        while True:
+            now = datetime.utcnow()
+            # Leitura primeiro: com a fila vazia o worker não disputa a trava de escrita
+            candidate = db.session.execute(
+                select(table.c.id).where(
+                    table.c.status == 'queued',
+                    table.c.run_after <= now
+                ).order_by(table.c.run_after).limit(1)
+            ).scalar()
+            if candidate is None:
+                db.session.commit()
+                return None
+
+            job_id = db.session.execute(
+                table.update().where(
+                    table.c.id == candidate,
+                    table.c.status == 'queued'
+                ).values(
+                    status='running',
+                    locked_by=self._identity,
+                    locked_at=now,
+                    attempts=table.c.attempts + 1,
+                    updated_at=now
+                ).returning(table.c.id)
+            ).scalar()
+            db.session.commit()
+            if job_id is not None:
+                return job_id
+            # Outro worker levou a tarefa; tenta a próxima
+
+    def run(self, job_id):
+        """Executa uma tarefa já reivindicada"""
+        job = db.session.get(Job, job_id)
+        handler = self.handlers.get(job.kind)
+
+        try:
+            if handler is None:
+                raise JobError(f'Tipo de tarefa desconhecido: {job.kind}')
+            result = handler(json.loads(job.payload or '{}'), job)
+
+            job.status = 'succeeded'
+            job.result = json.dumps(result, ensure_ascii=False) if result is not None else None
+            job.error = None
+            job.finished_at = datetime.utcnow()
+            job.locked_by = job.locked_at = None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._record_failure(job_id, e)
+
+    def _record_failure(self, job_id, error):
+        job = db.session.get(Job, job_id)
+        now = datetime.utcnow()
+        job.error = str(error) or error.__class__.__name__
+        job.locked_by = job.locked_at = None
+
+        if isinstance(error, JobError) or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = now
+            logger.error('Tarefa %s (%s) falhou: %s', job.id, job.kind, job.error)
+        else:
+            job.status = 'queued'
+            job.run_after = now + timedelta(seconds=2 ** job.attempts)
+            logger.warning('Tarefa %s (%s) será repetida: %s', job.id, job.kind, job.error)
+        db.session.commit()
+
+    def run_pending(self):
+        """Executa, no thread atual, todas as tarefas vencidas"""
+        executed = 0
+        while True:
+            job_id = self.claim()
+            if job_id is None:
+                return executed
+            self.run(job_id)
+            executed += 1
+
+    def _work(self):
+        with self._app.app_context():
+            try:
+                self.requeue_stale()
+            except Exception:
+                logger.exception('Falha ao recuperar tarefas pendentes')
+            finally:
+                db.session.remove()
+
+        last_requeue = time.monotonic()
+        while not self._stop.is_set():
+            with self._app.app_context():
+                try:
+                    job_id = self.claim()
+                    if job_id is not None:
+                        self.run(job_id)
+                        continue
+                    if time.monotonic() - last_requeue >= self.lock_timeout:
+                        last_requeue = time.monotonic()
+                        self.requeue_stale()
+                except Exception:
+                    logger.exception('Falha no worker de tarefas')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+job_queue = JobQueue()
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers_on_commit(session):
+    if session.info.pop('jobs_enqueued', False):
+        job_queue.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('jobs_enqueued', None)
@@ -0,0 +1,29 @@
+"""
+Trava entre processos para tarefas de inicialização.
+
+Vários workers podem subir ao mesmo tempo; a trava (flock em um arquivo
+ao lado do banco SQLite) garante que migrações e carga do catálogo
+rodem em um processo por vez.
+"""
+from contextlib import contextmanager
+from src.models.user import db
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextmanager
+def process_lock(name):
+    database = db.engine.url.database
+    if fcntl is None or not database or database == ':memory:':
+        yield
+        return
+
+    with open(f'{database}.{name}.lock', 'w') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
@@ -0,0 +1,157 @@
+"""
+Conteúdo de contratos adquiridos como camada sobre o modelo base.
+
+Em vez de copiar o texto inteiro do contrato para cada comprador, o
+UserContract guarda a versão do modelo, os valores dos campos
+([NOME_LOCADOR] -> "Fulano") e um diff compacto com as edições livres.
+O texto final é montado só quando pedido (/my-contracts/<id> e
+/download).
+
+O diff é uma lista de operações [inicio, fim, texto] sobre o texto do
+modelo base: o trecho base[inicio:fim] é substituído por texto. Trechos
+iguais não são armazenados.
+"""
+import difflib
+import json
+from functools import lru_cache
+from src.models.contract import ContractVersion
+from src.services.templates import PLACEHOLDER, compile_template
+
+
+def compute_diff(base, text):
+    """Operações que transformam base em text, comparando por linha"""
+    base_lines = base.splitlines(keepends=True)
+    text_lines = text.splitlines(keepends=True)
+
+    offsets = [0]
+    for line in base_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    matcher = difflib.SequenceMatcher(None, base_lines, text_lines, autojunk=False)
+    return [
+        [offsets[i1], offsets[i2], ''.join(text_lines[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
+
+
+def apply_diff(base, operations):
+    if not operations:
+        return base
+
+    pieces = []
+    position = 0
+    for start, end, replacement in operations:
+        pieces.append(base[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(base[position:])
+    return ''.join(pieces)
+
+
+class _MissingTemplate(LookupError):
+    pass
+
+
+@lru_cache(maxsize=256)
+def _base_template(contract_id, version):
+    row = ContractVersion.query.filter_by(contract_id=contract_id, version=version).first()
+    if row is None:
+        # Exceção não entra no lru_cache: a versão pode ser gravada depois
+        raise _MissingTemplate(contract_id, version)
+    return row.content
+
+
+def base_template(contract_id, version):
+    """Texto de uma versão do modelo (imutável, por isso pode ficar em cache)"""
+    try:
+        return _base_template(contract_id, version)
+    except _MissingTemplate:
+        return None
+
+
+def load_overlay(user_contract):
+    values = json.loads(user_contract.field_values) if user_contract.field_values else {}
+    diff = json.loads(user_contract.content_diff) if user_contract.content_diff else []
+    return values, diff
+
+
+@lru_cache(maxsize=512)
+def _compiled_overlay(contract_id, version, content_diff):
+    base = _base_template(contract_id, version)
+    diff = json.loads(content_diff) if content_diff else []
+    return compile_template(apply_diff(base, diff))
+
+
+def user_template(user_contract):
+    """Modelo compilado (versão base + edições livres) de um contrato adquirido"""
+    if user_contract.template_version is not None:
+        try:
+            return _compiled_overlay(
+                user_contract.contract_id,
+                user_contract.template_version,
+                user_contract.content_diff or ''
+            )
+        except _MissingTemplate:
+            pass
+
+    # Registro legado com cópia integral do conteúdo
+    return compile_template(user_contract.customized_content or '')
+
+
+def render_user_contract(user_contract, extra_values=None):
+    """Monta o texto personalizado de um contrato adquirido"""
+    values, _ = load_overlay(user_contract)
+    if extra_values:
+        values.update(extra_values)
+    return user_template(user_contract).render(values)
+
+
+def _render_line(line, values):
+    return PLACEHOLDER.sub(lambda m: values.get(m.group(1), m.group(0)), line)
+
+
+def unrender(template, values, text):
+    """
+    Volta o texto editado pelo usuário (já com os campos preenchidos) para o
+    formato do modelo: linhas iguais à linha renderizada do modelo voltam a
+    ter os campos ([NOME_LOCADOR]); só as linhas editadas ficam como texto
+    livre. Assim os valores não ficam gravados no diff.
+    """
+    template_lines = template.splitlines(keepends=True)
+    rendered_lines = [_render_line(line, values) for line in template_lines]
+    text_lines = text.splitlines(keepends=True)
+
+    matcher = difflib.SequenceMatcher(None, rendered_lines, text_lines, autojunk=False)
+    pieces = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        pieces.extend(template_lines[i1:i2] if tag == 'equal' else text_lines[j1:j2])
+    return ''.join(pieces)
+
+
+def set_overlay(user_contract, contract, field_values=None, customized_content=None):
+    """Atualiza valores de campos e/ou edições livres de um contrato adquirido"""
+    if user_contract.template_version is None:
+        # Converte o registro legado: a cópia integral vira diff sobre a versão atual
+        if customized_content is None:
+            customized_content = user_contract.customized_content
+        user_contract.template_version = contract.version
+
+    base = base_template(user_contract.contract_id, user_contract.template_version)
+    values, diff = load_overlay(user_contract)
+
+    if field_values is not None:
+        for name, value in field_values.items():
+            if value is None:
+                values.pop(name, None)
+            else:
+                values[name] = str(value)
+
+    if customized_content is not None:
+        # Compara com o texto que o usuário via (modelo + edições anteriores, renderizado)
+        current = apply_diff(base, diff)
+        diff = compute_diff(base, unrender(current, values, customized_content))
+
+    user_contract.field_values = json.dumps(values, ensure_ascii=False) if values else None
+    user_contract.content_diff = json.dumps(diff, ensure_ascii=False) if diff else None
+    user_contract.customized_content = None
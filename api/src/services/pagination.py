@@ -0,0 +1,95 @@
+"""
+Paginação por keyset (cursor opaco) para os endpoints de listagem.
+
+O cliente envia ?limit=N e, nas páginas seguintes, ?after=<cursor>.
+O cursor codifica os valores das colunas de ordenação do último item
+da página, então o custo de cada página independe da profundidade.
+O corpo continua sendo uma lista JSON; o próximo cursor vai nos
+cabeçalhos X-Next-Cursor e Link.
+"""
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+from flask import Response, jsonify, request
+from sqlalchemy import DateTime, tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns=None):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(values, list) or (columns is not None and len(values) != len(columns)):
+        raise InvalidCursor(cursor)
+
+    if columns is not None:
+        try:
+            values = [
+                datetime.fromisoformat(value)
+                if value is not None and isinstance(column.type, DateTime) else value
+                for column, value in zip(columns, values)
+            ]
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+
+    return values
+
+
+def page_args():
+    """Lê limit/after da query string; retorna None quando o cliente não pagina"""
+    if 'limit' not in request.args and 'after' not in request.args:
+        return None
+
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    return min(max(limit, 1), MAX_LIMIT), request.args.get('after') or None
+
+
+def keyset_page(query, columns, page, cursor_of, descending=True):
+    """Aplica ordenação por keyset e, se houver page, filtro e limite.
+
+    cursor_of extrai de uma linha os valores das colunas de ordenação.
+    Retorna (linhas, cursor da próxima página ou None).
+    """
+    order = [c.desc() if descending else c.asc() for c in columns]
+    query = query.order_by(*order)
+
+    if page is None:
+        return query.all(), None
+
+    limit, after = page
+    if after:
+        values = decode_cursor(after, columns)
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(cursor_of(rows[-1]))
+
+
+def paginated_response(items, next_cursor=None):
+    response = items if isinstance(items, Response) else jsonify(items)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
@@ -0,0 +1,135 @@
+"""
+Hash e verificação de senhas fora do thread da requisição.
+
+O PBKDF2/scrypt do Werkzeug custa centenas de milissegundos de CPU por
+chamada; feito no thread da requisição, uma rajada de logins trava os
+outros endpoints. Aqui o cálculo vai para um pool de processos de
+tamanho fixo (PASSWORD_HASH_WORKERS, iniciado com spawn). Um semáforo
+limita as chamadas em andamento a workers + PASSWORD_HASH_QUEUE; acima
+disso HasherBusy é levantada na hora e a rota responde 503.
+
+PASSWORD_HASH_METHOD escolhe o esquema e o custo, no formato do Werkzeug
+('pbkdf2:sha256:600000', 'scrypt:32768:8:1'...). Hashes gravados com
+outro método são refeitos no próximo login bem-sucedido (needs_rehash).
+Com PASSWORD_HASH_WORKERS=0 o cálculo é feito no próprio thread, ainda
+com o limite do semáforo.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'pbkdf2:sha256:600000'
+
+
+class HasherBusy(Exception):
+    """Pool de hash saturado: tentar mais tarde"""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method)
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def method_prefix(method):
+    """Prefixo que o Werkzeug grava para o método ('pbkdf2' -> 'pbkdf2:sha256:600000')"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = args if args else (2 ** 15, 8, 1)
+        return f'scrypt:{int(n)}:{int(r)}:{int(p)}'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, workers=None, queue_limit=None, timeout=30.0):
+        self.method = method
+        self.workers = workers if workers is not None else min(os.cpu_count() or 1, 4)
+        self.queue_limit = queue_limit if queue_limit is not None else self.workers * 8
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(self.workers + self.queue_limit, 1))
+        self._pool = None
+        self._lock = threading.Lock()
+        self._method_prefix = None
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD') or self.method
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue_limit = app.config.get('PASSWORD_HASH_QUEUE', self.workers * 8)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self._slots = threading.BoundedSemaphore(max(self.workers + self.queue_limit, 1))
+        self._method_prefix = None
+        app.extensions['passwords'] = self
+        atexit.register(self.shutdown)
+
+    def hash(self, password):
+        return self._call(_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._call(_verify, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True se o hash gravado não usa o método e o custo configurados"""
+        if self._method_prefix is None:
+            self._method_prefix = method_prefix(self.method)
+        return pwhash.split('$', 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: fork com os threads do servidor rodando não é seguro
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _call(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HasherBusy('Muitas requisições de autenticação em andamento')
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                slots.release()
+
+        pool = self._executor()
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException as e:
+            slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard(pool)
+            raise
+        # A vaga só é devolvida quando o worker termina: depois de um timeout
+        # o cálculo continua no processo e ainda ocupa o pool
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HasherBusy('Tempo esgotado aguardando o cálculo do hash da senha')
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+
+    def _discard(self, pool):
+        # Um worker morreu: o próximo pedido cria um pool novo
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+
+passwords = PasswordHasher()
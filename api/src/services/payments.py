@@ -0,0 +1,74 @@
+"""
+Efeitos de um pagamento aprovado.
+
+Usado pelas rotas que aprovam na hora (PIX e cartão pelo gateway,
+simulação), pela renovação automática e pelo webhook de confirmação PIX,
+que aprova em lote: marca o pagamento e, no plano premium, ativa o
+premium e cria a assinatura (ou, na renovação, estende a assinatura
+renovada). Nada é gravado aqui; o commit é de quem chama.
+"""
+from datetime import datetime, timedelta
+from src.models.payment import Subscription, db
+
+PREMIUM_PLAN_DAYS = 30
+RENEWAL_TRANSACTION_PREFIX = 'TXN_RENEW_'
+
+
+def renewal_transaction_id(subscription):
+    """Fixo por período: novas tentativas não cobram duas vezes no PSP"""
+    return f"{RENEWAL_TRANSACTION_PREFIX}{subscription.id}_{subscription.end_date.strftime('%Y%m%d%H%M%S')}"
+
+
+def renewed_subscription(payment):
+    """Assinatura renovada pelo pagamento, ou None se não for uma renovação"""
+    if payment.service_type != 'premium_plan':
+        return None
+    if not (payment.transaction_id or '').startswith(RENEWAL_TRANSACTION_PREFIX):
+        return None
+    return db.session.get(Subscription, payment.reference_id)
+
+
+def activate_premium(user, amount, now=None):
+    now = now or datetime.utcnow()
+    user.is_premium = True
+    subscription = Subscription(
+        user_id=user.id,
+        plan_type='premium',
+        monthly_amount=amount,
+        start_date=now,
+        end_date=now + timedelta(days=PREMIUM_PLAN_DAYS)
+    )
+    db.session.add(subscription)
+    return subscription
+
+
+def approve_payment(payment, user, pix_transaction_id=None, now=None):
+    """Marca o pagamento como aprovado e aplica o que ele comprou"""
+    now = now or datetime.utcnow()
+    payment.payment_status = 'approved'
+    payment.paid_at = now
+    if pix_transaction_id:
+        payment.pix_transaction_id = pix_transaction_id
+
+    if payment.service_type != 'premium_plan':
+        return
+
+    subscription = renewed_subscription(payment)
+    if subscription is None:
+        activate_premium(user, payment.amount, now)
+        return
+
+    subscription.end_date = subscription.end_date + timedelta(days=PREMIUM_PLAN_DAYS)
+    if subscription.status == 'expired':
+        # PIX liquidado depois que o varredor expirou a assinatura
+        subscription.status = 'active'
+    user.is_premium = True
+
+
+def reject_payment(payment):
+    """Marca o pagamento como recusado; renovação recusada desliga a renovação automática"""
+    payment.payment_status = 'rejected'
+    subscription = renewed_subscription(payment)
+    if subscription is not None:
+        # Sem nova tentativa: o varredor expira a assinatura no vencimento
+        subscription.auto_renew = False
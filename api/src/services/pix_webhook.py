@@ -0,0 +1,213 @@
+"""
+Ingestão das confirmações de liquidação PIX (webhook do PSP).
+
+POST /payment/pix/webhook só valida e enfileira as confirmações numa fila
+em memória, respondendo 202 na hora; um thread as aplica em grupos de até
+PIX_WEBHOOK_GROUP_SIZE, um commit por grupo. Cada grupo busca os
+pagamentos com uma consulta pelos índices de transaction_id (txid) e
+pix_transaction_id (endToEndId) e aprova os pendentes com
+approve_payment (premium e assinatura incluídos, inclusive renovações
+automáticas que ficaram pendentes) ou os recusa com reject_payment.
+
+Confirmações repetidas são ignoradas (o pagamento já não está pendente).
+Se um grupo falhar, as confirmações dele são aplicadas uma a uma, para
+isolar a que causou o erro. A fila fica só em memória: o PSP reenvia o
+que não for confirmado, e a fila é esvaziada no encerramento do processo.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+from sqlalchemy import or_
+from src.models.payment import Payment, db
+from src.models.user import User
+from src.services.payments import approve_payment, reject_payment
+
+logger = logging.getLogger(__name__)
+
+Confirmation = namedtuple('Confirmation', 'txid end_to_end_id amount status paid_at')
+
+SETTLED_STATUSES = ('approved', 'rejected')
+
+
+class InvalidConfirmation(ValueError):
+    pass
+
+
+def parse_confirmation(item):
+    """Normaliza uma confirmação no formato do PSP (txid/endToEndId/valor/horario)"""
+    if not isinstance(item, dict):
+        raise InvalidConfirmation('Confirmação deve ser um objeto')
+
+    txid = item.get('txid') or item.get('transaction_id')
+    end_to_end_id = item.get('endToEndId') or item.get('pix_transaction_id')
+    if not txid and not end_to_end_id:
+        raise InvalidConfirmation('txid ou endToEndId é obrigatório')
+
+    status = item.get('status', 'approved')
+    if status not in SETTLED_STATUSES:
+        raise InvalidConfirmation(f'status inválido: {status}')
+
+    amount = item.get('valor', item.get('amount'))
+    try:
+        amount = float(amount) if amount is not None else None
+    except (TypeError, ValueError):
+        raise InvalidConfirmation('valor inválido')
+
+    paid_at = item.get('horario')
+    try:
+        paid_at = datetime.fromisoformat(paid_at.replace('Z', '+00:00')).replace(tzinfo=None) if paid_at else None
+    except (AttributeError, ValueError):
+        raise InvalidConfirmation('horario inválido')
+
+    return Confirmation(txid, end_to_end_id, amount, status, paid_at)
+
+
+class PixConfirmationQueue:
+    def __init__(self, group_size=500, max_delay=0.05, max_size=100000):
+        self.group_size = group_size
+        self.max_delay = max_delay
+        self.stats = Counter()
+        self._app = None
+        self._queue = queue.Queue(max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app):
+        self._app = app
+        self.group_size = app.config.get('PIX_WEBHOOK_GROUP_SIZE', self.group_size)
+        self.max_delay = app.config.get('PIX_WEBHOOK_MAX_DELAY', self.max_delay)
+        self._queue = queue.Queue(app.config.get('PIX_WEBHOOK_QUEUE_SIZE', self._queue.maxsize))
+        app.extensions['pix_webhook'] = self
+        atexit.register(self.drain)
+
+    def put_many(self, confirmations):
+        """Enfileira as confirmações; devolve quantas couberam na fila"""
+        self.ensure_started()
+        accepted = 0
+        for confirmation in confirmations:
+            try:
+                self._queue.put_nowait(confirmation)
+            except queue.Full:
+                break
+            accepted += 1
+        self._count({'received': accepted})
+        return accepted
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats.update(outcome)
+
+    def ensure_started(self):
+        if self._thread is not None or self._app is None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='pix-webhook', daemon=True)
+            self._thread.start()
+
+    def join(self):
+        """Espera até que tudo o que foi enfileirado tenha sido aplicado"""
+        self._queue.join()
+
+    def drain(self):
+        """Aplica no thread atual o que ainda estiver na fila (encerramento)"""
+        if self._app is None:
+            return
+        with self._app.app_context():
+            while True:
+                group = self._take(block=False)
+                if not group:
+                    return
+                self._apply_group(group)
+
+    def _take(self, block=True):
+        try:
+            group = [self._queue.get(block=block, timeout=1.0 if block else None)]
+        except queue.Empty:
+            return []
+        # Junta o que chegar até o grupo encher ou max_delay passar
+        deadline = time.monotonic() + self.max_delay
+        while len(group) < self.group_size:
+            try:
+                group.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return group
+
+    def _run(self):
+        while True:
+            group = self._take()
+            if not group:
+                continue
+            with self._app.app_context():
+                self._apply_group(group)
+
+    def _apply_group(self, group):
+        try:
+            try:
+                self.apply(group)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Falha ao aplicar grupo de %s confirmações PIX; aplicando uma a uma', len(group))
+                for confirmation in group:
+                    try:
+                        self.apply([confirmation])
+                    except Exception:
+                        db.session.rollback()
+                        self._count({'failed': 1})
+                        logger.exception('Falha ao aplicar confirmação PIX %s', confirmation)
+            finally:
+                db.session.remove()
+        finally:
+            for _ in group:
+                self._queue.task_done()
+
+    def apply(self, confirmations):
+        """Aplica as confirmações numa única transação"""
+        txids = {c.txid for c in confirmations if c.txid}
+        end_to_end_ids = {c.end_to_end_id for c in confirmations if c.end_to_end_id}
+        payments = Payment.query.filter(
+            Payment.payment_method == 'pix',
+            or_(Payment.transaction_id.in_(txids), Payment.pix_transaction_id.in_(end_to_end_ids))
+        ).all()
+        by_txid = {p.transaction_id: p for p in payments}
+        by_end_to_end_id = {p.pix_transaction_id: p for p in payments if p.pix_transaction_id}
+
+        # Usuários dos planos premium carregados de uma vez
+        user_ids = {p.user_id for p in payments if p.service_type == 'premium_plan'}
+        users = {u.id: u for u in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+
+        outcome = Counter()
+        for confirmation in confirmations:
+            payment = by_txid.get(confirmation.txid) or by_end_to_end_id.get(confirmation.end_to_end_id)
+            if payment is None:
+                outcome['unmatched'] += 1
+                logger.warning('Confirmação PIX sem pagamento: %s', confirmation)
+                continue
+            if payment.payment_status != 'pending':
+                outcome['duplicate'] += 1
+                continue
+            if confirmation.amount is not None and abs(confirmation.amount - payment.amount) >= 0.005:
+                outcome['amount_mismatch'] += 1
+                logger.warning('Valor divergente na confirmação PIX de %s: %s != %s',
+                               payment.transaction_id, confirmation.amount, payment.amount)
+                continue
+
+            if confirmation.status == 'approved':
+                approve_payment(payment, users.get(payment.user_id), confirmation.end_to_end_id,
+                                confirmation.paid_at)
+            else:
+                reject_payment(payment)
+            outcome[confirmation.status] += 1
+
+        db.session.commit()
+        self._count(outcome)
+        return outcome
+
+
+pix_webhook = PixConfirmationQueue()
@@ -0,0 +1,171 @@
+"""
+Contadores de popularidade com escrita adiada (write-behind).
+
+Cada compra incrementa um contador em memória em vez de atualizar a
+linha do contrato dentro da transação. Os incrementos acumulados são
+gravados em lote, com um UPDATE ... SET popularity_score =
+popularity_score + ? por contrato, quando passam do limite configurado
+ou quando o timer dispara. O ranking de /popular é calculado a partir
+do snapshot do catálogo somado aos incrementos que ele ainda não reflete
+(gravados depois da montagem ou ainda não gravados).
+
+O snapshot (e o ETag das listagens) só é invalidado quando um lote muda
+a ordem por popularidade; caso contrário o lote fica em _flushed até a
+próxima reconstrução. O top-K de /popular é mantido junto com as
+pontuações atuais e atualizado no lugar a cada incremento; só é
+recalculado quando o snapshot muda.
+"""
+import atexit
+import heapq
+import logging
+import threading
+from collections import Counter
+from sqlalchemy import bindparam
+from src.models.contract import Contract, db
+from src.services.catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+
+class PopularityCounter:
+    def __init__(self, flush_interval=5.0, flush_threshold=50):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        self._inflight = Counter()
+        self._flushed = Counter()  # gravados, mas ainda fora do snapshot _flushed_version
+        self._flushed_version = None
+        self._timer = None
+        self._top = None  # (versão do snapshot, k, pontuações atuais, [(contract_id, score)])
+
+    def init_app(self, app):
+        self._app = app
+        self.flush_interval = app.config.get('POPULARITY_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_threshold = app.config.get('POPULARITY_FLUSH_THRESHOLD', self.flush_threshold)
+        app.extensions['popularity'] = self
+        atexit.register(self.flush)
+
+    def increment(self, contract_id, amount=1):
+        with self._lock:
+            self._pending[contract_id] += amount
+            self._update_top(contract_id, amount)
+            should_flush = sum(self._pending.values()) >= self.flush_threshold
+            if not should_flush and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Grava os incrementos pendentes em um único lote"""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                batch, self._pending = self._pending, Counter()
+                self._inflight = batch
+
+            if not batch or self._app is None:
+                return
+
+            table = Contract.__table__
+            # Popularidade não é edição do contrato: updated_at fica como está
+            statement = table.update().where(
+                table.c.id == bindparam('contract_id')
+            ).values(
+                popularity_score=table.c.popularity_score + bindparam('delta'),
+                updated_at=table.c.updated_at
+            )
+
+            try:
+                with self._app.app_context():
+                    snapshot = catalog.get()
+                    db.session.execute(statement, [
+                        {'contract_id': contract_id, 'delta': delta}
+                        for contract_id, delta in batch.items()
+                    ])
+                    db.session.commit()
+            except Exception:
+                logger.exception('Falha ao gravar contadores de popularidade')
+                with self._lock:
+                    self._pending.update(batch)
+                    self._inflight = Counter()
+                return
+
+            flushed = self._flushed if self._flushed_version == snapshot.version else Counter()
+            # Snapshot invalidado durante o lote pode ter sido montado antes do commit
+            rebuild = catalog.version != snapshot.version or (
+                _ranking(snapshot.scores, flushed) != _ranking(snapshot.scores, flushed + batch)
+            )
+            if rebuild:
+                catalog.invalidate()
+            with self._lock:
+                if rebuild:
+                    self._flushed, self._flushed_version = Counter(), None
+                else:
+                    self._flushed, self._flushed_version = flushed + batch, snapshot.version
+                self._inflight = Counter()
+                if rebuild:
+                    self._top = None
+
+    def scores(self, snapshot):
+        """Pontuação atual dos contratos ativos: snapshot + incrementos que ele não reflete"""
+        with self._lock:
+            return self._scores(snapshot)
+
+    def _scores(self, snapshot):
+        unsaved = self._pending + self._inflight
+        if self._flushed_version == snapshot.version:
+            unsaved += self._flushed
+
+        return {
+            contract_id: score + unsaved.get(contract_id, 0)
+            for contract_id, score in snapshot.scores.items()
+        }
+
+    def top(self, k=10):
+        """Lista [(contract_id, score)] dos k contratos mais populares"""
+        snapshot = catalog.get()
+        with self._lock:
+            cached = self._top
+            if cached is None or cached[0] != snapshot.version or cached[1] != k:
+                scores = self._scores(snapshot)
+                cached = self._top = (snapshot.version, k, scores, _largest(k, scores.items()))
+            return cached[3]
+
+    def _update_top(self, contract_id, amount):
+        # Chamado com _lock: só o contrato incrementado pode entrar ou subir no top-K
+        cached = self._top
+        if cached is None or contract_id not in cached[2]:
+            return
+        if amount < 0:
+            self._top = None
+            return
+
+        version, k, scores, top = cached
+        score = scores[contract_id] = scores[contract_id] + amount
+        if len(top) == k and contract_id not in dict(top) and (score, -contract_id) < (top[-1][1], -top[-1][0]):
+            return
+        entries = [item for item in top if item[0] != contract_id]
+        entries.append((contract_id, score))
+        self._top = (version, k, scores, _largest(k, entries))
+
+
+def _largest(k, items):
+    return heapq.nlargest(k, items, key=lambda item: (item[1], -item[0]))
+
+
+def _ranking(scores, increments):
+    """Ordem das listagens do catálogo: popularidade decrescente, depois id"""
+    return sorted(scores, key=lambda contract_id: (
+        -(scores[contract_id] + increments.get(contract_id, 0)), contract_id
+    ))
+
+
+popularity = PopularityCounter()
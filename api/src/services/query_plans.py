@@ -0,0 +1,160 @@
+"""
+Verificação dos planos de consulta (EXPLAIN QUERY PLAN) das rotas.
+
+ROUTE_QUERIES reproduz as consultas quentes das rotas, com os mesmos
+filtros e ordenações. check_query_plans() pede ao SQLite o plano de cada
+uma e aponta as que varrem a tabela inteira ou ordenam em uma B-tree
+temporária em vez de usar um índice. Rodar com `flask check-query-plans`
+depois de mudar consultas ou índices.
+"""
+from datetime import datetime
+from sqlalchemy import func, or_, select, tuple_
+from src.models.user import User, db
+from src.models.infraction import OPEN_STATUSES, Infraction, InfractionSummary
+from src.models.contract import Contract, ContractVersion, UserContract
+from src.models.payment import Payment, PaymentDailyRollup, Subscription
+from src.models.job import Job
+from src.models.idempotency import IdempotencyRecord
+
+USER_ID = 1
+NOW = datetime(2024, 1, 1)
+
+
+def _keyset(model, columns, descending=True):
+    order = [c.desc() if descending else c.asc() for c in columns]
+    key = tuple_(*columns)
+    after = tuple_(NOW, 1) if len(columns) == 2 else tuple_(1)
+    return select(model).where(
+        model.user_id == USER_ID if hasattr(model, 'user_id') else True,
+        key < after if descending else key > after
+    ).order_by(*order).limit(51)
+
+
+# (nome, consulta, varredura permitida?)
+ROUTE_QUERIES = [
+    ('GET /infractions (página)',
+     _keyset(Infraction, [Infraction.created_at, Infraction.id]), False),
+    ('GET /infractions (versão)',
+     select(func.count(Infraction.id), func.max(Infraction.id), func.max(Infraction.updated_at))
+     .where(Infraction.user_id == USER_ID), False),
+    ('GET /infractions/summary',
+     select(InfractionSummary).where(InfractionSummary.user_id == USER_ID), False),
+    ('GET /infractions/<id>',
+     select(Infraction).where(Infraction.id == 1, Infraction.user_id == USER_ID), False),
+    ('POST /infractions (duplicata)',
+     select(Infraction).where(Infraction.notification_number == 'X', Infraction.user_id == USER_ID), False),
+    ('POST /infractions/import (duplicatas do bloco)',
+     select(Infraction.notification_number).where(
+         Infraction.user_id == USER_ID, Infraction.notification_number.in_(['X', 'Y'])), False),
+    ('GET /deadlines',
+     select(Infraction).where(
+         Infraction.user_id == USER_ID, Infraction.contest_deadline >= NOW,
+         Infraction.contest_deadline <= NOW, Infraction.status.in_(OPEN_STATUSES)
+     ).order_by(Infraction.contest_deadline), False),
+    ('Agendador de prazos (janela)',
+     select(Infraction.id, Infraction.contest_deadline).where(
+         Infraction.contest_deadline >= NOW, Infraction.contest_deadline <= NOW,
+         Infraction.status.in_(OPEN_STATUSES), Infraction.deadline_notified_at.is_(None)
+     ), False),
+    ('GET /vehicles',
+     select(Infraction.plate_normalized, func.count(Infraction.id), func.sum(Infraction.value))
+     .where(Infraction.user_id == USER_ID, Infraction.plate_normalized > 'A')
+     .group_by(Infraction.plate_normalized).order_by(Infraction.plate_normalized).limit(51), False),
+    ('GET /vehicles/<placa>/infractions',
+     select(Infraction).where(
+         Infraction.user_id == USER_ID, Infraction.plate_normalized == 'ABC1C34',
+         tuple_(Infraction.created_at, Infraction.id) < tuple_(NOW, 1)
+     ).order_by(Infraction.created_at.desc(), Infraction.id.desc()).limit(51), False),
+    ('GET /payments (página)',
+     _keyset(Payment, [Payment.created_at, Payment.id]), False),
+    ('GET /payments (versão)',
+     select(func.count(Payment.id), func.max(Payment.id), func.max(Payment.updated_at))
+     .where(Payment.user_id == USER_ID), False),
+    ('GET /payments/<id>',
+     select(Payment).where(Payment.id == 1, Payment.user_id == USER_ID), False),
+    ('POST /payment/pix/webhook (pagamentos do grupo)',
+     select(Payment).where(Payment.payment_method == 'pix', or_(
+         Payment.transaction_id.in_(['X', 'Y']), Payment.pix_transaction_id.in_(['X', 'Y']))), False),
+    ('GET /reports/payments',
+     select(PaymentDailyRollup.day, func.sum(PaymentDailyRollup.payment_count))
+     .where(PaymentDailyRollup.day >= NOW.date(), PaymentDailyRollup.day <= NOW.date())
+     .group_by(PaymentDailyRollup.day).order_by(PaymentDailyRollup.day), False),
+    ('GET /reports/payments/export.csv (bloco)',
+     select(Payment.id).where(
+         Payment.created_at >= NOW, Payment.created_at < NOW,
+         tuple_(Payment.created_at, Payment.id) > tuple_(NOW, 1)
+     ).order_by(Payment.created_at, Payment.id).limit(5000), False),
+    ('GET /subscription',
+     select(Subscription).where(Subscription.user_id == USER_ID, Subscription.status == 'active'), False),
+    ('Direitos do usuário (fim da assinatura vigente)',
+     select(func.max(Subscription.end_date)).where(
+         Subscription.user_id == USER_ID, Subscription.status.in_(['active', 'cancelled'])), False),
+    ('Varredura de assinaturas (vencidas)',
+     select(Subscription.id).where(
+         Subscription.status.in_(['active', 'cancelled']), Subscription.end_date < NOW), False),
+    ('Varredura de assinaturas (renovações)',
+     select(Subscription.id, Subscription.end_date).where(
+         Subscription.status == 'active', Subscription.end_date <= NOW,
+         Subscription.auto_renew.is_(True)), False),
+    ('GET /my-contracts (página)',
+     _keyset(UserContract, [UserContract.purchase_date, UserContract.id]), False),
+    ('GET /my-contracts (versão)',
+     select(func.count(UserContract.id), func.max(UserContract.id), func.max(UserContract.updated_at))
+     .where(UserContract.user_id == USER_ID), False),
+    ('POST /contracts/<id>/purchase (já adquirido)',
+     select(UserContract).where(UserContract.user_id == USER_ID, UserContract.contract_id == 1), False),
+    ('GET /my-contracts/<id>',
+     select(UserContract).where(UserContract.id == 1, UserContract.user_id == USER_ID), False),
+    ('Modelo versionado do contrato',
+     select(ContractVersion).where(ContractVersion.contract_id == 1, ContractVersion.version == 1), False),
+    ('POST /auth/login',
+     select(User).where(or_(User.username == 'x', User.email == 'x')), False),
+    ('POST /auth/register (username)', select(User).where(User.username == 'x'), False),
+    ('POST /auth/register (email)', select(User).where(User.email == 'x'), False),
+    ('GET /users (página)',
+     select(User).where(User.id > 1).order_by(User.id).limit(51), False),
+    ('GET /jobs/<id>',
+     select(Job).where(Job.id == 'x', Job.user_id == USER_ID), False),
+    ('Fila de tarefas (próxima)',
+     select(Job.id).where(Job.status == 'queued', Job.run_after <= NOW)
+     .order_by(Job.run_after).limit(1), False),
+    ('Fila de tarefas (deduplicação)',
+     select(Job).where(Job.dedupe_key == 'x', Job.status.in_(['queued', 'running'])), False),
+    ('Idempotency-Key (reserva/resposta gravada)',
+     select(IdempotencyRecord).where(IdempotencyRecord.user_id == USER_ID, IdempotencyRecord.key == 'x'), False),
+    ('Idempotency-Key (expiração)',
+     select(IdempotencyRecord.id).where(IdempotencyRecord.expires_at < NOW), False),
+    ('Contratos por categoria',
+     select(Contract).where(Contract.is_active.is_(True), Contract.category == 'civil')
+     .order_by(Contract.popularity_score.desc()), False),
+    # O snapshot do catálogo carrega a tabela inteira de propósito
+    ('Snapshot do catálogo', select(Contract).order_by(Contract.id), True),
+]
+
+
+def explain(statement):
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+    return [row[-1] for row in rows]
+
+
+def plan_problems(plan):
+    """Passos do plano que indicam varredura completa ou ordenação sem índice"""
+    problems = []
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'USING' not in detail and 'CONSTANT ROW' not in detail:
+            problems.append(detail)
+        elif detail.startswith('USE TEMP B-TREE'):
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans(queries=ROUTE_QUERIES):
+    """Lista de (nome, plano, problemas) para cada consulta"""
+    results = []
+    for name, statement, allow_scan in queries:
+        plan = explain(statement)
+        results.append((name, plan, [] if allow_scan else plan_problems(plan)))
+    return results
@@ -0,0 +1,116 @@
+"""
+Busca textual no catálogo de contratos (SQLite FTS5).
+
+O índice contract_fts é uma tabela FTS5 de conteúdo externo sobre
+contract(title, description, content), mantida em sincronia por
+triggers. A criação fica a cargo das migrações.
+
+O snippet é devolvido como HTML: o texto do contrato é escapado e só os
+termos encontrados ficam entre <mark></mark>.
+"""
+import html
+import re
+from sqlalchemy import text
+from src.models.user import db
+
+# Pesos do bm25 por coluna: título, descrição, conteúdo
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Delimitadores do snippet() trocados por <mark> depois do escape
+MARK_START, MARK_END = '\x02', '\x03'
+
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS contract_fts USING fts5(
+        title, description, content,
+        content='contract', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS contract_fts_ai AFTER INSERT ON contract BEGIN
+        INSERT INTO contract_fts(rowid, title, description, content)
+        VALUES (new.id, new.title, new.description, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contract_fts_ad AFTER DELETE ON contract BEGIN
+        INSERT INTO contract_fts(contract_fts, rowid, title, description, content)
+        VALUES ('delete', old.id, old.title, old.description, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS contract_fts_au AFTER UPDATE OF title, description, content ON contract BEGIN
+        INSERT INTO contract_fts(contract_fts, rowid, title, description, content)
+        VALUES ('delete', old.id, old.title, old.description, old.content);
+        INSERT INTO contract_fts(rowid, title, description, content)
+        VALUES (new.id, new.title, new.description, new.content);
+    END""",
+]
+
+
+def create_search_index(conn):
+    for ddl in SEARCH_INDEX_DDL:
+        conn.exec_driver_sql(ddl)
+    conn.exec_driver_sql("INSERT INTO contract_fts(contract_fts) VALUES ('rebuild')")
+
+
+def build_match_expression(query):
+    """Converte o texto livre em uma expressão MATCH segura (prefixo por termo)"""
+    terms = re.findall(r'\w+', query or '')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def render_snippet(snippet):
+    """Escapa o trecho do contrato e marca os termos encontrados"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def search_contracts(query, category=None, limit=20):
+    """Retorna resumos ranqueados por bm25 e a contagem de resultados por categoria"""
+    match = build_match_expression(query)
+    if not match:
+        return None
+
+    params = {'match': match, 'limit': limit, 'mark_start': MARK_START, 'mark_end': MARK_END}
+    category_filter = ''
+    if category:
+        category_filter = 'AND c.category = :category'
+        params['category'] = category
+
+    rows = db.session.execute(text(f"""
+        SELECT c.id, c.title, c.category, c.description, c.price, c.is_premium,
+               c.popularity_score,
+               snippet(contract_fts, -1, :mark_start, :mark_end, '…', 16) AS snippet,
+               bm25(contract_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS rank
+        FROM contract_fts
+        JOIN contract c ON c.id = contract_fts.rowid
+        WHERE contract_fts MATCH :match AND c.is_active = 1 {category_filter}
+        ORDER BY rank
+        LIMIT :limit
+    """), params).mappings().all()
+
+    facets = db.session.execute(text("""
+        SELECT c.category, COUNT(*) AS hits
+        FROM contract_fts
+        JOIN contract c ON c.id = contract_fts.rowid
+        WHERE contract_fts MATCH :match AND c.is_active = 1
+        GROUP BY c.category
+        ORDER BY hits DESC, c.category
+    """), {'match': match}).all()
+
+    facets = {name: hits for name, hits in facets}
+
+    return {
+        'results': [
+            {
+                'id': row['id'],
+                'title': row['title'],
+                'category': row['category'],
+                'description': row['description'],
+                'price': row['price'],
+                'is_premium': bool(row['is_premium']),
+                'popularity_score': row['popularity_score'],
+                'snippet': render_snippet(row['snippet']),
+                'score': round(-row['rank'], 4)
+            }
+            for row in rows
+        ],
+        'facets': facets,
+        'total': facets.get(category, 0) if category else sum(facets.values())
+    }
@@ -0,0 +1,154 @@
+"""
+Varredura periódica das assinaturas vencidas.
+
+Antes a assinatura só expirava quando o próprio usuário consultava
+GET /subscription; até lá User.is_premium continuava verdadeiro. A cada
+SUBSCRIPTION_SWEEP_INTERVAL segundos o varredor:
+
+- expira, com um único UPDATE guiado pelo índice (status, end_date), as
+  assinaturas vencidas que não serão renovadas (sem renovação automática,
+  canceladas, ou com a renovação falhando além do período de carência);
+- tira o premium, com um único UPDATE, dos donos dessas assinaturas que
+  não tenham outra ainda vigente;
+- enfileira a tarefa 'subscription.renew' para as assinaturas com
+  renovação automática que vencem dentro de SUBSCRIPTION_RENEWAL_LEAD
+  segundos (a cobrança fica no handler, em routes/payment.py).
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import exists, or_, select
+from src.models.payment import CURRENT_SUBSCRIPTION_STATUSES, Subscription, db
+from src.models.user import User
+from src.services.entitlements import entitlements
+from src.services.jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+USER_BATCH = 500
+
+
+def enqueue_renewal(subscription_id, end_date):
+    return job_queue.enqueue(
+        'subscription.renew',
+        {'subscription_id': subscription_id, 'end_date': end_date.isoformat()},
+        dedupe_key=f'subscription.renew:{subscription_id}:{end_date.isoformat()}'
+    )
+
+
+class SubscriptionSweeper:
+    def __init__(self, interval=300, renewal_lead=24 * 3600, grace=3 * 24 * 3600, enabled=True):
+        self.interval = interval
+        self.renewal_lead = timedelta(seconds=renewal_lead)
+        self.grace = timedelta(seconds=grace)
+        self.enabled = enabled
+        self._app = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self._app = app
+        self.interval = app.config.get('SUBSCRIPTION_SWEEP_INTERVAL', self.interval)
+        self.renewal_lead = timedelta(seconds=app.config.get(
+            'SUBSCRIPTION_RENEWAL_LEAD', self.renewal_lead.total_seconds()))
+        self.grace = timedelta(seconds=app.config.get(
+            'SUBSCRIPTION_RENEWAL_GRACE', self.grace.total_seconds()))
+        self.enabled = app.config.get('SUBSCRIPTION_SWEEPER', self.enabled)
+        app.extensions['subscription_sweeper'] = self
+        app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        if self._thread is not None or not self.enabled or self._app is None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='subscription-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sweep(self, now=None):
+        """Uma passada completa; devolve (donos de assinaturas expiradas, usuários sem premium, renovações enfileiradas)"""
+        now = now or datetime.utcnow()
+        expired_users = self.expire(now)
+        demoted = self.demote(expired_users, now)
+        renewals = self.enqueue_renewals(now)
+        return len(expired_users), demoted, renewals
+
+    def expire(self, now):
+        table = Subscription.__table__
+        user_ids = db.session.execute(
+            table.update().where(
+                table.c.status.in_(CURRENT_SUBSCRIPTION_STATUSES),
+                table.c.end_date < now,
+                or_(
+                    table.c.status == 'cancelled',
+                    table.c.auto_renew.is_not(True),
+                    table.c.end_date < now - self.grace
+                )
+            ).values(status='expired').returning(table.c.user_id)
+        ).scalars().all()
+        db.session.commit()
+        # UPDATE em lote não passa pelos eventos do ORM
+        user_ids = sorted(set(user_ids))
+        entitlements.invalidate(*user_ids)
+        return user_ids
+
+    def demote(self, user_ids, now):
+        users = User.__table__
+        subscriptions = Subscription.__table__
+        still_current = exists().where(
+            subscriptions.c.user_id == users.c.id,
+            subscriptions.c.status.in_(CURRENT_SUBSCRIPTION_STATUSES),
+            subscriptions.c.end_date >= now
+        )
+        demoted = 0
+        for start in range(0, len(user_ids), USER_BATCH):
+            result = db.session.execute(
+                users.update().where(
+                    users.c.id.in_(user_ids[start:start + USER_BATCH]),
+                    users.c.is_premium.is_(True),
+                    ~still_current
+                ).values(is_premium=False)
+            )
+            demoted += result.rowcount
+        db.session.commit()
+        return demoted
+
+    def enqueue_renewals(self, now):
+        rows = db.session.execute(
+            select(Subscription.id, Subscription.end_date).where(
+                Subscription.status == 'active',
+                Subscription.end_date <= now + self.renewal_lead,
+                Subscription.auto_renew.is_(True)
+            )
+        ).all()
+        for subscription_id, end_date in rows:
+            enqueue_renewal(subscription_id, end_date)
+        db.session.commit()
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._app.app_context():
+                try:
+                    expired, demoted, renewals = self.sweep()
+                    if expired or renewals:
+                        logger.info('Assinaturas: %s expiradas, %s usuários sem premium, '
+                                    '%s renovações enfileiradas', expired, demoted, renewals)
+                except Exception:
+                    logger.exception('Falha na varredura de assinaturas')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            self._stop.wait(self.interval)
+
+
+subscription_sweeper = SubscriptionSweeper()
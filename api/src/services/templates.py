@@ -0,0 +1,56 @@
+"""
+Motor de modelos com campos no formato [NOME_DO_CAMPO].
+
+Cada texto é compilado uma única vez em uma lista de segmentos (trechos
+literais intercalados com campos). Preencher o modelo é copiar a lista,
+trocar os campos que têm valor e fazer um único join.
+"""
+import re
+from functools import lru_cache
+
+PLACEHOLDER = re.compile(r'\[([A-Z0-9_ÀÁÂÃÇÉÊÍÓÔÕÚ]+)\]')
+
+
+class CompiledTemplate:
+    __slots__ = ('segments', 'slots', 'fields')
+
+    def __init__(self, segments, slots):
+        self.segments = segments  # trechos literais; campos mantêm o texto "[NOME]"
+        self.slots = slots        # [(posição em segments, nome do campo)]
+        self.fields = list(dict.fromkeys(name for _, name in slots))
+
+    def render(self, values):
+        if not values:
+            return ''.join(self.segments)
+
+        parts = list(self.segments)
+        for index, name in self.slots:
+            value = values.get(name)
+            if value is not None:
+                parts[index] = str(value)
+        return ''.join(parts)
+
+    def missing_fields(self, values):
+        return [name for name in self.fields if values.get(name) is None]
+
+    def occurrences(self):
+        counts = dict.fromkeys(self.fields, 0)
+        for _, name in self.slots:
+            counts[name] += 1
+        return counts
+
+
+@lru_cache(maxsize=512)
+def compile_template(text):
+    segments = []
+    slots = []
+    position = 0
+    for match in PLACEHOLDER.finditer(text):
+        if match.start() > position:
+            segments.append(text[position:match.start()])
+        slots.append((len(segments), match.group(1)))
+        segments.append(match.group(0))
+        position = match.end()
+    if position < len(text):
+        segments.append(text[position:])
+    return CompiledTemplate(tuple(segments), tuple(slots))
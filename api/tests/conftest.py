@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from src.main import create_app, init_database  # noqa: E402
+
+PIX_WEBHOOK_SECRET = 'segredo-de-teste'
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+        'CONTEST_DOCUMENTS_DIR': str(tmp_path / 'documents'),
+        'PIX_WEBHOOK_SECRET': PIX_WEBHOOK_SECRET,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'PASSWORD_HASH_WORKERS': 0,
+        'JOBS_WORKERS': 0,
+        'DEADLINE_SCHEDULER': False,
+        'SUBSCRIPTION_SWEEPER': False
+    })
+    init_database(app)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    response = client.post('/api/auth/register', json={
+        'username': 'motorista', 'email': 'motorista@exemplo.com',
+        'password': '123456', 'full_name': 'Motorista de Teste'
+    })
+    assert response.status_code == 201, response.get_json()
+    return client
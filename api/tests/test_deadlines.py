@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+
+from src.models.infraction import Infraction, db
+from src.models.user import User
+from src.services.deadlines import deadline_scheduler
+
+
+def test_changed_notification_date_is_notified_again(app, client):
+    now = datetime.utcnow()
+    with app.app_context():
+        user = User.query.filter_by(username='motorista').one()
+        infraction = Infraction(
+            user_id=user.id, notification_number='N1', infraction_type='Excesso de velocidade',
+            value=130.16, date_infraction=now - timedelta(days=40), date_notification=now - timedelta(days=28),
+            vehicle_plate='ABC1234', location='Rodovia SP-280', issuing_agency='DER-SP'
+        )
+        db.session.add(infraction)
+        db.session.commit()
+
+        deadline_scheduler.refresh(now)
+        assert deadline_scheduler.fire_due(now) == 1
+        assert infraction.deadline_notified_at is not None
+
+        infraction.date_notification = now - timedelta(days=29)
+        db.session.commit()
+        assert infraction.contest_deadline == now + timedelta(days=1)
+        assert infraction.deadline_notified_at is None
+
+        # O prazo alterado é agendado no commit e avisado de novo
+        assert deadline_scheduler.fire_due(now) == 1
+        assert infraction.deadline_notified_at is not None
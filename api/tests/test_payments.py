@@ -0,0 +1,39 @@
+import hashlib
+import hmac
+import json
+
+from src.models.payment import Payment, db
+from src.models.user import User
+from src.services.pix_webhook import pix_webhook
+
+from conftest import PIX_WEBHOOK_SECRET
+
+
+def post_webhook(client, items):
+    body = json.dumps({'pix': items}).encode('utf-8')
+    signature = 'sha256=' + hmac.new(PIX_WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    response = client.post('/api/payment/pix/webhook', data=body, content_type='application/json',
+                           headers={'X-Webhook-Signature': signature})
+    assert response.status_code == 202, response.get_json()
+    pix_webhook.join()
+
+
+def test_webhook_rejection_changes_payments_etag(app, client):
+    with app.app_context():
+        user = User.query.filter_by(username='motorista').one()
+        db.session.add(Payment(user_id=user.id, amount=19.9, payment_method='pix',
+                               service_type='infraction_contest', transaction_id='TXN_TESTE_1'))
+        db.session.commit()
+
+    first = client.get('/api/payments')
+    assert first.status_code == 200
+    assert first.get_json()[0]['payment_status'] == 'pending'
+    etag = first.headers['ETag']
+    assert client.get('/api/payments', headers={'If-None-Match': etag}).status_code == 304
+
+    post_webhook(client, [{'txid': 'TXN_TESTE_1', 'status': 'rejected'}])
+
+    second = client.get('/api/payments', headers={'If-None-Match': etag})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != etag
+    assert second.get_json()[0]['payment_status'] == 'rejected'